@@ -0,0 +1,213 @@
+"""
+Runs discovery, drift detection and Slack notification end to end against
+the in-process fakes from simulator.py and reports wall time, API calls and
+peak memory:
+
+    python benchmarks/bench_end_to_end.py --stacks 2000 --regions eu-west-1,us-east-1 --throttle-rate 0.05
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'drift_detector'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import discover_stacks  # noqa: E402
+import drift_detector  # noqa: E402
+import polling  # noqa: E402
+import slack_notification  # noqa: E402
+import slack_sender  # noqa: E402
+from simulator import FakeBackend, FakeContext, SimulationConfig, WebhookSink  # noqa: E402
+
+DETECTOR_TIMEOUT = 900
+MAX_DETECTOR_INVOCATIONS = 10000
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stacks', type=int, default=500, help='stacks per region')
+    parser.add_argument('--regions', default='eu-west-1')
+    parser.add_argument('--batch-size', type=int, default=50, help='stacks per SQS message (STACK_BATCHES)')
+    parser.add_argument('--time-scale', type=float, default=0.01,
+                        help='simulated seconds per real world second')
+    parser.add_argument('--detection-time', type=float, nargs=2, default=(5, 30), metavar=('MIN', 'MAX'))
+    parser.add_argument('--resources', type=int, nargs=2, default=(5, 50), metavar=('MIN', 'MAX'))
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--shards', type=int, default=1, help='SQS message groups (DETECTOR_SHARDS)')
+    parser.add_argument('--detector-concurrency', type=int,
+                        help='detector invocations running at once, one per message group (default: --shards)')
+    parser.add_argument('--engine', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--batch-planner', choices=('count', 'weighted'), default='count')
+    parser.add_argument('--runs', type=int, default=1,
+                        help='scans to run one after another, e.g. so the weighted planner learns stack costs')
+    parser.add_argument('--inline-max-bytes', type=int,
+                        help='offload larger results to a local result store (RESULT_INLINE_MAX_BYTES)')
+    parser.add_argument('--nested-per-root', type=int, default=0, help='nested stacks generated per root stack')
+    parser.add_argument('--recheck', action='store_true',
+                        help='fix all drift after the scans and re-check the drifted resources only')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--metrics-file', help='write the EMF metrics of every handler to this file')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the handlers')
+    return parser.parse_args(argv)
+
+
+def configure(args, webhook_url):
+    scale = args.time_scale
+    os.environ.update({
+        'REGIONS': args.regions,
+        'STACK_BATCHES': str(args.batch_size),
+        'DRIFT_DETECTION_QUEUE': 'https://sqs.local/drift-detection.fifo',
+        'SLACK_NOTIFICATION_FUNCTION': 'slack-notification',
+        'SLACK_WEBHOOK': webhook_url,
+        'DETECTION_ENGINE': args.engine,
+        'BATCH_PLANNER': args.batch_planner,
+        'DETECTOR_SHARDS': str(args.shards),
+        'POLL_INITIAL_DELAY': str(polling.DEFAULT_POLL_INITIAL_DELAY * scale),
+        'POLL_MAX_DELAY': str(polling.DEFAULT_POLL_MAX_DELAY * scale),
+    })
+
+    if args.metrics_file:
+        os.environ['METRICS_FILE'] = args.metrics_file
+
+    # Every wait in the pipeline runs on the same scaled clock as the fakes.
+    polling.DEADLINE_SAFETY_MARGIN *= scale
+    drift_detector.THROTTLING_BASE_DELAY *= scale
+    drift_detector.THROTTLING_MAX_DELAY *= scale
+    slack_sender.MESSAGES_PER_SECOND /= scale
+    slack_sender.MESSAGES_BURST = max(slack_sender.MESSAGES_BURST, 1 / scale)
+
+
+def run_detectors(backend, args):
+    invocations = 0
+
+    def run_group(messages):
+        for body in messages:
+            drift_detector.lambda_handler({'Records': [{'body': body}]}, FakeContext(DETECTOR_TIMEOUT * args.time_scale))
+            notify(backend)
+
+    # FIFO semantics: one message group is processed by one invocation at a time.
+    with ThreadPoolExecutor(max_workers=args.detector_concurrency or args.shards) as executor:
+        while backend.queue:
+            groups = {}
+            while backend.queue:
+                group_id, body = backend.queue.popleft()
+                groups.setdefault(group_id, []).append(body)
+            invocations += sum(len(messages) for messages in groups.values())
+            if invocations > MAX_DETECTOR_INVOCATIONS:
+                raise RuntimeError('Detector invocations do not converge')
+            list(executor.map(run_group, groups.values()))
+
+    return invocations
+
+
+def notify(backend):
+    while backend.invocations:
+        _, payload = backend.invocations.popleft()
+        slack_notification.lambda_handler(json.loads(payload), None)
+
+
+def enqueue_rechecks(backend, drift_state_file, batch_size):
+    with open(drift_state_file) as f:
+        drifted_stacks = [
+            {'StackName': record['StackName'], 'StackId': record['StackId'], 'Region': record['StackId'].split(':')[3]}
+            for record in json.load(f).values() if json.loads(record.get('DriftedResources') or '{}')
+        ]
+
+    for region in {stack['Region'] for stack in drifted_stacks}:
+        region_stacks = [stack for stack in drifted_stacks if stack['Region'] == region]
+        for i in range(0, len(region_stacks), batch_size):
+            backend.queue.append(('recheck', json.dumps({'recheck': region_stacks[i:i + batch_size]})))
+
+
+def run(args):
+    config = SimulationConfig(
+        stacks_per_region=args.stacks, regions=tuple(args.regions.split(',')), time_scale=args.time_scale,
+        detection_time=tuple(args.detection_time), failure_rate=args.failure_rate,
+        throttle_rate=args.throttle_rate, resources=tuple(args.resources), nested_per_root=args.nested_per_root,
+        seed=args.seed)
+    backend = FakeBackend(config)
+    backend.install()
+    timings = {}
+    invocations = 0
+
+    with WebhookSink() as sink, tempfile.TemporaryDirectory() as directory:
+        configure(args, sink.url)
+        os.environ['STACK_COST_FILE'] = os.path.join(directory, 'stack_costs.json')
+        os.environ['RESULT_DIR'] = directory
+        if args.recheck:
+            # Re-checks read the drifted resources of the last report from the drift state.
+            os.environ['DRIFT_STATE_FILE'] = os.path.join(directory, 'drift_state.json')
+        if args.inline_max_bytes is not None:
+            os.environ['RESULT_INLINE_MAX_BYTES'] = str(args.inline_max_bytes)
+        tracemalloc.start()
+
+        for run_number in range(1, args.runs + 1):
+            suffix = f' #{run_number}' if args.runs > 1 else ''
+            started = time.perf_counter()
+
+            discover_stacks.lambda_handler({'full_scan': True}, None)
+            timings['discovery' + suffix] = time.perf_counter() - started
+
+            invocations += run_detectors(backend, args)
+            timings['total' + suffix] = time.perf_counter() - started
+            timings['detection' + suffix] = timings['total' + suffix] - timings['discovery' + suffix]
+
+        if args.recheck:
+            calls_before = sum(backend.calls.values())
+            backend.remediate()
+            started = time.perf_counter()
+            enqueue_rechecks(backend, os.environ['DRIFT_STATE_FILE'], args.batch_size)
+            invocations += run_detectors(backend, args)
+            timings['recheck'] = time.perf_counter() - started
+            recheck_calls = sum(backend.calls.values()) - calls_before
+
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    backend.uninstall()
+    return {
+        'stacks': args.stacks * len(config.regions),
+        'timings': timings,
+        'detector_invocations': invocations,
+        'slack_messages': len(sink.messages),
+        'api_calls': dict(sorted(backend.calls.items())),
+        'recheck_api_calls': recheck_calls if args.recheck else None,
+        'throttles': sum(backend.throttles.values()),
+        'peak_memory_mb': peak_memory / 2 ** 20
+    }
+
+
+def print_report(report, time_scale):
+    print(f"stacks:               {report['stacks']}")
+    for phase, seconds in report['timings'].items():
+        print(f"{phase + ' time:':<22}{seconds:.2f} s (~{seconds / time_scale:.0f} s unscaled)")
+    print(f"detector invocations: {report['detector_invocations']}")
+    print(f"slack messages:       {report['slack_messages']}")
+    if report['recheck_api_calls'] is not None:
+        print(f"recheck api calls:    {report['recheck_api_calls']}")
+    print(f"throttled calls:      {report['throttles']}")
+    print(f"peak memory:          {report['peak_memory_mb']:.1f} MB")
+    print('api calls:')
+    for operation, count in report['api_calls'].items():
+        print(f'  {operation:<50}{count}')
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.verbose:
+        report = run(args)
+    else:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            report = run(args)
+    print_report(report, args.time_scale)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
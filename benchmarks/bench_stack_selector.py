@@ -0,0 +1,80 @@
+"""
+Measures how fast discovery filters synthetic DescribeStacks pages with
+different selector configurations:
+
+    python benchmarks/bench_stack_selector.py --stacks 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'drift_detector'))
+
+import discover_stacks  # noqa: E402
+
+PAGE_SIZE = 100
+STATUSES = ('CREATE_COMPLETE', 'UPDATE_COMPLETE', 'UPDATE_ROLLBACK_COMPLETE', 'DELETE_FAILED', 'ROLLBACK_COMPLETE')
+CONFIGURATIONS = {
+    'default': {},
+    'regex': {'STACK_REGEX': '(prod|staging)-.*'},
+    'include names': {'STACK_INCLUDE': 'prod-*,staging-*'},
+    'include tags': {'STACK_INCLUDE': 'tag:team=payments,tag:team=search'},
+    'include + exclude': {'STACK_INCLUDE': 'prod-*,tag:team=payments', 'STACK_EXCLUDE': '*-sandbox,tag:drift-check=off'},
+}
+
+
+class PagedCFClient:
+    def __init__(self, stacks):
+        self.pages = [{'Stacks': stacks[i:i + PAGE_SIZE]} for i in range(0, len(stacks), PAGE_SIZE)]
+
+    def get_paginator(self, operation_name):
+        return self
+
+    def paginate(self):
+        return iter(self.pages)
+
+
+def make_stacks(count, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'StackName': f"{rng.choice(('prod', 'staging', 'dev'))}-service-{i}{rng.choice(('', '-sandbox'))}",
+        'StackId': f'id-{i}',
+        'StackStatus': rng.choice(STATUSES),
+        'Tags': [
+            {'Key': 'team', 'Value': rng.choice(('payments', 'search', 'platform'))},
+            {'Key': 'drift-check', 'Value': rng.choice(('on', 'off'))},
+        ]
+    } for i in range(count)]
+
+
+def run(cf_client, environment, repeat):
+    for name in ('STACK_REGEX', 'STACK_INCLUDE', 'STACK_EXCLUDE', 'STACK_STATUSES'):
+        os.environ.pop(name, None)
+    os.environ.update(environment)
+
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        selected = sum(1 for _ in discover_stacks.iter_stacks(cf_client))
+        best = min(best, time.perf_counter() - started)
+
+    return selected, best
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stacks', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    cf_client = PagedCFClient(make_stacks(args.stacks))
+    print(f"{'configuration':<20}{'selected':>10}{'total ms':>12}{'us/stack':>12}")
+    for name, environment in CONFIGURATIONS.items():
+        selected, seconds = run(cf_client, environment, args.repeat)
+        print(f'{name:<20}{selected:>10}{seconds * 1000:>12.2f}{seconds / args.stacks * 1e6:>12.3f}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
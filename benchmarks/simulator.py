@@ -0,0 +1,304 @@
+"""
+In-process stand-ins for CloudFormation, SQS and Lambda plus a local Slack
+webhook sink, so the whole pipeline runs without an AWS account.
+
+Durations are given in real world seconds and multiplied by ``time_scale``,
+so a detection that takes 20 s in CloudFormation takes 0.2 s at 0.01.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+PAGE_SIZE = 100
+DRIFTED_STATUSES = ('MODIFIED', 'DELETED')
+RESOURCE_TYPES = ('AWS::S3::Bucket', 'AWS::SQS::Queue', 'AWS::IAM::Role', 'AWS::Lambda::Function')
+
+
+class SimulationConfig:
+    def __init__(self, stacks_per_region=100, regions=('eu-west-1',), time_scale=0.01,
+                 detection_time=(5, 30), failure_rate=0.0, throttle_rate=0.0,
+                 resources=(5, 50), seconds_per_resource=0.5, drift_rate=0.1, drifted_stack_rate=0.3,
+                 client_max_attempts=5, nested_per_root=0, seed=0):
+        self.stacks_per_region = stacks_per_region
+        self.regions = regions
+        self.time_scale = time_scale
+        self.detection_time = detection_time
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.resources = resources
+        # Detections of big stacks take longer, on top of the random base time.
+        self.seconds_per_resource = seconds_per_resource
+        self.drift_rate = drift_rate
+        self.drifted_stack_rate = drifted_stack_rate
+        # botocore retries throttled calls on its own before they reach our code.
+        self.client_max_attempts = client_max_attempts
+        # Every root stack is followed by this many stacks nested in it.
+        self.nested_per_root = nested_per_root
+        self.seed = seed
+
+
+class FakeBackend:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.throttles = Counter()
+        self.stacks = {region: self._make_stacks(region) for region in config.regions}
+        self.detections = {}
+        self.queue = deque()
+        self.invocations = deque()
+
+    def _make_stacks(self, region):
+        stacks = {}
+        for i in range(self.config.stacks_per_region):
+            name = f'stack-{i:05d}'
+            drifted = self.random.random() < self.config.drifted_stack_rate
+            resources = []
+            for j in range(self.random.randint(*self.config.resources)):
+                status = 'IN_SYNC'
+                if drifted and self.random.random() < self.config.drift_rate:
+                    status = self.random.choice(DRIFTED_STATUSES)
+                resources.append({
+                    'LogicalResourceId': f'Resource{j}',
+                    'PhysicalResourceId': f'{name}-resource-{j}',
+                    'ResourceType': self.random.choice(RESOURCE_TYPES),
+                    'StackResourceDriftStatus': status
+                })
+            stack = {
+                'StackName': name,
+                'StackId': f'arn:aws:cloudformation:{region}:123456789012:stack/{name}/{uuid.UUID(int=i)}',
+                'StackStatus': 'UPDATE_COMPLETE',
+                'CreationTime': datetime(2020, 1, 1, tzinfo=timezone.utc),
+                'DriftInformation': {'StackDriftStatus': 'NOT_CHECKED'},
+                'resources': resources
+            }
+            if i % (self.config.nested_per_root + 1):
+                root = root_stack
+                stack['ParentId'] = stack['RootId'] = root['StackId']
+                root['resources'].append({
+                    'LogicalResourceId': f'NestedStack{len(root["resources"])}',
+                    'PhysicalResourceId': stack['StackId'],
+                    'ResourceType': 'AWS::CloudFormation::Stack',
+                    'StackResourceDriftStatus': 'IN_SYNC'
+                })
+            else:
+                root_stack = stack
+            stacks[name] = stack
+        return stacks
+
+    def call(self, service, operation):
+        with self.lock:
+            self.calls[f'{service}:{operation}'] += 1
+            for attempt in range(self.config.client_max_attempts):
+                throttled = self.random.random() < self.config.throttle_rate
+                if not throttled:
+                    break
+                self.throttles[f'{service}:{operation}'] += 1
+        if throttled:
+            raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, operation)
+
+    def detection_time(self, stack):
+        with self.lock:
+            seconds = self.random.uniform(*self.config.detection_time)
+        seconds += len(stack['resources']) * self.config.seconds_per_resource
+        return seconds * self.config.time_scale
+
+    def detection_fails(self):
+        with self.lock:
+            return self.random.random() < self.config.failure_rate
+
+    def install(self):
+        # Seeding the client cache hands the fakes to every get_client caller.
+        for region in self.config.regions:
+            aws_clients._clients[('cloudformation', region, None)] = (FakeCloudFormation(self, region), None)
+        aws_clients._clients[('sqs', None, None)] = (FakeSQS(self), None)
+        aws_clients._clients[('lambda', None, None)] = (FakeLambda(self), None)
+
+    def remediate(self):
+        # Reverts every drifted resource, as if the drift had been fixed.
+        for stacks in self.stacks.values():
+            for stack in stacks.values():
+                for resource in stack['resources']:
+                    resource['StackResourceDriftStatus'] = 'IN_SYNC'
+
+    def uninstall(self):
+        aws_clients._clients.clear()
+
+
+class FakePaginator:
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        while True:
+            page = self.method(**kwargs)
+            yield page
+            if not page.get('NextToken'):
+                return
+            kwargs['NextToken'] = page['NextToken']
+
+
+def public_stack(stack):
+    return {key: value for key, value in stack.items() if key != 'resources'}
+
+
+class FakeCloudFormation:
+    def __init__(self, backend, region):
+        self.backend = backend
+        self.region = region
+        self.stacks = backend.stacks[region]
+        self.stacks_by_id = {stack['StackId']: stack for stack in self.stacks.values()}
+
+    def _find_stack(self, stack_name):
+        stack = self.stacks.get(stack_name) or self.stacks_by_id.get(stack_name)
+        if stack is None:
+            raise ClientError({'Error': {'Code': 'ValidationError',
+                                         'Message': f'Stack with id {stack_name} does not exist'}}, 'DescribeStacks')
+        return stack
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(getattr(self, operation_name))
+
+    def describe_stacks(self, StackName=None, NextToken=None):
+        self.backend.call('cloudformation', 'DescribeStacks')
+        if StackName:
+            return {'Stacks': [public_stack(self._find_stack(StackName))]}
+
+        stacks = list(self.stacks.values())
+        start = int(NextToken or 0)
+        response = {'Stacks': [public_stack(stack) for stack in stacks[start:start + PAGE_SIZE]]}
+        if start + PAGE_SIZE < len(stacks):
+            response['NextToken'] = str(start + PAGE_SIZE)
+        return response
+
+    def detect_stack_drift(self, StackName):
+        self.backend.call('cloudformation', 'DetectStackDrift')
+        stack = self._find_stack(StackName)
+        detection = {
+            'stack': stack,
+            'done_at': time.monotonic() + self.backend.detection_time(stack),
+            'failed': self.backend.detection_fails()
+        }
+        detection_id = str(uuid.uuid4())
+        with self.backend.lock:
+            self.backend.detections[detection_id] = detection
+        return {'StackDriftDetectionId': detection_id}
+
+    def describe_stack_drift_detection_status(self, StackDriftDetectionId):
+        self.backend.call('cloudformation', 'DescribeStackDriftDetectionStatus')
+        detection = self.backend.detections[StackDriftDetectionId]
+        stack = detection['stack']
+        response = {'StackId': stack['StackId'], 'StackDriftDetectionId': StackDriftDetectionId}
+
+        if time.monotonic() < detection['done_at']:
+            response['DetectionStatus'] = 'DETECTION_IN_PROGRESS'
+        elif detection['failed']:
+            response['DetectionStatus'] = 'DETECTION_FAILED'
+            response['DetectionStatusReason'] = 'Simulated failure'
+        else:
+            drifted = any(r['StackResourceDriftStatus'] in DRIFTED_STATUSES for r in stack['resources'])
+            stack['DriftInformation'] = {
+                'StackDriftStatus': 'DRIFTED' if drifted else 'IN_SYNC',
+                'LastCheckTimestamp': datetime.now(timezone.utc)
+            }
+            response['DetectionStatus'] = 'DETECTION_COMPLETE'
+        return response
+
+    def detect_stack_resource_drift(self, StackName, LogicalResourceId):
+        self.backend.call('cloudformation', 'DetectStackResourceDrift')
+        stack = self._find_stack(StackName)
+        resource = next((r for r in stack['resources'] if r['LogicalResourceId'] == LogicalResourceId), None)
+        if resource is None:
+            raise ClientError({'Error': {'Code': 'ValidationError',
+                                         'Message': f'Resource {LogicalResourceId} does not exist for stack {StackName}'}},
+                              'DetectStackResourceDrift')
+
+        # Checking one resource takes about its share of a whole stack detection.
+        time.sleep(self.backend.config.seconds_per_resource * self.backend.config.time_scale)
+        return {'StackResourceDrift': dict(resource, StackId=stack['StackId'])}
+
+    def describe_stack_resource_drifts(self, StackName, StackResourceDriftStatusFilters=None, NextToken=None):
+        self.backend.call('cloudformation', 'DescribeStackResourceDrifts')
+        resources = self._find_stack(StackName)['resources']
+        if StackResourceDriftStatusFilters:
+            resources = [r for r in resources if r['StackResourceDriftStatus'] in StackResourceDriftStatusFilters]
+
+        start = int(NextToken or 0)
+        response = {'StackResourceDrifts': [dict(r, StackId=self._find_stack(StackName)['StackId'])
+                                            for r in resources[start:start + PAGE_SIZE]]}
+        if start + PAGE_SIZE < len(resources):
+            response['NextToken'] = str(start + PAGE_SIZE)
+        return response
+
+
+class FakeSQS:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def send_message(self, QueueUrl, MessageBody, MessageGroupId=None):
+        self.backend.call('sqs', 'SendMessage')
+        self.backend.queue.append((MessageGroupId, MessageBody))
+        return {'MessageId': str(uuid.uuid4())}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.backend.call('sqs', 'SendMessageBatch')
+        for entry in Entries:
+            self.backend.queue.append((entry.get('MessageGroupId'), entry['MessageBody']))
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+
+
+class FakeLambda:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.backend.call('lambda', 'Invoke')
+        self.backend.invocations.append((FunctionName, Payload))
+        return {'StatusCode': 202}
+
+
+class FakeContext:
+    def __init__(self, timeout):
+        self.deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return int(max(0, self.deadline - time.monotonic()) * 1000)
+
+
+class WebhookSink:
+    def __init__(self):
+        self.messages = []
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                sink.messages.append(json.loads(body))
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/webhook'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
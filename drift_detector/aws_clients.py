@@ -0,0 +1,110 @@
+import boto3
+import os
+import threading
+from botocore.config import Config
+from datetime import datetime, timedelta, timezone
+from metrics import instrument_client
+from rate_limits import ClientRateLimiter, DynamoDBTokenBucket, get_operation_rates
+
+CREDENTIALS_REFRESH_MARGIN = timedelta(minutes=5)
+ROLE_SESSION_NAME = 'drift-detector'
+CLOUDFORMATION_MAX_ATTEMPTS = 10
+
+_clients = {}
+_clients_lock = threading.Lock()
+_sessions = {}
+_session_locks = {}
+_sessions_lock = threading.Lock()
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_account_id(role_arn):
+    return role_arn.split(':')[4]
+
+
+def get_session(role_arn):
+    with _sessions_lock:
+        session_lock = _session_locks.setdefault(role_arn, threading.Lock())
+
+    # Assumed role credentials are reused until shortly before they expire,
+    # so messages for the same account don't pay for AssumeRole again.
+    with session_lock:
+        session, expiration = _sessions.get(role_arn, (None, None))
+        if session is None or expiration - CREDENTIALS_REFRESH_MARGIN <= datetime.now(timezone.utc):
+            credentials = get_client('sts').assume_role(
+                RoleArn=role_arn,
+                RoleSessionName=ROLE_SESSION_NAME
+            )['Credentials']
+            session = boto3.session.Session(
+                aws_access_key_id=credentials['AccessKeyId'],
+                aws_secret_access_key=credentials['SecretAccessKey'],
+                aws_session_token=credentials['SessionToken']
+            )
+            expiration = credentials['Expiration']
+            _sessions[role_arn] = (session, expiration)
+
+        return session
+
+
+def get_rate_limiter(region, role_arn):
+    # CloudFormation limits apply per account and region, so all clients for
+    # the same pair share one limiter.
+    with _rate_limiters_lock:
+        if (region, role_arn) not in _rate_limiters:
+            shared_bucket = None
+            if os.environ.get('RATE_LIMIT_TABLE'):
+                shared_bucket = DynamoDBTokenBucket(
+                    os.environ['RATE_LIMIT_TABLE'], get_client('dynamodb'), f'{role_arn or "default"}:{region or "default"}')
+            _rate_limiters[(region, role_arn)] = ClientRateLimiter(get_operation_rates(), shared_bucket)
+
+        return _rate_limiters[(region, role_arn)]
+
+
+def get_client_config(service):
+    if service == 'cloudformation':
+        # Adaptive mode adds client side rate limiting on top of retries.
+        return Config(retries={'mode': 'adaptive', 'max_attempts': CLOUDFORMATION_MAX_ATTEMPTS})
+
+    return None
+
+
+def get_client(service, region=None, role_arn=None):
+    session = get_session(role_arn) if role_arn else None
+    rate_limiter = get_rate_limiter(region, role_arn) if service == 'cloudformation' else None
+
+    # Clients are cached per container, so warm invocations skip client setup.
+    # A client is rebuilt once the credentials of its assumed role are refreshed.
+    key = (service, region, role_arn)
+    with _clients_lock:
+        client, client_session = _clients.get(key, (None, None))
+        if client is None or client_session is not session:
+            if session:
+                client = session.client(service, region_name=region, config=get_client_config(service))
+            else:
+                client = boto3.client(service, region_name=region, config=get_client_config(service))
+            instrument_client(client)
+            if rate_limiter:
+                rate_limiter.attach(client)
+            _clients[key] = (client, session)
+
+        return client
+
+
+def get_regions():
+    regions = os.environ.get('REGIONS', '').strip()
+
+    if regions == 'all':
+        # Without AllRegions, only regions enabled for the account are returned.
+        response = get_client('ec2').describe_regions()
+        return sorted(region['RegionName'] for region in response['Regions'])
+
+    # No configured regions means the default region of the Lambda only.
+    return [region.strip() for region in regions.split(',') if region.strip()] or [None]
+
+
+def get_target_account_roles():
+    roles = os.environ.get('TARGET_ACCOUNT_ROLES', '')
+
+    # No configured roles means the account the Lambda is deployed to only.
+    return [role.strip() for role in roles.split(',') if role.strip()] or [None]
@@ -0,0 +1,53 @@
+import heapq
+import math
+import statistics
+
+# Rough drift detection time per resource, used until a stack's detection was timed.
+SECONDS_PER_RESOURCE = 0.5
+DEFAULT_STACK_COST = 30
+
+
+def get_stack_cost(record):
+    if record.get('DetectionSeconds'):
+        return float(record['DetectionSeconds'])
+    elif record.get('ResourceCount'):
+        return int(record['ResourceCount']) * SECONDS_PER_RESOURCE
+
+    return None
+
+
+def estimate_stack_costs(stacks, cost_records):
+    costs = {}
+    for stack in stacks:
+        cost = get_stack_cost(cost_records.get(stack['StackId'], {}))
+        if cost is not None:
+            costs[stack['StackId']] = cost
+
+    # Stacks never detected before are assumed to be typical ones.
+    default_cost = statistics.median(costs.values()) if costs else DEFAULT_STACK_COST
+
+    return {stack['StackId']: costs.get(stack['StackId'], default_cost) for stack in stacks}
+
+
+def plan_batches(stacks, costs, batch_size):
+    if not stacks:
+        return []
+
+    batch_count = math.ceil(len(stacks) / batch_size)
+    batches = [[] for _ in range(batch_count)]
+    batch_costs = [0] * batch_count
+    open_batches = [(0, i) for i in range(batch_count)]
+
+    # Longest processing time first: the most expensive stack left goes to the
+    # cheapest batch that still has room.
+    for stack in sorted(stacks, key=lambda s: costs[s['StackId']], reverse=True):
+        batch_cost, i = heapq.heappop(open_batches)
+        batches[i].append(stack)
+        batch_costs[i] = batch_cost + costs[stack['StackId']]
+        if len(batches[i]) < batch_size:
+            heapq.heappush(open_batches, (batch_costs[i], i))
+
+    # The most expensive batches are sent first, so they start first.
+    order = sorted(range(batch_count), key=lambda i: batch_costs[i], reverse=True)
+
+    return [batches[i] for i in order]
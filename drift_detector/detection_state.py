@@ -0,0 +1,97 @@
+import time
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+COMPLETE = 'complete'
+FAILED = 'failed'
+RETRIED = 'retried'
+
+STATUSES_TO_START = (PENDING, RETRIED)
+FINISHED_STATUSES = (COMPLETE, FAILED)
+
+
+class DetectionState:
+    def __init__(self, stacks):
+        self.stacks = stacks
+        self.stacks_by_id = {stack['StackId']: stack for stack in stacks}
+        self.status = dict.fromkeys(self.stacks_by_id, PENDING)
+        self.starts = {}
+        self.detections = {}
+        self.started_at = {}
+        self.durations = {}
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        state = cls(checkpoint['stacks'])
+        state.starts.update(checkpoint['starts'])
+
+        for stack_id, starts in state.starts.items():
+            if starts:
+                state.status[stack_id] = RETRIED
+        for stack_id in checkpoint['complete']:
+            state.status[stack_id] = COMPLETE
+        for stack_id in checkpoint['failed']:
+            state.status[stack_id] = FAILED
+        for detection_id, stack_id in checkpoint['in_flight'].items():
+            state.status[stack_id] = IN_PROGRESS
+            state.detections[detection_id] = stack_id
+
+        return state
+
+    def to_checkpoint(self):
+        partition = self.partition()
+
+        return {
+            'stacks': self.stacks,
+            'complete': [stack['StackId'] for stack in partition[COMPLETE]],
+            'failed': [stack['StackId'] for stack in partition[FAILED]],
+            'in_flight': dict(self.detections),
+            'starts': dict(self.starts)
+        }
+
+    def stacks_to_start(self):
+        return [stack for stack in self.stacks if self.status[stack['StackId']] in STATUSES_TO_START]
+
+    def start(self, stack_id, detection_id):
+        self.count_start(stack_id)
+        self.status[stack_id] = IN_PROGRESS
+        self.detections[detection_id] = stack_id
+        self.started_at[stack_id] = time.monotonic()
+
+    def count_start(self, stack_id):
+        self.starts[stack_id] = self.starts.get(stack_id, 0) + 1
+        return self.starts[stack_id]
+
+    def stack_id_for(self, detection_id):
+        return self.detections[detection_id]
+
+    def complete(self, stack_id, detection_id=None):
+        self.detections.pop(detection_id, None)
+        self.status[stack_id] = COMPLETE
+        # Detections resumed from a checkpoint have no start time to measure from.
+        if detection_id is not None and stack_id in self.started_at:
+            self.durations[stack_id] = time.monotonic() - self.started_at.pop(stack_id)
+
+    def retry_or_fail(self, stack_id, max_starts, detection_id=None):
+        self.detections.pop(detection_id, None)
+
+        if self.starts.get(stack_id, 0) < max_starts:
+            self.status[stack_id] = RETRIED
+            return True
+
+        self.status[stack_id] = FAILED
+        return False
+
+    def fail(self, stack_id):
+        self.status[stack_id] = FAILED
+
+    def is_finished(self):
+        return all(status in FINISHED_STATUSES for status in self.status.values())
+
+    def partition(self):
+        # One pass over the batch, keeping the original order of stacks.
+        partition = {status: [] for status in (PENDING, IN_PROGRESS, COMPLETE, FAILED, RETRIED)}
+        for stack in self.stacks:
+            partition[self.status[stack['StackId']]].append(stack)
+
+        return partition
@@ -1,60 +1,181 @@
-import boto3
 import os
-import re
 import json
-from utils import chunks
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from aws_clients import get_account_id, get_client, get_regions, get_target_account_roles
+from batch_planner import estimate_stack_costs, plan_batches
+from drift_store import get_stack_cost_store
+from metrics import metrics
+from stack_selector import get_stack_selector
+from sharding import batched_by_shard, get_message_group_id, group_by_shard
+from utils import is_drift_check_stale
 
+DEFAULT_DRIFT_CHECK_MAX_AGE_HOURS = 24
+SQS_MAX_BATCH_ENTRIES = 10
+SQS_MAX_MESSAGE_BYTES = 256 * 1024
+# Drift information and timestamps let the detector reuse recent detections
+# without describing the stack again.
+STACK_MESSAGE_FIELDS = ('StackName', 'StackId', 'Region', 'AccountId', 'RoleArn', 'ParentId', 'RootId',
+                        'DriftInformation', 'LastUpdatedTime', 'CreationTime')
+TARGETS_MAX_WORKERS = 8
 
-def is_status_proper_to_check_drift(status):
-    return status in (
-        'CREATE_COMPLETE',
-        'UPDATE_COMPLETE',
-        'UPDATE_ROLLBACK_COMPLETE'
-    )
 
+def is_incremental_scan(event):
+    # Scheduled full sweeps pass {"full_scan": true} as the event input.
+    if event and event.get('full_scan'):
+        return False
 
-def find_stacks(cf_client):
-    stacks = []
+    return os.environ.get('INCREMENTAL_SCAN', 'false') == 'true'
 
-    stack_regex = re.compile(os.environ.get('STACK_REGEX', '.*'))
 
+def iter_all_stacks(cf_client):
     paginator = cf_client.get_paginator('describe_stacks')
 
     response_iterator = paginator.paginate()
     for page in response_iterator:
-        for stack in page['Stacks']:
-            if is_status_proper_to_check_drift(stack['StackStatus']) \
-                    and stack_regex.match(stack['StackName']):
-                stacks.append(stack)
+        yield from page['Stacks']
+
+
+def get_stack_filter(incremental=False):
+    stack_selector = get_stack_selector()
+    if not incremental:
+        return stack_selector.matches
+
+    max_age = timedelta(hours=float(os.environ.get('DRIFT_CHECK_MAX_AGE_HOURS', DEFAULT_DRIFT_CHECK_MAX_AGE_HOURS)))
+    now = datetime.now(timezone.utc)
+
+    def is_stack_selected(stack):
+        return stack_selector.matches(stack) and is_drift_check_stale(stack, max_age, now)
+
+    return is_stack_selected
+
+
+def iter_stacks(cf_client, incremental=False):
+    return filter(get_stack_filter(incremental), iter_all_stacks(cf_client))
+
 
-    return stacks
+def find_stacks(cf_client, incremental=False):
+    return list(iter_stacks(cf_client, incremental))
+
+
+def compact_stack(stack):
+    return {field: stack[field] for field in STACK_MESSAGE_FIELDS if field in stack}
+
+
+def build_message_bodies(stacks):
+    message_body = json.dumps([compact_stack(stack) for stack in stacks], separators=(',', ':'), default=str)
+
+    # A batch that would not fit in a single message is split in halves.
+    if len(message_body.encode('utf-8')) <= SQS_MAX_MESSAGE_BYTES or len(stacks) == 1:
+        yield message_body
+    else:
+        middle = len(stacks) // 2
+        yield from build_message_bodies(stacks[:middle])
+        yield from build_message_bodies(stacks[middle:])
+
+
+def send_message_batch(sqs_client, sqs_url, messages):
+    response = sqs_client.send_message_batch(
+        QueueUrl=sqs_url,
+        Entries=[{
+            'Id': str(i),
+            'MessageBody': message_body,
+            'MessageGroupId': message_group_id
+        } for i, (message_group_id, message_body) in enumerate(messages)]
+    )
+
+    metrics.add('SqsMessagesSent', len(messages))
+
+    if response.get('Failed'):
+        raise Exception(f"Failed to send {len(response['Failed'])} message(s) to SQS: {response['Failed']}")
 
 
 def send_stacks_to_sqs(stacks_in_batches, sqs_client, sqs_url):
+    messages = []
+    messages_size = 0
+
     for stacks in stacks_in_batches:
-        json_stacks = json.dumps(stacks, indent=4, default=str, sort_keys=True)
-        sqs_client.send_message(
-            QueueUrl=sqs_url,
-            MessageBody=json_stacks,
-            MessageGroupId='drift_detector'
-        )
+        metrics.add('StacksDiscovered', len(stacks))
+        # Every batch belongs to a single shard, so its first stack names the group.
+        message_group_id = get_message_group_id(stacks[0])
+        for message_body in build_message_bodies(stacks):
+            message_body_size = len(message_body.encode('utf-8'))
+
+            if messages and (len(messages) == SQS_MAX_BATCH_ENTRIES
+                             or messages_size + message_body_size > SQS_MAX_MESSAGE_BYTES):
+                send_message_batch(sqs_client, sqs_url, messages)
+                messages = []
+                messages_size = 0
+
+            messages.append((message_group_id, message_body))
+            messages_size += message_body_size
+
+    if messages:
+        send_message_batch(sqs_client, sqs_url, messages)
+
+
+def tag_stacks(stacks, region, role_arn=None):
+    for stack in stacks:
+        if region:
+            stack['Region'] = region
+        if role_arn:
+            stack['AccountId'] = get_account_id(role_arn)
+            stack['RoleArn'] = role_arn
+        yield stack
+
+
+def plan_weighted_batches(stacks, batches):
+    stack_cost_store = get_stack_cost_store()
+    cost_records = stack_cost_store.get_records([stack['StackId'] for stack in stacks]) if stack_cost_store else {}
+
+    costs = estimate_stack_costs(stacks, cost_records)
+
+    return [
+        batch for shard_stacks in group_by_shard(stacks).values()
+        for batch in plan_batches(shard_stacks, costs, batches)
+    ]
+
+
+def discover_region_stacks(region, incremental, sqs_client, sqs_url, batches, role_arn=None):
+    cf_client = get_client('cloudformation', region, role_arn)
+    stacks = tag_stacks(iter_stacks(cf_client, incremental), region, role_arn)
+
+    if os.environ.get('BATCH_PLANNER', 'count') == 'weighted':
+        # Balancing batches by expected detection time needs every stack first.
+        stacks_in_batches = plan_weighted_batches(list(stacks), batches)
+    else:
+        # Stacks are filtered page by page and shipped as soon as a batch fills,
+        # so detectors can start while discovery is still paging.
+        stacks_in_batches = batched_by_shard(stacks, batches)
+
+    send_stacks_to_sqs(stacks_in_batches, sqs_client, sqs_url)
 
 
 def lambda_handler(event, context):
+    metrics.start('DiscoverStacks')
     try:
-        cf_client = boto3.client('cloudformation')
-        sqs_client = boto3.client('sqs')
+        sqs_client = get_client('sqs')
 
         sqs_url = os.environ['DRIFT_DETECTION_QUEUE']
         batches = int(os.environ['STACK_BATCHES'])
+        incremental = is_incremental_scan(event)
 
-        stacks_in_batches = chunks(find_stacks(cf_client), batches)
-        send_stacks_to_sqs(stacks_in_batches, sqs_client, sqs_url)
+        with metrics.timer('DiscoveryTime'), ThreadPoolExecutor(
+                max_workers=TARGETS_MAX_WORKERS, initializer=metrics.bind, initargs=(metrics.current(),)) as executor:
+            futures = [
+                executor.submit(discover_region_stacks, region, incremental, sqs_client, sqs_url, batches, role_arn)
+                for role_arn in get_target_account_roles()
+                for region in get_regions()
+            ]
+            for future in futures:
+                future.result()
     except Exception as e:
         print("Unexpected error: %s" % e)
         raise
+    finally:
+        metrics.flush()
 
     return {
             "statusCode": 200,
             "body": '',
-        }
\ No newline at end of file
+        }
@@ -1,15 +1,35 @@
-import boto3
+import asyncio
+import functools
 import json
 import urllib.parse
-import sys
 import time
 import os
-from utils import chunks
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from drift_store import build_stack_cost_record, get_drift_store, get_stack_cost_store, load_drifted_resources
+from sharding import get_message_group_id, group_by_shard
+from result_store import build_notification_payload, get_result_store
+from polling import PollingPolicy, PollSchedule, get_deadline, is_past_deadline
+from datetime import datetime, timedelta, timezone
+from metrics import metrics
+from detection_state import COMPLETE, FAILED, IN_PROGRESS, PENDING, RETRIED, DetectionState
+from utils import backoff_delay, get_stack_name_from_id, is_drift_check_stale, is_throttling_error
 
 CHECK_STATUS_MAX_ATTEMPTS = 100
-CHECK_STATUS_ATTEMPT_WAIT_TIME = 6
-CF_CALLS_CHUNK_SIZE = 3
+DETECTION_WINDOW_INITIAL_SIZE = 3
+DETECTION_WINDOW_MIN_SIZE = 1
+DETECTION_WINDOW_MAX_SIZE = 10
 DRIFT_DETECTION_MAX_RETRIES = 5
+DRIFT_INFO_MAX_WORKERS = 4
+DRIFTED_STATUSES = ('DELETED', 'MODIFIED')
+ASYNC_MAX_CONCURRENT_CALLS = 10
+RECHECK_MAX_WORKERS = 8
+RECHECK_FIELDS = ('LogicalResourceIds', 'RecheckedResources')
+NESTED_STACK_RESOURCE_TYPE = 'AWS::CloudFormation::Stack'
+THROTTLING_BASE_DELAY = 1
+THROTTLING_MAX_DELAY = 20
 
 
 def is_arn(physical_resource_id):
@@ -53,126 +73,611 @@ def get_emoji_for_status(status):
     return ''
 
 
-def get_stack_url(stack_id):
+def get_stack_url(stack_id, region=None):
+    if region:
+        return f'https://{region}.console.aws.amazon.com/cloudformation/home?region={region}' \
+               f'#/stacks/drifts?stackId={urllib.parse.quote(stack_id)}'
+
     return f'https://console.aws.amazon.com/cloudformation/home#/stacks/drifts?stackId={urllib.parse.quote(stack_id)}'
 
 
-def is_status_proper_to_check_drift(status):
-    return status in (
-        'CREATE_COMPLETE',
-        'UPDATE_COMPLETE',
-        'UPDATE_ROLLBACK_COMPLETE'
-    )
+def adjust_detection_window(window, throttled):
+    # Additive increase, multiplicative decrease: back off hard as soon as
+    # CloudFormation starts throttling and probe upwards one slot at a time.
+    if throttled:
+        return max(DETECTION_WINDOW_MIN_SIZE, window // 2)
+
+    return min(DETECTION_WINDOW_MAX_SIZE, window + 1)
+
+
+class DetectionDeadlineExceeded(Exception):
+    def __init__(self, checkpoint):
+        super().__init__('Drift detection did not finish before the deadline')
+        self.checkpoint = checkpoint
+
+
+def load_detection_checkpoint(stacks):
+    payload = json.loads(stacks) if isinstance(stacks, str) else stacks
+
+    # A plain list of stacks is a fresh batch; a checkpoint continues a batch
+    # that ran out of time in a previous invocation.
+    if isinstance(payload, dict):
+        return payload['checkpoint']
+
+    return {'stacks': payload, 'complete': [], 'failed': [], 'in_flight': {}, 'starts': {}}
+
+
+def get_batch_stacks(payload):
+    if isinstance(payload, dict):
+        return payload['recheck'] if 'recheck' in payload else payload['checkpoint']['stacks']
+
+    return payload
+
+
+def get_detection_reuse_max_age():
+    reuse_minutes = float(os.environ.get('DETECTION_REUSE_MINUTES', 0))
+    return timedelta(minutes=reuse_minutes) if reuse_minutes > 0 else None
+
+
+def parse_timestamp(value):
+    # Timestamps are strings once a stack went through an SQS message.
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def load_stack_drift_description(stack):
+    stack_description = {
+        key: parse_timestamp(stack[key]) for key in ('LastUpdatedTime', 'CreationTime') if key in stack
+    }
+    if 'DriftInformation' in stack:
+        drift_information = dict(stack['DriftInformation'])
+        if 'LastCheckTimestamp' in drift_information:
+            drift_information['LastCheckTimestamp'] = parse_timestamp(drift_information['LastCheckTimestamp'])
+        stack_description['DriftInformation'] = drift_information
+
+    return stack_description
+
+
+def has_recent_detection(cf_client, stack, reuse_max_age, refresh=False):
+    if reuse_max_age is None:
+        return False
+
+    # A detection that finished within the window, on a stack that was not
+    # updated since, is as good as a new one. Discovery already described the
+    # stack; only a detection that was in progress needs a fresh look.
+    if refresh:
+        stack_description = cf_client.describe_stacks(StackName=stack['StackId'])['Stacks'][0]
+    else:
+        stack_description = load_stack_drift_description(stack)
+    if is_drift_check_stale(stack_description, reuse_max_age, datetime.now(timezone.utc)):
+        return False
+
+    print(f"Reusing recent drift detection for the Stack with ID: {stack['StackId']}")
+    return True
+
+
+def is_detection_in_progress_error(error):
+    error_details = error.response.get('Error', {})
+    return error_details.get('Code') == 'ValidationError' and 'in progress' in error_details.get('Message', '').lower()
+
+
+def detect_drift(cf_client, stacks, deadline=None, polling_policy=None):
+    checkpoint = load_detection_checkpoint(stacks)
+    polling_policy = polling_policy or PollingPolicy.from_env()
+
+    if os.environ.get('DETECTION_ENGINE', 'sync') == 'async':
+        return asyncio.run(detect_drift_async(cf_client, checkpoint, deadline, polling_policy))
+
+    state = DetectionState.from_checkpoint(checkpoint)
+    stacks_to_start = deque(state.stacks_to_start())
+    poll_schedule = PollSchedule(polling_policy)
+    for detection_id in state.detections:
+        poll_schedule.add(detection_id, time.monotonic())
+    not_before = {}
+    in_progress_waits = {}
+    reuse_max_age = get_detection_reuse_max_age()
+    window = DETECTION_WINDOW_INITIAL_SIZE
+    throttles = 0
+
+    while stacks_to_start or state.detections:
+        now = time.monotonic()
+        if is_past_deadline(deadline, now):
+            break
+        throttled = False
+
+        # Top up the window: a stack starts as soon as any slot frees up.
+        deferred_stacks = []
+        while stacks_to_start and len(state.detections) < window:
+            stack = stacks_to_start.popleft()
+            stack_id = stack['StackId']
+            if not_before.get(stack_id, now) > now:
+                deferred_stacks.append(stack)
+                continue
+
+            try:
+                if has_recent_detection(cf_client, stack, reuse_max_age, stack_id in in_progress_waits):
+                    not_before.pop(stack_id, None)
+                    state.complete(stack_id)
+                    continue
+
+                with metrics.timer('DetectionStartTime'):
+                    detection_id = cf_client.detect_stack_drift(
+                        StackName=stack['StackName']
+                    )['StackDriftDetectionId']
+            except ClientError as e:
+                if is_detection_in_progress_error(e):
+                    # Another run is detecting this stack already; wait for it
+                    # to finish, its result is reused or a new detection starts.
+                    # Waiting doesn't use up starts: a long detection would fail
+                    # the stack, and the deadline hands it to a follow-up invocation.
+                    in_progress_waits[stack_id] = in_progress_waits.get(stack_id, 0) + 1
+                    not_before[stack_id] = now + polling_policy.delay(in_progress_waits[stack_id])
+                    deferred_stacks.append(stack)
+                    continue
+                if not is_throttling_error(e):
+                    raise
+                stacks_to_start.appendleft(stack)
+                throttled = True
+                break
+
+            not_before.pop(stack_id, None)
+            state.start(stack_id, detection_id)
+            poll_schedule.add(detection_id, now)
+        stacks_to_start.extend(deferred_stacks)
+
+        # Only detections whose backoff has elapsed are polled in this round.
+        due_detection_ids = poll_schedule.due(now)
+        metrics.add('PollingRounds')
+        try:
+            with metrics.timer('PollingTime'):
+                detection_complete, detection_failed = poll_drift_detection_statuses(cf_client, due_detection_ids)
+        except ClientError as e:
+            if not is_throttling_error(e):
+                raise
+            detection_complete, detection_failed = {}, {}
+            due_detection_ids = []
+            throttled = True
+
+        for detection_id in due_detection_ids:
+            stack_id = state.stack_id_for(detection_id)
+            if detection_id in detection_complete:
+                poll_schedule.remove(detection_id)
+                state.complete(stack_id, detection_id)
+                continue
+
+            if detection_id not in detection_failed:
+                if poll_schedule.polled(detection_id, now) <= CHECK_STATUS_MAX_ATTEMPTS:
+                    continue
+                print(f'Max attempts exceeded for drift detection with ID: {detection_id}')
+
+            poll_schedule.remove(detection_id)
+            if state.retry_or_fail(stack_id, DRIFT_DETECTION_MAX_RETRIES, detection_id):
+                metrics.add('DetectionRetries')
+                stacks_to_start.append(state.stacks_by_id[stack_id])
+
+        window = adjust_detection_window(window, throttled)
+
+        wait = poll_schedule.wait_time(time.monotonic())
+        if throttled:
+            throttles += 1
+            wait = max(wait, backoff_delay(throttles, THROTTLING_BASE_DELAY, THROTTLING_MAX_DELAY))
+        elif stacks_to_start and len(state.detections) < window:
+            if len(stacks_to_start) > len(not_before):
+                wait = 0
+            else:
+                start_wait = max(0, min(not_before.values()) - time.monotonic())
+                wait = min(wait, start_wait) if state.detections else start_wait
+        if deadline is not None:
+            wait = min(wait, max(0, deadline - time.monotonic()))
+        if wait > 0:
+            time.sleep(wait)
+
+    # Running detections keep going in CloudFormation, so the next invocation
+    # resumes polling them instead of starting from scratch.
+    if not state.is_finished():
+        raise DetectionDeadlineExceeded(state.to_checkpoint())
+
+    partition = state.partition()
+    set_detection_durations(partition[COMPLETE], state.durations)
+
+    return append_drift_info(cf_client, partition[COMPLETE]), partition[FAILED]
+
+
+def set_detection_durations(stacks, durations):
+    for stack in stacks:
+        if stack['StackId'] in durations:
+            stack['detection_seconds'] = round(durations[stack['StackId']], 1)
+
+
+def get_drift_status_filters():
+    # Filtering server side returns drifted resources only, so no_of_resources
+    # then counts drifted resources instead of all the resources in the stack.
+    if os.environ.get('SHOW_IN_SYNC', 'false') == 'false' \
+            and os.environ.get('SERVER_SIDE_DRIFT_FILTER', 'false') == 'true':
+        return list(DRIFTED_STATUSES)
+
+    return None
+
 
+def describe_all_stack_resource_drifts(cf_client, stack_name, status_filters=None):
+    stack_resource_drifts = []
+    kwargs = {'StackName': stack_name}
+    if status_filters:
+        kwargs['StackResourceDriftStatusFilters'] = status_filters
 
-def detect_drift(cf_client, stacks):
-    stacks_to_check = json.loads(stacks)
-    attempts = 0
+    while True:
+        response = cf_client.describe_stack_resource_drifts(**kwargs)
+        stack_resource_drifts.extend(response['StackResourceDrifts'])
 
-    while stacks_to_check and attempts < DRIFT_DETECTION_MAX_RETRIES:
-        attempts += 1
-        split_into_chunks_stacks = chunks(stacks_to_check, CF_CALLS_CHUNK_SIZE)
+        if not response.get('NextToken'):
+            return stack_resource_drifts
+        kwargs['NextToken'] = response['NextToken']
 
-        for chunk in split_into_chunks_stacks:
-            stacks_checking_ids = []
-            for stack in chunk:
-                stacks_checking_ids.append(cf_client.detect_stack_drift(
-                    StackName=stack['StackName']
-                )['StackDriftDetectionId'])
 
-            completed_stacks_ids = check_drifts_detection_status(cf_client, stacks_checking_ids)
-            stacks_to_check = list(filter(lambda s: s['StackId'] not in completed_stacks_ids, stacks_to_check))
+def set_stack_drift_info(stack, stack_resource_drifts):
+    stack['drift'] = []
+    stack['no_of_drifted_resources'] = 0
+    stack['no_of_resources'] = len(stack_resource_drifts)
 
-    detection_complete_stacks = list(filter(lambda s: s not in stacks_to_check, json.loads(stacks)))
-    detection_failed_stacks = list(filter(lambda s: s in stacks_to_check, json.loads(stacks)))
+    for drift in stack_resource_drifts:
+        if drift['StackResourceDriftStatus'] in DRIFTED_STATUSES:
+            stack['no_of_drifted_resources'] += 1
 
-    return append_drift_info(cf_client, detection_complete_stacks), detection_failed_stacks
+        stack_drift = {
+            'PhysicalResourceId': parse_arn(drift['PhysicalResourceId']),
+            'StackResourceDriftStatus': drift['StackResourceDriftStatus'],
+            'ResourceType': drift['ResourceType']
+        }
+        # Drifted resources keep their logical ID, so they can be re-checked one by one.
+        if drift['StackResourceDriftStatus'] in DRIFTED_STATUSES:
+            stack_drift['LogicalResourceId'] = drift['LogicalResourceId']
+        # A nested stack resource belongs to a direct child (the stack whose ParentId is this stack).
+        # Its drift covers the resource's own properties; the child is detected on its own.
+        if drift['ResourceType'] == NESTED_STACK_RESOURCE_TYPE:
+            stack_drift['NestedStackName'] = get_stack_name_from_id(drift['PhysicalResourceId'])
+        stack['drift'].append(stack_drift)
+
+    stack['drift'].sort(key=lambda x: x['PhysicalResourceId'])
+
+    return stack
+
+
+def append_stack_drift_info(cf_client, stack, status_filters=None):
+    stack_resource_drifts = describe_all_stack_resource_drifts(cf_client, stack['StackName'], status_filters)
+
+    return set_stack_drift_info(stack, stack_resource_drifts)
 
 
 def append_drift_info(cf_client, detection_complete_stacks):
-    stacks_with_drift_info = []
+    status_filters = get_drift_status_filters()
+
+    with metrics.timer('ResultFetchTime'), ThreadPoolExecutor(
+            max_workers=DRIFT_INFO_MAX_WORKERS, initializer=metrics.bind, initargs=(metrics.current(),)) as executor:
+        return list(executor.map(
+            lambda stack: append_stack_drift_info(cf_client, stack, status_filters),
+            detection_complete_stacks
+        ))
+
+
+def poll_drift_detection_statuses(cf_client, detection_ids):
+    detection_complete = {}
+    detection_failed = {}
+    metrics.add('StatusPolls', len(detection_ids))
 
-    for stack in detection_complete_stacks:
-        response = cf_client.describe_stack_resource_drifts(
-            StackName=stack['StackName']
+    for detection_id in detection_ids:
+        response = cf_client.describe_stack_drift_detection_status(
+            StackDriftDetectionId=detection_id
         )
-        stack['drift'] = []
-        stack['no_of_drifted_resources'] = 0
-        stack['no_of_resources'] = len(response['StackResourceDrifts'])
 
-        for drift in response['StackResourceDrifts']:
-            if drift['StackResourceDriftStatus'] in ('DELETED', 'MODIFIED'):
-                stack['no_of_drifted_resources'] += 1
+        if response['DetectionStatus'] == 'DETECTION_COMPLETE':
+            detection_complete[detection_id] = response['StackId']
+        elif response['DetectionStatus'] == 'DETECTION_FAILED':
+            stack_id = response['StackId']
+            fail_reason = response['DetectionStatusReason']
+            print(f'Drift detection has failed for the Stack with ID: {stack_id} with reason: {fail_reason}')
+            detection_failed[detection_id] = stack_id
 
-            stack['drift'].append({
-                'PhysicalResourceId': parse_arn(drift['PhysicalResourceId']),
-                'StackResourceDriftStatus': drift['StackResourceDriftStatus'],
-                'ResourceType': drift['ResourceType']
-            })
+    return detection_complete, detection_failed
 
-        stack['drift'].sort(key=lambda x: x['PhysicalResourceId'])
 
-        stacks_with_drift_info.append(stack)
+async def call_cf_async(cf_client_method, semaphore, executor, deadline, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    attempt = 0
 
-    return stacks_with_drift_info
+    while True:
+        try:
+            async with semaphore:
+                return await loop.run_in_executor(executor, functools.partial(cf_client_method, *args, **kwargs))
+        except ClientError as e:
+            if not is_throttling_error(e):
+                raise
 
+            # Persistent throttling must not run the invocation past its deadline.
+            attempt += 1
+            delay = backoff_delay(attempt, THROTTLING_BASE_DELAY, THROTTLING_MAX_DELAY)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
 
-def check_drifts_detection_status(cf_client, stacks_checking_ids):
-    detection_complete_stack_ids = []
-    attempts = 0
+        # Back off outside of the semaphore, so other coroutines keep going.
+        await asyncio.sleep(delay)
 
-    for detection_id in stacks_checking_ids:
-        while True:
-            response = cf_client.describe_stack_drift_detection_status(
-                StackDriftDetectionId=detection_id
-            )
 
-            if response['DetectionStatus'] == 'DETECTION_COMPLETE':
-                detection_complete_stack_ids.append(response['StackId'])
-                break
-            elif response['DetectionStatus'] == 'DETECTION_FAILED':
-                stack_id = response['StackId']
-                fail_reason = response['DetectionStatusReason']
-                print(f'Drift detection has failed for the Stack with ID: {stack_id} with reason: {fail_reason}')
-                break
+async def detect_stack_drift_async(cf_client, stack, detection_id, starts, semaphore, executor, deadline,
+                                   polling_policy, reuse_max_age, durations):
+    started_at = None
+    in_progress_waits = 0
 
-            if attempts < CHECK_STATUS_MAX_ATTEMPTS:
-                attempts += 1
-                sleep = CHECK_STATUS_ATTEMPT_WAIT_TIME
-                time.sleep(sleep)
+    try:
+        while detection_id is not None or starts < DRIFT_DETECTION_MAX_RETRIES:
+            if detection_id is None:
+                if await call_cf_async(has_recent_detection, semaphore, executor, deadline,
+                                       cf_client, stack, reuse_max_age, in_progress_waits > 0):
+                    return 'complete', None, starts
+
+                try:
+                    detection_id = (await call_cf_async(
+                        cf_client.detect_stack_drift, semaphore, executor, deadline, StackName=stack['StackName']
+                    ))['StackDriftDetectionId']
+                    starts += 1
+                    started_at = time.monotonic()
+                except ClientError as e:
+                    if not is_detection_in_progress_error(e):
+                        raise
+                    # Waiting for another detection doesn't use up starts.
+                    in_progress_waits += 1
+                    delay = polling_policy.delay(in_progress_waits)
+                    if deadline is not None and time.monotonic() + delay >= deadline:
+                        return 'not_started', None, starts
+                    await asyncio.sleep(delay)
+                    continue
+
+            for attempt in range(CHECK_STATUS_MAX_ATTEMPTS + 1):
+                delay = polling_policy.delay(attempt)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    return 'in_flight', detection_id, starts
+                await asyncio.sleep(delay)
+
+                detection_complete, detection_failed = await call_cf_async(
+                    poll_drift_detection_statuses, semaphore, executor, deadline, cf_client, [detection_id])
+
+                if detection_complete:
+                    if started_at is not None:
+                        durations[stack['StackId']] = time.monotonic() - started_at
+                    return 'complete', detection_id, starts
+                elif detection_failed:
+                    break
+            else:
+                print(f'Max attempts exceeded for drift detection with ID: {detection_id}')
+
+            detection_id = None
+            if starts < DRIFT_DETECTION_MAX_RETRIES:
+                metrics.add('DetectionRetries')
+    except ClientError as e:
+        if not is_throttling_error(e):
+            raise
+        # Still throttled at the deadline: the follow-up invocation picks the stack up.
+        return ('in_flight', detection_id, starts) if detection_id is not None else ('not_started', None, starts)
+
+    return 'failed', None, starts
+
+
+async def detect_and_fetch_stack_drift_async(cf_client, stack, detection_id, starts, semaphore, executor, deadline,
+                                             polling_policy, reuse_max_age, durations, status_filters, fetched):
+    result = await detect_stack_drift_async(cf_client, stack, detection_id, starts, semaphore, executor, deadline,
+                                            polling_policy, reuse_max_age, durations)
+
+    # Results are fetched as soon as the stack is done, while others are still detecting.
+    if result[0] == 'complete':
+        try:
+            await call_cf_async(
+                append_stack_drift_info, semaphore, executor, deadline, cf_client, stack, status_filters)
+            fetched.add(stack['StackId'])
+        except ClientError as e:
+            if not is_throttling_error(e):
+                raise
+
+    return result
+
+
+async def detect_drift_async(cf_client, checkpoint, deadline, polling_policy):
+    state = DetectionState.from_checkpoint(checkpoint)
+    detection_ids = {stack_id: detection_id for detection_id, stack_id in state.detections.items()}
+    stacks_to_detect = state.stacks_to_start() + state.partition()[IN_PROGRESS]
+
+    # Start and poll of every stack overlap; the semaphore caps how many
+    # CloudFormation calls run at the same time.
+    semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENT_CALLS)
+    reuse_max_age = get_detection_reuse_max_age()
+
+    with ThreadPoolExecutor(max_workers=ASYNC_MAX_CONCURRENT_CALLS,
+                            initializer=metrics.bind, initargs=(metrics.current(),)) as executor:
+        status_filters = get_drift_status_filters()
+        fetched = set()
+        results = await asyncio.gather(*(
+            detect_and_fetch_stack_drift_async(
+                cf_client, stack, detection_ids.get(stack['StackId']), state.starts.get(stack['StackId'], 0),
+                semaphore, executor, deadline, polling_policy, reuse_max_age, state.durations, status_filters, fetched)
+            for stack in stacks_to_detect
+        ))
+
+        state.detections.clear()
+        for stack, (status, detection_id, starts) in zip(stacks_to_detect, results):
+            stack_id = stack['StackId']
+            state.starts[stack_id] = starts
+            if status == 'complete':
+                state.complete(stack_id)
+            elif status == 'failed':
+                state.fail(stack_id)
+            elif status == 'in_flight':
+                state.status[stack_id] = IN_PROGRESS
+                state.detections[detection_id] = stack_id
             else:
-                print('Max attempts exceeded')
-                sys.exit(1)
+                state.status[stack_id] = RETRIED if starts else PENDING
+
+        # Fetched results stay in memory; a follow-up invocation fetches them again.
+        if not state.is_finished():
+            raise DetectionDeadlineExceeded(state.to_checkpoint())
+
+        partition = state.partition()
+        set_detection_durations(partition[COMPLETE], state.durations)
+
+        # Only stacks completed by an earlier invocation, or throttled at the deadline, are left to fetch.
+        with metrics.timer('ResultFetchTime'):
+            await asyncio.gather(*(
+                call_cf_async(append_stack_drift_info, semaphore, executor, deadline, cf_client, stack, status_filters)
+                for stack in partition[COMPLETE] if stack['StackId'] not in fetched
+            ))
+
+    return partition[COMPLETE], partition[FAILED]
+
+
+def get_recheck_logical_resource_ids(stack, drift_records):
+    # Without an explicit list, the resources that drifted in the last report are re-checked.
+    if 'LogicalResourceIds' in stack:
+        return stack['LogicalResourceIds']
+
+    return sorted(load_drifted_resources(drift_records.get(stack['StackId'], {})))
+
+
+def recheck_stack_resource_drift(cf_client, stack, logical_resource_id):
+    try:
+        return cf_client.detect_stack_resource_drift(
+            StackName=stack['StackName'],
+            LogicalResourceId=logical_resource_id
+        )['StackResourceDrift']
+    except ClientError as e:
+        # A resource removed from the template since the last detection can't drift any more.
+        if e.response.get('Error', {}).get('Code') == 'ValidationError' and 'does not exist' in str(e):
+            print(f"Resource {logical_resource_id} no longer exists in the Stack with ID: {stack['StackId']}")
+            return None
+        raise
+
+
+def recheck_drift(cf_client, stacks, drift_store=None):
+    drift_records = drift_store.get_records([stack['StackId'] for stack in stacks]) if drift_store else {}
+    for stack in stacks:
+        stack['RecheckedResources'] = get_recheck_logical_resource_ids(stack, drift_records)
+
+    # Nothing to re-check doesn't mean in sync; those stacks need a full detection.
+    unchecked_stacks = [stack for stack in stacks if not stack['RecheckedResources']]
+    stacks = [stack for stack in stacks if stack['RecheckedResources']]
+    checks = [(stack, logical_resource_id) for stack in stacks for logical_resource_id in stack['RecheckedResources']]
+    metrics.add('ResourcesRechecked', len(checks))
+
+    def recheck(check):
+        try:
+            return recheck_stack_resource_drift(cf_client, *check)
+        except ClientError as e:
+            print(f"Failed to re-check {check[1]} in the Stack with ID: {check[0]['StackId']}: {e}")
+            return e
+
+    # Every resource is checked on its own, so they all run at the same time.
+    with ThreadPoolExecutor(max_workers=RECHECK_MAX_WORKERS,
+                            initializer=metrics.bind, initargs=(metrics.current(),)) as executor:
+        results = list(executor.map(recheck, checks))
+
+    stack_resource_drifts = {stack['StackId']: [] for stack in stacks}
+    failed_stack_ids = set()
+    for (stack, _), result in zip(checks, results):
+        if isinstance(result, ClientError):
+            failed_stack_ids.add(stack['StackId'])
+        elif result is not None:
+            stack_resource_drifts[stack['StackId']].append(result)
+
+    rechecked_stacks = [
+        set_stack_drift_info(stack, stack_resource_drifts[stack['StackId']])
+        for stack in stacks if stack['StackId'] not in failed_stack_ids
+    ]
+    detection_failed_stacks = [stack for stack in stacks if stack['StackId'] in failed_stack_ids]
+
+    return rechecked_stacks, detection_failed_stacks, unchecked_stacks
+
+
+def send_detection_messages(sqs_client, sqs_url, stacks):
+    # Every stack goes to its own shard, so its detections never overlap.
+    for message_group_id, shard_stacks in group_by_shard(stacks).items():
+        sqs_client.send_message(
+            QueueUrl=sqs_url,
+            MessageBody=json.dumps(shard_stacks, separators=(',', ':'), default=str),
+            MessageGroupId=message_group_id
+        )
+
+
+def send_continuation_message(sqs_client, sqs_url, checkpoint):
+    sqs_client.send_message(
+        QueueUrl=sqs_url,
+        MessageBody=json.dumps({'checkpoint': checkpoint}, separators=(',', ':'), default=str),
+        MessageGroupId=get_message_group_id(checkpoint['stacks'][0])
+    )
+
+
+def save_stack_costs(stacks):
+    stack_cost_store = get_stack_cost_store()
+    if not stack_cost_store:
+        return
 
-    return detection_complete_stack_ids
+    # Only freshly timed detections are saved; a reused one keeps its old cost.
+    count_resources = get_drift_status_filters() is None
+    stack_cost_store.put_records([
+        build_stack_cost_record(stack, count_resources) for stack in stacks if 'detection_seconds' in stack
+    ])
 
 
-def invoke_slack_notification_lambda(stacks, detection_failed_stacks, lambda_client, function):
-    lambda_payload = json.dumps({
-      "stacks": stacks,
-      "detection_failed_stacks": detection_failed_stacks
-    })
+def invoke_slack_notification_lambda(stacks, detection_failed_stacks, lambda_client, function, result_store=None):
+    lambda_payload = build_notification_payload(stacks, detection_failed_stacks, result_store)
     lambda_client.invoke(FunctionName=function,
                          InvocationType='Event',
                          Payload=lambda_payload)
 
 
 def lambda_handler(event, context):
+    metrics.start('DriftDetector')
     try:
-        cf_client = boto3.client('cloudformation')
-        lambda_client = boto3.client('lambda')
+        lambda_client = get_client('lambda')
 
         function = os.environ['SLACK_NOTIFICATION_FUNCTION']
+        result_store = get_result_store()
 
         print("Drift detector lambda")
 
         for record in event['Records']:
-            payload = record["body"]
-            stacks, detection_failed_stacks = detect_drift(cf_client, payload)
-            invoke_slack_notification_lambda(stacks, detection_failed_stacks, lambda_client, function)
+            payload = json.loads(record["body"])
+            batch_stacks = get_batch_stacks(payload)
+            if not batch_stacks:
+                continue
+
+            # Discovery batches stacks per account and region, so one client serves the whole batch.
+            cf_client = get_client('cloudformation', batch_stacks[0].get('Region'), batch_stacks[0].get('RoleArn'))
+            if isinstance(payload, dict) and 'recheck' in payload:
+                with metrics.timer('RecheckTime'):
+                    stacks, detection_failed_stacks, unchecked_stacks = recheck_drift(
+                        cf_client, batch_stacks, get_drift_store())
+                if unchecked_stacks:
+                    print(f'No drifted resources to re-check in {len(unchecked_stacks)} stacks, detecting their drift')
+                    send_detection_messages(get_client('sqs'), os.environ['DRIFT_DETECTION_QUEUE'], [
+                        {key: value for key, value in stack.items() if key not in RECHECK_FIELDS}
+                        for stack in unchecked_stacks
+                    ])
+                if stacks or detection_failed_stacks:
+                    invoke_slack_notification_lambda(
+                        stacks, detection_failed_stacks, lambda_client, function, result_store)
+                continue
+            try:
+                with metrics.timer('DetectionTime'):
+                    stacks, detection_failed_stacks = detect_drift(cf_client, payload, get_deadline(context))
+            except DetectionDeadlineExceeded as e:
+                print('Deadline reached, continuing drift detection in a follow-up invocation')
+                metrics.add('Continuations')
+                send_continuation_message(get_client('sqs'), os.environ['DRIFT_DETECTION_QUEUE'], e.checkpoint)
+                continue
+            save_stack_costs(stacks)
+            metrics.add('StacksProcessed', len(stacks) + len(detection_failed_stacks))
+            metrics.add('StacksFailed', len(detection_failed_stacks))
+            invoke_slack_notification_lambda(stacks, detection_failed_stacks, lambda_client, function, result_store)
     except Exception as e:
         print("Unexpected error: %s" % e)
         raise
+    finally:
+        metrics.flush()
 
     return {
         "statusCode": 200,
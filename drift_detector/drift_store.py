@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from aws_clients import get_client
+from utils import backoff_delay, chunks
+
+DRIFTED_STATUSES = ('DELETED', 'MODIFIED')
+IN_SYNC_FINGERPRINT = ''
+DETECTION_FAILED_FINGERPRINT = 'DETECTION_FAILED'
+DYNAMODB_BATCH_GET_SIZE = 100
+DYNAMODB_BATCH_WRITE_SIZE = 25
+UNPROCESSED_MAX_ATTEMPTS = 8
+UNPROCESSED_BASE_DELAY = 0.05
+UNPROCESSED_MAX_DELAY = 2
+
+
+def get_drift_line(drift):
+    return f"{drift['ResourceType']}|{drift['PhysicalResourceId']}|{drift['StackResourceDriftStatus']}"
+
+
+def get_fingerprint(drift_lines):
+    if not drift_lines:
+        return IN_SYNC_FINGERPRINT
+
+    return hashlib.sha256('\n'.join(sorted(drift_lines)).encode('utf-8')).hexdigest()
+
+
+def get_drift_fingerprint(stack):
+    return get_fingerprint([
+        get_drift_line(drift) for drift in stack['drift'] if drift['StackResourceDriftStatus'] in DRIFTED_STATUSES
+    ])
+
+
+def get_drifted_resources(stack):
+    # Drifted resources by logical ID, for targeted re-checks.
+    return {
+        drift['LogicalResourceId']: get_drift_line(drift)
+        for drift in stack.get('drift', [])
+        if drift['StackResourceDriftStatus'] in DRIFTED_STATUSES and 'LogicalResourceId' in drift
+    }
+
+
+def load_drifted_resources(record):
+    return json.loads(record.get('DriftedResources') or '{}')
+
+
+def merge_drifted_resources(stack, previous_record):
+    # A re-check covers some resources only; the others keep their last known state.
+    drifted_resources = {
+        logical_resource_id: drift_line
+        for logical_resource_id, drift_line in load_drifted_resources(previous_record).items()
+        if logical_resource_id not in stack['RecheckedResources']
+    }
+    drifted_resources.update(get_drifted_resources(stack))
+
+    return drifted_resources
+
+
+def build_drift_record(stack, fingerprint, drifted_resources=None):
+    if drifted_resources is None:
+        drifted_resources = get_drifted_resources(stack)
+
+    return {
+        'StackId': stack['StackId'],
+        'StackName': stack['StackName'],
+        'Fingerprint': fingerprint,
+        'DriftedResources': json.dumps(drifted_resources, sort_keys=True, separators=(',', ':')),
+        'UpdatedAt': datetime.now(timezone.utc).isoformat()
+    }
+
+
+def build_stack_cost_record(stack, count_resources=True):
+    record = {
+        'StackId': stack['StackId'],
+        'DetectionSeconds': str(stack['detection_seconds']),
+        'UpdatedAt': datetime.now(timezone.utc).isoformat()
+    }
+    # Server side filtered results count drifted resources only.
+    if count_resources:
+        record['ResourceCount'] = str(stack['no_of_resources'])
+
+    return record
+
+
+def send_batch_request(batch_method, request_items, unprocessed_key):
+    # Unprocessed items are what DynamoDB throttled; sending them again
+    # right away only adds to the throttling.
+    for attempt in range(UNPROCESSED_MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(backoff_delay(attempt, UNPROCESSED_BASE_DELAY, UNPROCESSED_MAX_DELAY))
+
+        response = batch_method(RequestItems=request_items)
+        yield response
+        request_items = response.get(unprocessed_key)
+        if not request_items:
+            return
+
+    raise Exception(f'DynamoDB left items unprocessed after {UNPROCESSED_MAX_ATTEMPTS} attempts')
+
+
+class DynamoDBDriftStore:
+    def __init__(self, table_name, dynamodb_client=None):
+        self.table_name = table_name
+        self.dynamodb_client = dynamodb_client or get_client('dynamodb')
+
+    def get_records(self, stack_ids):
+        records = {}
+
+        for stack_ids_chunk in chunks(list(stack_ids), DYNAMODB_BATCH_GET_SIZE):
+            request_items = {self.table_name: {'Keys': [{'StackId': {'S': stack_id}} for stack_id in stack_ids_chunk]}}
+            for response in send_batch_request(self.dynamodb_client.batch_get_item, request_items, 'UnprocessedKeys'):
+                for item in response['Responses'].get(self.table_name, []):
+                    record = {key: value['S'] for key, value in item.items()}
+                    records[record['StackId']] = record
+
+        return records
+
+    def put_records(self, records):
+        for records_chunk in chunks(list(records), DYNAMODB_BATCH_WRITE_SIZE):
+            request_items = {self.table_name: [{
+                'PutRequest': {'Item': {key: {'S': value} for key, value in record.items()}}
+            } for record in records_chunk]}
+            for _ in send_batch_request(self.dynamodb_client.batch_write_item, request_items, 'UnprocessedItems'):
+                pass
+
+
+class FileDriftStore:
+    # Shared by every store in the process, as concurrent invocations each create their own.
+    lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path) as f:
+            return json.load(f)
+
+    def get_records(self, stack_ids):
+        with self.lock:
+            records = self._load()
+
+        return {stack_id: records[stack_id] for stack_id in stack_ids if stack_id in records}
+
+    def put_records(self, records):
+        with self.lock:
+            stored_records = self._load()
+            stored_records.update((record['StackId'], record) for record in records)
+
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(stored_records, f)
+            os.replace(self.path + '.tmp', self.path)
+
+
+def get_drift_store():
+    if os.environ.get('DRIFT_STATE_TABLE'):
+        return DynamoDBDriftStore(os.environ['DRIFT_STATE_TABLE'])
+    elif os.environ.get('DRIFT_STATE_FILE'):
+        return FileDriftStore(os.environ['DRIFT_STATE_FILE'])
+
+    return None
+
+
+def get_stack_cost_store():
+    if os.environ.get('STACK_COST_TABLE'):
+        return DynamoDBDriftStore(os.environ['STACK_COST_TABLE'])
+    elif os.environ.get('STACK_COST_FILE'):
+        return FileDriftStore(os.environ['STACK_COST_FILE'])
+
+    return None
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from utils import THROTTLING_ERROR_CODES, chunks
+
+DEFAULT_METRICS_NAMESPACE = 'DriftDetector'
+# CloudWatch accepts at most 100 metrics in a single EMF document.
+EMF_MAX_METRICS = 100
+
+UNIT_COUNT = 'Count'
+UNIT_MILLISECONDS = 'Milliseconds'
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.function = None
+        self.values = {}
+        self.units = {}
+
+    def start(self, function):
+        with self.lock:
+            self.function = function
+            self.values = {}
+            self.units = {}
+
+    def add(self, name, value=1, unit=UNIT_COUNT):
+        with self.lock:
+            self.values[name] = self.values.get(name, 0) + value
+            self.units[name] = unit
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000, UNIT_MILLISECONDS)
+
+    def build_documents(self):
+        with self.lock:
+            values = dict(self.values)
+            units = dict(self.units)
+            function = self.function
+
+        timestamp = int(time.time() * 1000)
+        namespace = os.environ.get('METRICS_NAMESPACE', DEFAULT_METRICS_NAMESPACE)
+
+        for names in chunks(sorted(values), EMF_MAX_METRICS):
+            document = {
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': namespace,
+                        'Dimensions': [['Function']],
+                        'Metrics': [{'Name': name, 'Unit': units[name]} for name in names]
+                    }]
+                },
+                'Function': function
+            }
+            document.update((name, values[name]) for name in names)
+            yield document
+
+    def flush(self):
+        # EMF lines in the Lambda log are turned into metrics by CloudWatch;
+        # benchmarks write them to a file instead.
+        lines = [json.dumps(document, separators=(',', ':')) for document in self.build_documents()]
+        metrics_file = os.environ.get('METRICS_FILE')
+
+        if metrics_file:
+            with self.lock, open(metrics_file, 'a') as f:
+                f.writelines(line + '\n' for line in lines)
+        else:
+            for line in lines:
+                print(line)
+
+        self.start(self.function)
+
+
+class CurrentMetrics:
+    # Handlers running at the same time in one process (benchmarks) each get
+    # their own Metrics. Worker threads are bound to the Metrics of their handler.
+    def __init__(self):
+        self.local = threading.local()
+        self.default = Metrics()
+
+    def current(self):
+        return getattr(self.local, 'metrics', self.default)
+
+    def bind(self, invocation_metrics):
+        self.local.metrics = invocation_metrics
+
+    def start(self, function):
+        invocation_metrics = Metrics()
+        invocation_metrics.start(function)
+        self.bind(invocation_metrics)
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+
+metrics = CurrentMetrics()
+
+
+def on_before_parameter_build(model, **kwargs):
+    metrics.add(f'{model.name}Calls')
+
+
+def on_after_call(parsed, **kwargs):
+    retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    if retries:
+        metrics.add('Retries', retries)
+
+
+def on_needs_retry(response, **kwargs):
+    if response and response[1].get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+        metrics.add('Throttles')
+
+
+def instrument_client(client):
+    # botocore emits these for every call and every attempt, retries included.
+    client.meta.events.register('before-parameter-build', on_before_parameter_build)
+    client.meta.events.register('after-call', on_after_call)
+    client.meta.events.register('needs-retry', on_needs_retry)
+
+    return client
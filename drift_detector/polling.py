@@ -0,0 +1,79 @@
+import os
+import random
+import time
+
+DEFAULT_POLL_INITIAL_DELAY = 1
+DEFAULT_POLL_MAX_DELAY = 30
+DEFAULT_POLL_MULTIPLIER = 2
+DEFAULT_POLL_JITTER = 0.2
+DEADLINE_SAFETY_MARGIN = 30
+
+
+class PollingPolicy:
+    def __init__(self, initial_delay=DEFAULT_POLL_INITIAL_DELAY, max_delay=DEFAULT_POLL_MAX_DELAY,
+                 multiplier=DEFAULT_POLL_MULTIPLIER, jitter=DEFAULT_POLL_JITTER):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            initial_delay=float(os.environ.get('POLL_INITIAL_DELAY', DEFAULT_POLL_INITIAL_DELAY)),
+            max_delay=float(os.environ.get('POLL_MAX_DELAY', DEFAULT_POLL_MAX_DELAY)),
+            multiplier=float(os.environ.get('POLL_MULTIPLIER', DEFAULT_POLL_MULTIPLIER)),
+            jitter=float(os.environ.get('POLL_JITTER', DEFAULT_POLL_JITTER))
+        )
+
+    def delay(self, attempt):
+        # Small stacks are checked again quickly, big ones less and less often.
+        delay = min(self.max_delay, self.initial_delay * self.multiplier ** attempt)
+        return delay * random.uniform(1 - self.jitter, 1)
+
+
+class PollSchedule:
+    def __init__(self, polling_policy):
+        self.polling_policy = polling_policy
+        self.attempts = {}
+        self.next_poll_at = {}
+
+    def __contains__(self, detection_id):
+        return detection_id in self.next_poll_at
+
+    def __len__(self):
+        return len(self.next_poll_at)
+
+    def add(self, detection_id, now):
+        self.attempts[detection_id] = 0
+        self.next_poll_at[detection_id] = now + self.polling_policy.delay(0)
+
+    def remove(self, detection_id):
+        self.next_poll_at.pop(detection_id, None)
+        return self.attempts.pop(detection_id, 0)
+
+    def due(self, now):
+        return [detection_id for detection_id, poll_at in self.next_poll_at.items() if poll_at <= now]
+
+    def polled(self, detection_id, now):
+        self.attempts[detection_id] += 1
+        self.next_poll_at[detection_id] = now + self.polling_policy.delay(self.attempts[detection_id])
+        return self.attempts[detection_id]
+
+    def wait_time(self, now):
+        if not self.next_poll_at:
+            return 0
+
+        return max(0, min(self.next_poll_at.values()) - now)
+
+
+def get_deadline(context):
+    # Deadlines are kept on the monotonic clock, like every wait in the detector.
+    if context is None:
+        return None
+
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - DEADLINE_SAFETY_MARGIN
+
+
+def is_past_deadline(deadline, now):
+    return deadline is not None and now >= deadline
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from botocore.exceptions import ClientError
+from utils import THROTTLING_ERROR_CODES, TokenBucket, backoff_delay
+
+# Requests per second per operation, for a single account and region.
+DEFAULT_OPERATION_RATES = {
+    'DetectStackDrift': 4,
+    'DescribeStackDriftDetectionStatus': 10,
+    'DescribeStackResourceDrifts': 8,
+    'DescribeStacks': 8,
+}
+DEFAULT_OPERATION_RATE = 8
+THROTTLE_PAUSE_BASE_DELAY = 0.5
+THROTTLE_PAUSE_MAX_DELAY = 10
+SHARED_BUCKET_LEASE_SIZE = 5
+
+
+def parse_operation_rates(rates):
+    # Overrides look like "DetectStackDrift=2,DescribeStacks=5".
+    operation_rates = dict(DEFAULT_OPERATION_RATES)
+    for rate in filter(None, (rate.strip() for rate in rates.split(','))):
+        operation, value = rate.split('=')
+        if float(value) <= 0:
+            raise ValueError(f'Rate of {operation.strip()} has to be positive, got {value.strip()}')
+        operation_rates[operation.strip()] = float(value)
+
+    return operation_rates
+
+
+class DynamoDBTokenBucket:
+    def __init__(self, table_name, dynamodb_client, key_prefix):
+        self.table_name = table_name
+        self.dynamodb_client = dynamodb_client
+        self.key_prefix = key_prefix
+        self.leased = {}
+        self.lock = threading.Lock()
+
+    def _lease(self, key, rate, tokens):
+        # A bucket below one request per second still has to hold a whole lease.
+        capacity = float(max(rate, tokens))
+
+        # Optimistic locking on UpdatedAt: whoever writes first wins, the
+        # others read the bucket again.
+        while True:
+            now = time.time()
+            item = self.dynamodb_client.get_item(
+                TableName=self.table_name, Key={'BucketKey': {'S': key}}, ConsistentRead=True
+            ).get('Item')
+
+            available = capacity
+            condition = {'ConditionExpression': 'attribute_not_exists(BucketKey)'}
+            if item:
+                updated_at = item['UpdatedAt']['N']
+                available = min(capacity, float(item['Tokens']['N']) + (now - float(updated_at)) * rate)
+                condition = {
+                    'ConditionExpression': 'UpdatedAt = :updated_at',
+                    'ExpressionAttributeValues': {':updated_at': {'N': updated_at}}
+                }
+
+            if available < tokens:
+                time.sleep((tokens - available) / rate)
+                continue
+
+            try:
+                self.dynamodb_client.put_item(
+                    TableName=self.table_name,
+                    Item={
+                        'BucketKey': {'S': key},
+                        'Tokens': {'N': repr(available - tokens)},
+                        'UpdatedAt': {'N': repr(now)}
+                    },
+                    **condition
+                )
+                return
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+
+    def acquire(self, operation, rate):
+        key = f'{self.key_prefix}:{operation}'
+
+        # Tokens are leased a few at a time, so most calls skip DynamoDB.
+        with self.lock:
+            if self.leased.get(key):
+                self.leased[key] -= 1
+                return
+
+        lease_size = max(1, min(SHARED_BUCKET_LEASE_SIZE, int(rate)))
+        self._lease(key, rate, lease_size)
+        with self.lock:
+            self.leased[key] = self.leased.get(key, 0) + lease_size - 1
+
+
+class ClientRateLimiter:
+    def __init__(self, operation_rates=None, shared_bucket=None):
+        self.operation_rates = operation_rates or dict(DEFAULT_OPERATION_RATES)
+        self.shared_bucket = shared_bucket
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_rate(self, operation):
+        return self.operation_rates.get(operation, DEFAULT_OPERATION_RATE)
+
+    def get_bucket(self, operation):
+        with self.lock:
+            if operation not in self.buckets:
+                rate = self.get_rate(operation)
+                # Rates below one request per second still need room for a whole request.
+                self.buckets[operation] = TokenBucket(rate, max(1, rate))
+
+            return self.buckets[operation]
+
+    def on_before_send(self, event_name, **kwargs):
+        # Fired for every HTTP attempt, paginated pages and retries included.
+        operation = event_name.rsplit('.', 1)[-1]
+        self.get_bucket(operation).acquire()
+        if self.shared_bucket:
+            self.shared_bucket.acquire(operation, self.get_rate(operation))
+
+    def on_needs_retry(self, event_name, response, attempts, **kwargs):
+        # A throttled response slows down every thread calling the operation,
+        # not only the one that was throttled.
+        if response and response[1].get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            operation = event_name.rsplit('.', 1)[-1]
+            self.get_bucket(operation).pause(
+                backoff_delay(attempts, THROTTLE_PAUSE_BASE_DELAY, THROTTLE_PAUSE_MAX_DELAY))
+
+    def attach(self, client):
+        service_id = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register(f'before-send.{service_id}', self.on_before_send)
+        client.meta.events.register(f'needs-retry.{service_id}', self.on_needs_retry)
+
+        return client
+
+
+def get_operation_rates():
+    return parse_operation_rates(os.environ.get('CLOUDFORMATION_RATE_LIMITS', ''))
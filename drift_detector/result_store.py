@@ -0,0 +1,106 @@
+import gzip
+import io
+import json
+import os
+import uuid
+from aws_clients import get_client
+from metrics import metrics
+
+# Asynchronous Lambda invocations accept payloads up to 256 KB.
+DEFAULT_INLINE_MAX_BYTES = 200 * 1024
+RESULT_KEY_PREFIX = 'results/'
+
+
+def get_inline_max_bytes():
+    return int(os.environ.get('RESULT_INLINE_MAX_BYTES', DEFAULT_INLINE_MAX_BYTES))
+
+
+def write_result(f, stacks, detection_failed_stacks):
+    # One JSON document per line, so the result can be read back one stack at a time.
+    for stack in stacks:
+        f.write(json.dumps({'stack': stack}, separators=(',', ':')) + '\n')
+    for stack in detection_failed_stacks:
+        f.write(json.dumps({'detection_failed_stack': stack}, separators=(',', ':')) + '\n')
+
+
+def read_result(f):
+    stacks = []
+    detection_failed_stacks = []
+    for line in f:
+        entry = json.loads(line)
+        if 'stack' in entry:
+            stacks.append(entry['stack'])
+        else:
+            detection_failed_stacks.append(entry['detection_failed_stack'])
+
+    return stacks, detection_failed_stacks
+
+
+class S3ResultStore:
+    def __init__(self, bucket, s3_client=None):
+        self.bucket = bucket
+        self.s3_client = s3_client or get_client('s3')
+
+    def put_result(self, key, stacks, detection_failed_stacks):
+        body = io.BytesIO()
+        with io.TextIOWrapper(gzip.GzipFile(fileobj=body, mode='wb'), encoding='utf-8') as f:
+            write_result(f, stacks, detection_failed_stacks)
+
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=body.getvalue(), ContentType='application/gzip')
+
+    def get_result(self, key):
+        # The object is decompressed and parsed while it is downloaded.
+        body = self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body']
+        with io.TextIOWrapper(gzip.GzipFile(fileobj=body, mode='rb'), encoding='utf-8') as f:
+            return read_result(f)
+
+
+class FileResultStore:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace('/', '_'))
+
+    def put_result(self, key, stacks, detection_failed_stacks):
+        with gzip.open(self._path(key), 'wt', encoding='utf-8') as f:
+            write_result(f, stacks, detection_failed_stacks)
+
+    def get_result(self, key):
+        with gzip.open(self._path(key), 'rt', encoding='utf-8') as f:
+            return read_result(f)
+
+
+def get_result_store():
+    if os.environ.get('RESULT_BUCKET'):
+        return S3ResultStore(os.environ['RESULT_BUCKET'])
+    elif os.environ.get('RESULT_DIR'):
+        return FileResultStore(os.environ['RESULT_DIR'])
+
+    return None
+
+
+def build_notification_payload(stacks, detection_failed_stacks, result_store=None):
+    payload = json.dumps({
+      "stacks": stacks,
+      "detection_failed_stacks": detection_failed_stacks
+    })
+    if result_store is None or len(payload.encode('utf-8')) <= get_inline_max_bytes():
+        return payload
+
+    # Large results don't fit an invoke payload, so only a pointer is sent.
+    key = f'{RESULT_KEY_PREFIX}{uuid.uuid4()}.jsonl.gz'
+    result_store.put_result(key, stacks, detection_failed_stacks)
+    metrics.add('ResultsOffloaded')
+
+    return json.dumps({"result_key": key})
+
+
+def load_notification_event(event, result_store=None):
+    if 'result_key' not in event:
+        return event
+
+    result_store = result_store or get_result_store()
+    stacks, detection_failed_stacks = result_store.get_result(event['result_key'])
+
+    return {"stacks": stacks, "detection_failed_stacks": detection_failed_stacks}
@@ -0,0 +1,51 @@
+import os
+import zlib
+
+MESSAGE_GROUP_ID = 'drift_detector'
+SHARD_KEYS = {
+    'stack': 'StackId',
+    'region': 'Region',
+    'account': 'AccountId',
+}
+
+
+def get_shard_count():
+    return max(1, int(os.environ.get('DETECTOR_SHARDS', 1)))
+
+
+def get_message_group_id(stack):
+    shard_count = get_shard_count()
+    if shard_count == 1:
+        return MESSAGE_GROUP_ID
+
+    # crc32 is stable across processes (unlike hash()), so a stack always
+    # lands in the same group and its detections never run in parallel.
+    # Region and AccountId are only set when Regions or TargetAccountRoles are
+    # configured; without them every stack would land in one group.
+    shard_key = stack.get(SHARD_KEYS[os.environ.get('SHARD_BY', 'stack')]) or stack['StackId']
+    shard = zlib.crc32(shard_key.encode('utf-8')) % shard_count
+
+    return f'{MESSAGE_GROUP_ID}_{shard}'
+
+
+def group_by_shard(stacks):
+    shards = {}
+    for stack in stacks:
+        shards.setdefault(get_message_group_id(stack), []).append(stack)
+
+    return shards
+
+
+def batched_by_shard(stacks, single_chunk_size):
+    shards = {}
+    for stack in stacks:
+        message_group_id = get_message_group_id(stack)
+        chunk = shards.setdefault(message_group_id, [])
+        chunk.append(stack)
+        if len(chunk) == single_chunk_size:
+            yield chunk
+            shards[message_group_id] = []
+
+    for chunk in shards.values():
+        if chunk:
+            yield chunk
@@ -1,7 +1,19 @@
-import requests
 import json
 import urllib.parse
 import os
+from drift_store import DETECTION_FAILED_FINGERPRINT, IN_SYNC_FINGERPRINT
+from drift_store import build_drift_record, get_drift_fingerprint, get_drift_store, get_drifted_resources
+from drift_store import get_fingerprint, merge_drifted_resources
+from metrics import metrics
+from result_store import load_notification_event
+from slack_sender import SlackWebhookSender, is_retryable_failure
+from utils import get_stack_name_from_id
+
+SLACK_MAX_BLOCKS = 50
+SLACK_MAX_MESSAGE_CHARS = 40000
+MAX_RESOURCE_BLOCKS_PER_STACK = 20
+
+_senders = {}
 
 
 def is_arn(physical_resource_id):
@@ -45,25 +57,36 @@ def get_emoji_for_status(status):
     return ''
 
 
-def get_stack_url(stack_id):
+def get_stack_url(stack_id, region=None):
+    if region:
+        return f'https://{region}.console.aws.amazon.com/cloudformation/home?region={region}' \
+               f'#/stacks/drifts?stackId={urllib.parse.quote(stack_id)}'
+
     return f'https://console.aws.amazon.com/cloudformation/home#/stacks/drifts?stackId={urllib.parse.quote(stack_id)}'
 
 
-def is_status_proper_to_check_drift(status):
-    return status in (
-        'CREATE_COMPLETE',
-        'UPDATE_COMPLETE',
-        'UPDATE_ROLLBACK_COMPLETE'
-    )
+def get_stack_label(stack):
+    stack_name = stack['StackName']
+    # Nested stacks are reported under the name of their root.
+    if stack.get('RootId'):
+        stack_name = f"{get_stack_name_from_id(stack['RootId'])} / {stack_name}"
+
+    if stack.get('AccountId'):
+        return f"{stack_name} ({stack['AccountId']})"
+
+    return stack_name
 
 
 def build_slack_message(stack):
-    stack_url = get_stack_url(stack['StackId'])
-    stack_name = stack['StackName']
+    stack_url = get_stack_url(stack['StackId'], stack.get('Region'))
+    stack_name = get_stack_label(stack)
 
     show_in_sync_resources = os.environ.get('SHOW_IN_SYNC', 'false')
 
-    if stack['no_of_drifted_resources'] > 0:
+    if 'RecheckedResources' in stack:
+        blocks = create_rechecked_stack_message_blocks(show_in_sync_resources, stack, stack_name, stack_url)
+
+    elif stack['no_of_drifted_resources'] > 0:
         blocks = create_drifted_stack_message_blocks(show_in_sync_resources, stack, stack_name, stack_url)
 
     else:
@@ -87,7 +110,7 @@ def create_not_drifted_stack_message_blocks(stack_name, stack_url):
 
 
 def create_drifted_stack_message_blocks(show_in_sync_resources, stack, stack_name, stack_url):
-    blocks = [{
+    return [{
         'type': 'section',
         'text': {
             'type': 'mrkdwn',
@@ -97,21 +120,61 @@ def create_drifted_stack_message_blocks(show_in_sync_resources, stack, stack_nam
         }
     }, {
         'type': 'divider',
+    }] + create_resource_blocks(show_in_sync_resources, stack)
+
+
+def create_rechecked_stack_message_blocks(show_in_sync_resources, stack, stack_name, stack_url):
+    # A re-check covers some resources only, so it never says the stack has no drift.
+    # With a drift store, the drifted resources left include those that were not re-checked.
+    no_of_drifted_resources = stack.get('no_of_stack_drifted_resources', stack['no_of_drifted_resources'])
+    blocks = [{
+        'type': 'section',
+        'text': {
+            'type': 'mrkdwn',
+            'text': f":arrows_counterclockwise: Re-checked {len(stack['RecheckedResources'])} resources at *<"
+                    + stack_url + '|' + stack_name
+                    + f'>*, {no_of_drifted_resources} still drifted'
+        }
     }]
 
-    for drift in stack['drift']:
-        if show_in_sync_resources == "false" and drift['StackResourceDriftStatus'] == 'IN_SYNC':
-            continue
+    if stack['no_of_drifted_resources'] > 0 or show_in_sync_resources != 'false':
+        blocks.append({
+            'type': 'divider',
+        })
+        blocks.extend(create_resource_blocks(show_in_sync_resources, stack))
+
+    return blocks
+
 
+def create_resource_blocks(show_in_sync_resources, stack):
+    blocks = []
+    resources = [
+        drift for drift in stack['drift']
+        if show_in_sync_resources != "false" or drift['StackResourceDriftStatus'] != 'IN_SYNC'
+    ]
+
+    for drift in resources[:MAX_RESOURCE_BLOCKS_PER_STACK]:
         blocks.append({
             "type": "section",
             "text": {
                 "type": "mrkdwn",
                 "text": ">" + get_emoji_for_status(drift['StackResourceDriftStatus'])
-                        + " *" + drift['PhysicalResourceId'] + "*\n>:small_orange_diamond: _"
+                        + " *" + drift.get('NestedStackName', drift['PhysicalResourceId'])
+                        + "*\n>:small_orange_diamond: _"
                         + drift['ResourceType'] + "_"
             },
         })
+
+    # Long resource lists are summarized, so a single stack never gets close
+    # to the Slack block limit.
+    if len(resources) > MAX_RESOURCE_BLOCKS_PER_STACK:
+        blocks.append({
+            'type': 'context',
+            'elements': [{
+                'type': 'mrkdwn',
+                'text': f'_...and {len(resources) - MAX_RESOURCE_BLOCKS_PER_STACK} more resources_'
+            }]
+        })
     blocks.append({
         'type': 'divider',
     })
@@ -120,8 +183,8 @@ def create_drifted_stack_message_blocks(show_in_sync_resources, stack, stack_nam
 
 
 def build_detection_failed_slack_message(detection_failed_stack):
-    stack_url = get_stack_url(detection_failed_stack['StackId'])
-    stack_name = detection_failed_stack['StackName']
+    stack_url = get_stack_url(detection_failed_stack['StackId'], detection_failed_stack.get('Region'))
+    stack_name = get_stack_label(detection_failed_stack)
 
     return {'blocks': [{
         'type': 'section',
@@ -134,32 +197,156 @@ def build_detection_failed_slack_message(detection_failed_stack):
     }]}
 
 
+def group_nested_stacks(stacks):
+    # Stacks of one nested stack tree are reported together, root first,
+    # in the order the trees first appear.
+    tree_order = {}
+    for stack in stacks:
+        tree_order.setdefault(stack.get('RootId') or stack['StackId'], len(tree_order))
+
+    return sorted(stacks, key=lambda stack: (tree_order[stack.get('RootId') or stack['StackId']], 'RootId' in stack))
+
+
+def pack_digest_messages(stacks, detection_failed_stacks):
+    packed_messages = []
+    blocks = []
+    blocks_chars = 0
+    stack_ids = []
+
+    stacks_blocks = [
+        (stack['StackId'], build_detection_failed_slack_message(stack)['blocks'])
+        for stack in detection_failed_stacks
+    ]
+    stacks_blocks.extend(
+        (stack['StackId'], build_slack_message(stack)['blocks']) for stack in group_nested_stacks(stacks))
+
+    # Stacks are packed in order and never split between messages.
+    for stack_id, stack_blocks in stacks_blocks:
+        stack_blocks_chars = len(json.dumps(stack_blocks))
+
+        if blocks and (len(blocks) + len(stack_blocks) > SLACK_MAX_BLOCKS
+                       or blocks_chars + stack_blocks_chars > SLACK_MAX_MESSAGE_CHARS):
+            packed_messages.append(({'blocks': blocks}, stack_ids))
+            blocks = []
+            blocks_chars = 0
+            stack_ids = []
+
+        blocks.extend(stack_blocks)
+        blocks_chars += stack_blocks_chars
+        stack_ids.append(stack_id)
+
+    if blocks:
+        packed_messages.append(({'blocks': blocks}, stack_ids))
+
+    return packed_messages
+
+
+def build_digest_messages(stacks, detection_failed_stacks):
+    return [message for message, _ in pack_digest_messages(stacks, detection_failed_stacks)]
+
+
+def get_sender(url):
+    # The sender and its HTTP session outlive the invocation, so warm
+    # containers reuse the pooled connection to Slack.
+    if url not in _senders:
+        _senders[url] = SlackWebhookSender(url)
+
+    return _senders[url]
+
+
+def get_stack_drift_state(stack, previous_record):
+    # Re-checked stacks are compared with what they would look like after a full detection.
+    if 'RecheckedResources' in stack:
+        drifted_resources = merge_drifted_resources(stack, previous_record)
+        stack['no_of_stack_drifted_resources'] = len(drifted_resources)
+        return get_fingerprint(drifted_resources.values()), drifted_resources
+
+    return get_drift_fingerprint(stack), get_drifted_resources(stack)
+
+
+def select_changed_stacks(stacks, detection_failed_stacks, drift_store):
+    previous_records = drift_store.get_records(
+        [stack['StackId'] for stack in stacks] + [stack['StackId'] for stack in detection_failed_stacks])
+    drift_states = {stack['StackId']: get_stack_drift_state(stack, previous_records.get(stack['StackId'], {}))
+                    for stack in stacks}
+    fingerprints = {stack_id: fingerprint for stack_id, (fingerprint, _) in drift_states.items()}
+    fingerprints.update((stack['StackId'], DETECTION_FAILED_FINGERPRINT) for stack in detection_failed_stacks)
+
+    # Stacks seen for the first time are compared against an in sync state,
+    # so only drifted or failed ones are reported on the first run.
+    changed_stack_ids = {
+        stack_id for stack_id, fingerprint in fingerprints.items()
+        if previous_records.get(stack_id, {}).get('Fingerprint', IN_SYNC_FINGERPRINT) != fingerprint
+    }
+
+    changed_stacks = [stack for stack in stacks if stack['StackId'] in changed_stack_ids]
+    changed_detection_failed_stacks = [
+        stack for stack in detection_failed_stacks if stack['StackId'] in changed_stack_ids
+    ]
+    # Every stack with results is recorded, so re-checks know its drifted resources.
+    records = [
+        build_drift_record(stack, *drift_states[stack['StackId']]) for stack in stacks
+    ] + [
+        build_drift_record(stack, DETECTION_FAILED_FINGERPRINT, {}) for stack in changed_detection_failed_stacks
+    ]
+
+    return changed_stacks, changed_detection_failed_stacks, records
+
+
 def post_to_slack(event):
     url = os.environ['SLACK_WEBHOOK']
     stacks = event.get("stacks")
     detection_failed_stacks = event.get("detection_failed_stacks")
 
-    headers = {
-        "Content-Type": "application/json"
-    }
+    drift_store = get_drift_store()
+    if drift_store:
+        stacks, detection_failed_stacks, records = select_changed_stacks(
+            stacks, detection_failed_stacks, drift_store)
 
-    for detection_failed_stack in detection_failed_stacks:
-        message = build_detection_failed_slack_message(detection_failed_stack)
-        requests.post(url, headers=headers, data=json.dumps(message))
+    packed_messages = pack_digest_messages(stacks, detection_failed_stacks)
+    with metrics.timer('SlackDeliveryTime'):
+        delivery_results = get_sender(url).send_all([message for message, _ in packed_messages])
 
-    for stack in stacks:
-        message = build_slack_message(stack)
-        requests.post(url, headers=headers, data=json.dumps(message))
+    delivered_stack_ids = set()
+    for (_, stack_ids), delivery_result in zip(packed_messages, delivery_results):
+        if delivery_result.delivered:
+            delivered_stack_ids.update(stack_ids)
+        else:
+            print(f'Failed to deliver Slack message for stacks: {stack_ids}, '
+                  f'status code: {delivery_result.status_code}, error: {delivery_result.error}')
+
+    metrics.add('SlackMessagesSent', sum(result.delivered for result in delivery_results))
+    metrics.add('SlackMessagesFailed', sum(not result.delivered for result in delivery_results))
+    metrics.add('SlackRetries', sum(result.attempts - 1 for result in delivery_results))
+    metrics.add('StacksNotified', len(delivered_stack_ids))
+
+    # Changed stacks are only saved once delivered, so the rest is reported again next time.
+    if drift_store:
+        posted_stack_ids = {stack['StackId'] for stack in stacks + detection_failed_stacks}
+        drift_store.put_records([
+            record for record in records
+            if record['StackId'] in delivered_stack_ids or record['StackId'] not in posted_stack_ids
+        ])
+
+    # A failed invocation is retried by Lambda. Only the drift store keeps
+    # delivered stacks from being posted again, and client errors would fail again.
+    if drift_store and any(is_retryable_failure(delivery_result) for delivery_result in delivery_results):
+        raise Exception('Failed to deliver some of the Slack messages')
+
+    return delivery_results
 
 
 def lambda_handler(event, context):
+    metrics.start('SlackNotification')
     try:
         print("Slack notification lambda")
 
-        post_to_slack(event)
+        post_to_slack(load_notification_event(event))
     except Exception as e:
         print("Unexpected error: %s" % e)
         raise
+    finally:
+        metrics.flush()
 
     return {
         "statusCode": 200,
@@ -0,0 +1,68 @@
+import json
+import time
+from collections import namedtuple
+import requests
+from requests.adapters import HTTPAdapter
+from utils import TokenBucket, backoff_delay
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8
+DEFAULT_RETRY_AFTER = 1
+# Slack allows about one message per second per webhook, with short bursts.
+MESSAGES_PER_SECOND = 1
+MESSAGES_BURST = 3
+
+DeliveryResult = namedtuple('DeliveryResult', ['delivered', 'status_code', 'attempts', 'error'])
+
+
+def is_retryable_failure(delivery_result):
+    # Connection errors, rate limits and server errors may succeed on a later attempt.
+    return not delivery_result.delivered and (
+        delivery_result.status_code is None or delivery_result.status_code == 429 or delivery_result.status_code >= 500
+    )
+
+
+class SlackWebhookSender:
+    def __init__(self, url, session=None):
+        self.url = url
+        self.session = session or requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.headers.update({
+            "Content-Type": "application/json"
+        })
+        self.token_bucket = TokenBucket(MESSAGES_PER_SECOND, MESSAGES_BURST)
+
+    def send(self, message):
+        data = json.dumps(message)
+        status_code = None
+        error = None
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.token_bucket.acquire()
+            try:
+                response = self.session.post(self.url, data=data, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                status_code, error = None, str(e)
+            else:
+                status_code, error = response.status_code, response.text
+                if response.ok:
+                    return DeliveryResult(True, status_code, attempt, None)
+
+                if status_code == 429:
+                    # Rate limited: wait as long as Slack asks before anyone sends again.
+                    self.token_bucket.pause(float(response.headers.get('Retry-After', DEFAULT_RETRY_AFTER)))
+                    continue
+
+                if status_code < 500:
+                    return DeliveryResult(False, status_code, attempt, error)
+
+            if attempt < MAX_ATTEMPTS:
+                time.sleep(backoff_delay(attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+
+        return DeliveryResult(False, status_code, MAX_ATTEMPTS, error)
+
+    def send_all(self, messages):
+        return [self.send(message) for message in messages]
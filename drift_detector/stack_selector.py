@@ -0,0 +1,92 @@
+import fnmatch
+import os
+import re
+
+DEFAULT_STACK_STATUSES = (
+    'CREATE_COMPLETE',
+    'UPDATE_COMPLETE',
+    'UPDATE_ROLLBACK_COMPLETE'
+)
+TAG_RULE_PREFIX = 'tag:'
+
+_selectors = {}
+
+
+def compile_globs(patterns):
+    # All patterns are joined into a single regex, so a stack is matched in one pass.
+    if not patterns:
+        return None
+
+    return re.compile('|'.join(f'(?:{fnmatch.translate(pattern)})' for pattern in patterns))
+
+
+class StackRules:
+    def __init__(self, rules):
+        name_patterns = []
+        tag_patterns = {}
+
+        # Rules look like "prod-*,tag:team=payments,tag:drift-check".
+        for rule in filter(None, (rule.strip() for rule in rules.split(','))):
+            if rule.startswith(TAG_RULE_PREFIX):
+                key, _, value = rule[len(TAG_RULE_PREFIX):].partition('=')
+                tag_patterns.setdefault(key, []).append(value or '*')
+            else:
+                name_patterns.append(rule)
+
+        self.name_regex = compile_globs(name_patterns)
+        self.tag_regexes = {key: compile_globs(values) for key, values in tag_patterns.items()}
+
+    def is_empty(self):
+        return self.name_regex is None and not self.tag_regexes
+
+    def matches(self, stack):
+        if self.name_regex and self.name_regex.match(stack['StackName']):
+            return True
+
+        if self.tag_regexes:
+            for tag in stack.get('Tags', ()):
+                tag_regex = self.tag_regexes.get(tag['Key'])
+                if tag_regex and tag_regex.match(tag['Value']):
+                    return True
+
+        return False
+
+
+class StackSelector:
+    def __init__(self, stack_regex='.*', include='', exclude='', statuses=DEFAULT_STACK_STATUSES):
+        self.stack_regex = re.compile(stack_regex)
+        self.include = StackRules(include)
+        self.exclude = StackRules(exclude)
+        self.include_all = self.include.is_empty()
+        self.statuses = frozenset(statuses)
+
+    def matches(self, stack):
+        # Cheapest checks first; most stacks are rejected by their status or name.
+        return stack['StackStatus'] in self.statuses \
+            and self.stack_regex.match(stack['StackName']) is not None \
+            and (self.include_all or self.include.matches(stack)) \
+            and not self.exclude.matches(stack)
+
+
+def parse_statuses(statuses):
+    return tuple(status.strip() for status in statuses.split(',') if status.strip()) or DEFAULT_STACK_STATUSES
+
+
+def get_stack_selector():
+    signature = (
+        os.environ.get('STACK_REGEX', '.*'),
+        os.environ.get('STACK_INCLUDE', ''),
+        os.environ.get('STACK_EXCLUDE', ''),
+        os.environ.get('STACK_STATUSES', '')
+    )
+
+    # Selectors are compiled once per container and configuration.
+    if signature not in _selectors:
+        stack_regex, include, exclude, statuses = signature
+        _selectors[signature] = StackSelector(stack_regex, include, exclude, parse_statuses(statuses))
+
+    return _selectors[signature]
+
+
+def is_status_proper_to_check_drift(status):
+    return status in get_stack_selector().statuses
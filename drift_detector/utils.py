@@ -1,3 +1,78 @@
+import random
+import threading
+import time
+
+THROTTLING_ERROR_CODES = (
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded'
+)
+
+
 def chunks(collection, single_chunk_size):
     for i in range(0, len(collection), single_chunk_size):
         yield collection[i:i + single_chunk_size]
+
+
+def get_stack_name_from_id(stack_id):
+    # Stack IDs look like arn:aws:cloudformation:region:account:stack/name/uuid.
+    resource = stack_id.split(':', 5)[-1].split('/')
+    if len(resource) == 3 and resource[0] == 'stack':
+        return resource[1]
+
+    return stack_id
+
+
+def is_drift_check_stale(stack, max_age, now):
+    drift_information = stack.get('DriftInformation', {})
+    last_check = drift_information.get('LastCheckTimestamp')
+
+    if drift_information.get('StackDriftStatus', 'NOT_CHECKED') == 'NOT_CHECKED' or last_check is None:
+        return True
+
+    last_update = stack.get('LastUpdatedTime', stack.get('CreationTime'))
+    if last_update is not None and last_update > last_check:
+        return True
+
+    return now - last_check > max_age
+
+
+def is_throttling_error(error):
+    return error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    # Full jitter: spreads retries of concurrent callers over the whole window.
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # Going into debt makes every caller wait until the pause is over.
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
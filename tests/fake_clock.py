@@ -0,0 +1,19 @@
+from unittest.mock import patch
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def install(self, test_case):
+        for patcher in [patch('time.monotonic', self.monotonic), patch('time.sleep', self.sleep)]:
+            patcher.start()
+            test_case.addCleanup(patcher.stop)
@@ -0,0 +1,38 @@
+import unittest
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.drift_detector import adjust_detection_window
+from drift_detector.drift_detector import DETECTION_WINDOW_MAX_SIZE
+from drift_detector.drift_detector import DETECTION_WINDOW_MIN_SIZE
+
+
+class TestAdjustDetectionWindow(unittest.TestCase):
+    def test_window_grows_without_throttling(self):
+        """
+        Test that window grows by one slot when there was no throttling
+        """
+        self.assertEqual(adjust_detection_window(3, False), 4)
+
+    def test_window_does_not_grow_over_max_size(self):
+        """
+        Test that window is capped at max size
+        """
+        self.assertEqual(adjust_detection_window(DETECTION_WINDOW_MAX_SIZE, False), DETECTION_WINDOW_MAX_SIZE)
+
+    def test_window_shrinks_on_throttling(self):
+        """
+        Test that window is halved when throttled
+        """
+        self.assertEqual(adjust_detection_window(8, True), 4)
+
+    def test_window_does_not_shrink_below_min_size(self):
+        """
+        Test that window never drops below min size
+        """
+        self.assertEqual(adjust_detection_window(DETECTION_WINDOW_MIN_SIZE, True), DETECTION_WINDOW_MIN_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,11 @@
 import unittest
+import os
 import sys
 
 sys.path.insert(0, './drift_detector')
 
 from unittest.mock import MagicMock
+from unittest.mock import Mock
 from drift_detector.drift_detector import append_drift_info
 
 
@@ -14,6 +16,10 @@ mock_cf_client = MockCFClient()
 
 
 class TestAppendDriftInfo(unittest.TestCase):
+    def tearDown(self):
+        os.environ['SHOW_IN_SYNC'] = 'false'
+        os.environ['SERVER_SIDE_DRIFT_FILTER'] = 'false'
+
     def test_append_drift_info_with_detected_drift(self):
         """
         Test that drift info is correctly appended for detected drift
@@ -30,6 +36,7 @@ class TestAppendDriftInfo(unittest.TestCase):
                 {
                     'StackResourceDriftStatus': 'MODIFIED',
                     'PhysicalResourceId': 'physical_resource_id',
+                    'LogicalResourceId': 'logical_resource_id',
                     'ResourceType': 'resource_type'
                 }
             ]
@@ -44,6 +51,7 @@ class TestAppendDriftInfo(unittest.TestCase):
                 'drift': [
                     {
                         'PhysicalResourceId': 'physical_resource_id',
+                        'LogicalResourceId': 'logical_resource_id',
                         'StackResourceDriftStatus': 'MODIFIED',
                         'ResourceType': 'resource_type'
                     }
@@ -53,6 +61,36 @@ class TestAppendDriftInfo(unittest.TestCase):
             }
         ], result)
 
+    def test_append_drift_info_attributes_nested_stacks(self):
+        """
+        Test that the resource of a nested stack is labeled with the name of that direct child
+        """
+        nested_stack_id = 'arn:aws:cloudformation:eu-west-1:123456789012:stack/app-db/uuid'
+        mock_stacks = [{'StackName': 'app', 'StackId': 'app_id'}]
+
+        mock_cf_client.describe_stack_resource_drifts = MagicMock(return_value={
+            'StackResourceDrifts': [
+                {
+                    'StackResourceDriftStatus': 'MODIFIED',
+                    'PhysicalResourceId': nested_stack_id,
+                    'LogicalResourceId': 'logical_resource_id',
+                    'ResourceType': 'AWS::CloudFormation::Stack'
+                }
+            ]
+        })
+
+        result = append_drift_info(mock_cf_client, mock_stacks)
+
+        self.assertEqual(result[0]['drift'], [
+            {
+                'PhysicalResourceId': 'app-db/uuid',
+                'LogicalResourceId': 'logical_resource_id',
+                'StackResourceDriftStatus': 'MODIFIED',
+                'ResourceType': 'AWS::CloudFormation::Stack',
+                'NestedStackName': 'app-db'
+            }
+        ])
+
     def test_append_drift_info_with_no_detected_drift(self):
         """
         Test that no drift is correctly appended
@@ -102,6 +140,81 @@ class TestAppendDriftInfo(unittest.TestCase):
             }
         ], stacks)
 
+    def test_append_drift_info_follows_pagination(self):
+        """
+        Test that drift entries from every page are appended
+        """
+        mock_stacks = [
+            {
+                'StackName': 'stack_name',
+                'StackId': 'stack_id'
+            }
+        ]
+
+        mock_cf_client.describe_stack_resource_drifts = Mock(side_effect=[
+            {
+                'StackResourceDrifts': [
+                    {
+                        'StackResourceDriftStatus': 'MODIFIED',
+                        'PhysicalResourceId': 'physical_resource_id_two',
+                        'LogicalResourceId': 'logical_resource_id',
+                        'ResourceType': 'resource_type'
+                    }
+                ],
+                'NextToken': 'next_token'
+            },
+            {
+                'StackResourceDrifts': [
+                    {
+                        'StackResourceDriftStatus': 'IN_SYNC',
+                        'PhysicalResourceId': 'physical_resource_id_one',
+                        'ResourceType': 'resource_type'
+                    }
+                ]
+            }
+        ])
+
+        stacks = append_drift_info(mock_cf_client, mock_stacks)
+
+        mock_cf_client.describe_stack_resource_drifts.assert_called_with(
+            StackName='stack_name', NextToken='next_token')
+        self.assertEqual(stacks[0]['no_of_resources'], 2)
+        self.assertEqual(stacks[0]['no_of_drifted_resources'], 1)
+        self.assertEqual(
+            [drift['PhysicalResourceId'] for drift in stacks[0]['drift']],
+            ['physical_resource_id_one', 'physical_resource_id_two']
+        )
+
+    def test_append_drift_info_filters_server_side(self):
+        """
+        Test that in sync resources are filtered out by CloudFormation when enabled
+        """
+        os.environ['SERVER_SIDE_DRIFT_FILTER'] = 'true'
+
+        mock_cf_client.describe_stack_resource_drifts = MagicMock(return_value={
+            'StackResourceDrifts': []
+        })
+
+        append_drift_info(mock_cf_client, [{'StackName': 'stack_name', 'StackId': 'stack_id'}])
+
+        mock_cf_client.describe_stack_resource_drifts.assert_called_once_with(
+            StackName='stack_name', StackResourceDriftStatusFilters=['DELETED', 'MODIFIED'])
+
+    def test_append_drift_info_keeps_stacks_order(self):
+        """
+        Test that stacks are returned in the order they were passed in
+        """
+        mock_stacks = [{'StackName': f'stack_name_{i}', 'StackId': f'stack_id_{i}'} for i in range(20)]
+
+        mock_cf_client.describe_stack_resource_drifts = MagicMock(return_value={
+            'StackResourceDrifts': []
+        })
+
+        stacks = append_drift_info(mock_cf_client, mock_stacks)
+
+        self.assertEqual([stack['StackId'] for stack in stacks], [f'stack_id_{i}' for i in range(20)])
+        self.assertEqual(mock_cf_client.describe_stack_resource_drifts.call_count, 20)
+
 
 if __name__ == '__main__':
     unittest.main()
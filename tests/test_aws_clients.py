@@ -0,0 +1,114 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+from datetime import datetime, timedelta, timezone
+from drift_detector import aws_clients
+from drift_detector.aws_clients import get_client, get_regions, get_session, get_target_account_roles
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+
+class TestAwsClients(unittest.TestCase):
+    def tearDown(self):
+        os.environ['REGIONS'] = ''
+        os.environ['TARGET_ACCOUNT_ROLES'] = ''
+        aws_clients._sessions.clear()
+
+    @patch('boto3.client')
+    def test_get_client_is_cached_per_region(self, mock_boto3_client):
+        """
+        Test that clients are created once per service and region
+        """
+        mock_boto3_client.side_effect = lambda service, region_name=None, config=None: MagicMock()
+
+        first_client = get_client('cloudformation', 'test-region-1')
+
+        self.assertIs(get_client('cloudformation', 'test-region-1'), first_client)
+        self.assertIsNot(get_client('cloudformation', 'test-region-2'), first_client)
+        self.assertEqual(mock_boto3_client.call_count, 2)
+
+    @patch('boto3.client')
+    def test_cloudformation_clients_share_rate_limiter(self, mock_boto3_client):
+        """
+        Test that CloudFormation clients use adaptive retries and one rate limiter per region
+        """
+        get_client('cloudformation', 'test-region-3')
+        get_client('sqs', 'test-region-3')
+
+        config = mock_boto3_client.call_args_list[0].kwargs['config']
+        self.assertEqual(config.retries, {'mode': 'adaptive', 'max_attempts': aws_clients.CLOUDFORMATION_MAX_ATTEMPTS})
+        self.assertIsNone(mock_boto3_client.call_args_list[1].kwargs['config'])
+        self.assertIs(aws_clients.get_rate_limiter('test-region-3', None),
+                      aws_clients.get_rate_limiter('test-region-3', None))
+
+    def test_get_regions_defaults_to_lambda_region(self):
+        """
+        Test that default region is used when no regions are configured
+        """
+        self.assertEqual(get_regions(), [None])
+
+    def test_get_regions_from_list(self):
+        """
+        Test that configured regions are returned
+        """
+        os.environ['REGIONS'] = 'eu-west-1, us-east-1'
+
+        self.assertEqual(get_regions(), ['eu-west-1', 'us-east-1'])
+
+    @patch('drift_detector.aws_clients.get_client')
+    def test_get_all_enabled_regions(self, mock_get_client):
+        """
+        Test that all enabled regions are returned
+        """
+        os.environ['REGIONS'] = 'all'
+        mock_get_client.return_value.describe_regions = MagicMock(return_value={
+            'Regions': [{'RegionName': 'us-east-1'}, {'RegionName': 'eu-west-1'}]
+        })
+
+        self.assertEqual(get_regions(), ['eu-west-1', 'us-east-1'])
+
+    def test_get_target_account_roles(self):
+        """
+        Test that configured role ARNs are returned, or the local account otherwise
+        """
+        self.assertEqual(get_target_account_roles(), [None])
+
+        os.environ['TARGET_ACCOUNT_ROLES'] = 'arn:aws:iam::111111111111:role/a,arn:aws:iam::222222222222:role/b'
+
+        self.assertEqual(get_target_account_roles(), [
+            'arn:aws:iam::111111111111:role/a',
+            'arn:aws:iam::222222222222:role/b'
+        ])
+
+    @patch('boto3.session.Session')
+    @patch('drift_detector.aws_clients.get_client')
+    def test_get_session_caches_credentials_until_expiration(self, mock_get_client, _):
+        """
+        Test that role is assumed once and again only when credentials are about to expire
+        """
+        role_arn = 'arn:aws:iam::111111111111:role/drift-detector'
+        expirations = [
+            datetime.now(timezone.utc) + timedelta(minutes=2),
+            datetime.now(timezone.utc) + timedelta(hours=1),
+        ]
+        mock_get_client.return_value.assume_role = MagicMock(side_effect=[{
+            'Credentials': {
+                'AccessKeyId': 'access_key_id',
+                'SecretAccessKey': 'secret_access_key',
+                'SessionToken': 'session_token',
+                'Expiration': expiration
+            }
+        } for expiration in expirations])
+
+        get_session(role_arn)
+        refreshed_session = get_session(role_arn)
+
+        self.assertIs(get_session(role_arn), refreshed_session)
+        self.assertEqual(mock_get_client.return_value.assume_role.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
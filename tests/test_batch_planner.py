@@ -0,0 +1,83 @@
+import unittest
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.batch_planner import estimate_stack_costs, plan_batches
+from drift_detector.batch_planner import DEFAULT_STACK_COST, SECONDS_PER_RESOURCE
+
+
+def make_stacks(count):
+    return [{'StackName': f'stack_name_{i}', 'StackId': f'stack_id_{i}'} for i in range(count)]
+
+
+class TestEstimateStackCosts(unittest.TestCase):
+    def test_prefers_measured_duration(self):
+        """
+        Test that a timed detection wins over the resource count
+        """
+        costs = estimate_stack_costs(make_stacks(2), {
+            'stack_id_0': {'DetectionSeconds': '42.5', 'ResourceCount': '10'},
+            'stack_id_1': {'ResourceCount': '10'}
+        })
+
+        self.assertEqual(costs, {'stack_id_0': 42.5, 'stack_id_1': 10 * SECONDS_PER_RESOURCE})
+
+    def test_unknown_stacks_cost_the_median(self):
+        """
+        Test that stacks without a record are assumed to be typical ones
+        """
+        costs = estimate_stack_costs(make_stacks(4), {
+            'stack_id_0': {'DetectionSeconds': '10'},
+            'stack_id_1': {'DetectionSeconds': '20'},
+            'stack_id_2': {'DetectionSeconds': '90'}
+        })
+
+        self.assertEqual(costs['stack_id_3'], 20)
+
+    def test_default_cost_without_records(self):
+        """
+        Test that the default cost is used when nothing is known
+        """
+        self.assertEqual(estimate_stack_costs(make_stacks(1), {}), {'stack_id_0': DEFAULT_STACK_COST})
+
+
+class TestPlanBatches(unittest.TestCase):
+    def test_balances_batch_costs(self):
+        """
+        Test that expensive stacks are spread over batches instead of chunked together
+        """
+        stacks = make_stacks(6)
+        costs = {'stack_id_0': 50, 'stack_id_1': 40, 'stack_id_2': 30,
+                 'stack_id_3': 5, 'stack_id_4': 4, 'stack_id_5': 1}
+
+        batches = plan_batches(stacks, costs, 3)
+
+        self.assertEqual([[s['StackId'] for s in batch] for batch in batches], [
+            ['stack_id_1', 'stack_id_2', 'stack_id_5'],
+            ['stack_id_0', 'stack_id_3', 'stack_id_4']
+        ])
+
+    def test_respects_batch_size(self):
+        """
+        Test that no batch gets more stacks than the batch size
+        """
+        stacks = make_stacks(10)
+        costs = {stack['StackId']: 100 if stack['StackId'] == 'stack_id_0' else 1 for stack in stacks}
+
+        batches = plan_batches(stacks, costs, 4)
+
+        self.assertEqual(sorted(len(batch) for batch in batches), [2, 4, 4])
+        self.assertEqual(sorted(s['StackId'] for batch in batches for s in batch),
+                         sorted(s['StackId'] for s in stacks))
+        self.assertEqual(batches[0][0]['StackId'], 'stack_id_0')
+
+    def test_no_stacks_no_batches(self):
+        """
+        Test that there is nothing to plan without stacks
+        """
+        self.assertEqual(plan_batches([], {}, 10), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
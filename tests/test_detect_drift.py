@@ -1,11 +1,18 @@
 import unittest
+import os
 import sys
 import json
 
 sys.path.insert(0, './drift_detector')
 
 from drift_detector.drift_detector import detect_drift
+from drift_detector.drift_detector import DRIFT_DETECTION_MAX_RETRIES
+from drift_detector.drift_detector import DetectionDeadlineExceeded
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta, timezone
+from tests.fake_clock import FakeClock
 from unittest.mock import MagicMock
+from unittest.mock import Mock
 
 
 class MockCFClient: pass
@@ -16,6 +23,10 @@ mock_cf_client = MockCFClient()
 
 class TestDetectDrift(unittest.TestCase):
     def setUp(self):
+        self.clock = FakeClock()
+        self.clock.install(self)
+        os.environ['POLL_JITTER'] = '0'
+        self.addCleanup(os.environ.pop, 'POLL_JITTER')
         mock_cf_client.detect_stack_drift = MagicMock(return_value={
             'StackDriftDetectionId': 42
         })
@@ -28,6 +39,7 @@ class TestDetectDrift(unittest.TestCase):
                 {
                     'StackResourceDriftStatus': 'MODIFIED',
                     'PhysicalResourceId': 'physical_resource_id',
+                    'LogicalResourceId': 'logical_resource_id',
                     'ResourceType': 'resource_type'
                 }
             ]
@@ -50,9 +62,11 @@ class TestDetectDrift(unittest.TestCase):
             {
                 'StackName': 'stack_name',
                 'StackId': 'stack_id',
+                'detection_seconds': 1.0,
                 'drift': [
                     {
                         'PhysicalResourceId': 'physical_resource_id',
+                        'LogicalResourceId': 'logical_resource_id',
                         'ResourceType': 'resource_type',
                         'StackResourceDriftStatus': 'MODIFIED',
                     },
@@ -94,6 +108,7 @@ class TestDetectDrift(unittest.TestCase):
             {
                 'StackName': 'stack_name',
                 'StackId': 'stack_id',
+                'detection_seconds': 1.0,
                 'drift': [
                     {
                         'PhysicalResourceId': 'physical_resource_id_one',
@@ -148,6 +163,7 @@ class TestDetectDrift(unittest.TestCase):
             {
                 'StackName': 'stack_name',
                 'StackId': 'stack_id',
+                'detection_seconds': 1.0,
                 'drift': [
                     {
                         'PhysicalResourceId': 'aaaaaaaa',
@@ -186,6 +202,7 @@ class TestDetectDrift(unittest.TestCase):
                 {
                     'StackResourceDriftStatus': 'MODIFIED',
                     'PhysicalResourceId': 'arn:aws:lambda:us-east-1:450349639042:function:serverless-housekeeping-gdrive-prod-stuff:4',
+                    'LogicalResourceId': 'logical_resource_id',
                     'ResourceType': 'resource_type',
                 },
             ],
@@ -197,9 +214,11 @@ class TestDetectDrift(unittest.TestCase):
             {
                 'StackName': 'stack_name',
                 'StackId': 'stack_id',
+                'detection_seconds': 1.0,
                 'drift': [
                     {
                         'PhysicalResourceId': 'serverless-housekeeping-gdrive-prod-stuff:4',
+                        'LogicalResourceId': 'logical_resource_id',
                         'ResourceType': 'resource_type',
                         'StackResourceDriftStatus': 'MODIFIED',
                     },
@@ -241,6 +260,7 @@ class TestDetectDrift(unittest.TestCase):
             {
                 'StackName': 'stack_name',
                 'StackId': 'stack_id',
+                'detection_seconds': 1.0,
                 'drift': [
                     {
                         'PhysicalResourceId': 'physical_resource_id_one',
@@ -258,6 +278,238 @@ class TestDetectDrift(unittest.TestCase):
             },
         ])
 
+    def test_detect_drift_starts_next_stack_when_slot_frees_up(self):
+        """
+        Test that a slow detection does not block the remaining stacks
+        """
+        mock_stacks = [{'StackName': f'stack_{i}', 'StackId': f'stack_id_{i}'} for i in range(5)]
+        polls_left = {'stack_id_0': 5}
+        started = []
+
+        def mock_detect_stack_drift(**kwargs):
+            started.append(kwargs['StackName'])
+            return {'StackDriftDetectionId': kwargs['StackName'].replace('stack_', 'stack_id_')}
+
+        def mock_describe_stack_drift_detection_status(**kwargs):
+            stack_id = kwargs['StackDriftDetectionId']
+            if polls_left.get(stack_id, 0) > 0:
+                polls_left[stack_id] -= 1
+                return {'StackId': stack_id, 'DetectionStatus': 'DETECTION_IN_PROGRESS'}
+            return {'StackId': stack_id, 'DetectionStatus': 'DETECTION_COMPLETE'}
+
+        mock_cf_client.detect_stack_drift = Mock(side_effect=mock_detect_stack_drift)
+        mock_cf_client.describe_stack_drift_detection_status = Mock(
+            side_effect=mock_describe_stack_drift_detection_status)
+
+        stacks, detection_failed_stacks = detect_drift(mock_cf_client, json.dumps(mock_stacks))
+
+        self.assertEqual([s['StackId'] for s in stacks], [s['StackId'] for s in mock_stacks])
+        self.assertEqual(detection_failed_stacks, [])
+        self.assertEqual(started, [s['StackName'] for s in mock_stacks])
+        self.assertEqual(polls_left['stack_id_0'], 0)
+
+    def test_detect_drift_retries_throttled_start(self):
+        """
+        Test that stacks are started again after CloudFormation throttling
+        """
+        mock_stacks = [
+            {
+                'StackName': 'stack_name',
+                'StackId': 'stack_id'
+            }
+        ]
+
+        mock_cf_client.detect_stack_drift = Mock(side_effect=[
+            ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'DetectStackDrift'),
+            {'StackDriftDetectionId': 42},
+        ])
+
+        stacks, detection_failed_stacks = detect_drift(mock_cf_client, json.dumps(mock_stacks))
+
+        self.assertEqual(mock_cf_client.detect_stack_drift.call_count, 2)
+        self.assertEqual([s['StackId'] for s in stacks], ['stack_id'])
+        self.assertEqual(detection_failed_stacks, [])
+
+    def test_detect_drift_gives_up_after_max_retries(self):
+        """
+        Test that stacks with failing detections are reported as failed
+        """
+        mock_stacks = [
+            {
+                'StackName': 'stack_name',
+                'StackId': 'stack_id'
+            }
+        ]
+
+        mock_cf_client.describe_stack_drift_detection_status = MagicMock(return_value={
+            'StackId': 'stack_id',
+            'DetectionStatus': 'DETECTION_FAILED',
+            'DetectionStatusReason': 'Fail reason'
+        })
+
+        stacks, detection_failed_stacks = detect_drift(mock_cf_client, json.dumps(mock_stacks))
+
+        self.assertEqual(stacks, [])
+        self.assertEqual(detection_failed_stacks, mock_stacks)
+        self.assertEqual(mock_cf_client.detect_stack_drift.call_count, DRIFT_DETECTION_MAX_RETRIES)
+
+    def test_detect_drift_checkpoints_at_deadline(self):
+        """
+        Test that stacks not finished before the deadline are saved in a checkpoint
+        """
+        mock_stacks = [{'StackName': f'stack_{i}', 'StackId': f'stack_id_{i}'} for i in range(12)]
+
+        def mock_detect_stack_drift(**kwargs):
+            return {'StackDriftDetectionId': kwargs['StackName'].replace('stack_', 'detection_id_')}
+
+        def mock_describe_stack_drift_detection_status(**kwargs):
+            stack_id = kwargs['StackDriftDetectionId'].replace('detection_id_', 'stack_id_')
+            if stack_id == 'stack_id_0':
+                return {'StackId': stack_id, 'DetectionStatus': 'DETECTION_IN_PROGRESS'}
+            return {'StackId': stack_id, 'DetectionStatus': 'DETECTION_COMPLETE'}
+
+        mock_cf_client.detect_stack_drift = Mock(side_effect=mock_detect_stack_drift)
+        mock_cf_client.describe_stack_drift_detection_status = Mock(
+            side_effect=mock_describe_stack_drift_detection_status)
+
+        with self.assertRaises(DetectionDeadlineExceeded) as context:
+            detect_drift(mock_cf_client, mock_stacks, deadline=1.5)
+
+        checkpoint = context.exception.checkpoint
+        self.assertEqual(checkpoint['stacks'], mock_stacks)
+        self.assertEqual(checkpoint['in_flight']['detection_id_0'], 'stack_id_0')
+        self.assertEqual(checkpoint['failed'], [])
+        self.assertTrue(checkpoint['complete'])
+        self.assertEqual(checkpoint['starts']['stack_id_0'], 1)
+        self.assertTrue(set(checkpoint['complete']).isdisjoint(checkpoint['in_flight'].values()))
+
+    def test_detect_drift_resumes_from_checkpoint(self):
+        """
+        Test that running detections from a checkpoint are polled instead of started again
+        """
+        mock_stacks = [{'StackName': f'stack_{i}', 'StackId': f'stack_id_{i}'} for i in range(3)]
+        checkpoint = {
+            'stacks': mock_stacks,
+            'complete': ['stack_id_1'],
+            'failed': [],
+            'in_flight': {'detection_id_0': 'stack_id_0'},
+            'starts': {'stack_id_0': 1, 'stack_id_1': 1}
+        }
+
+        mock_cf_client.detect_stack_drift = MagicMock(return_value={'StackDriftDetectionId': 'detection_id_2'})
+
+        stacks, detection_failed_stacks = detect_drift(mock_cf_client, json.dumps({'checkpoint': checkpoint}))
+
+        mock_cf_client.detect_stack_drift.assert_called_once_with(StackName='stack_2')
+        self.assertEqual([s['StackId'] for s in stacks], ['stack_id_0', 'stack_id_1', 'stack_id_2'])
+        self.assertEqual(detection_failed_stacks, [])
+
+    def test_detect_drift_reuses_recent_detection(self):
+        """
+        Test that stack with a recent detection is not detected again
+        """
+        os.environ['DETECTION_REUSE_MINUTES'] = '30'
+        self.addCleanup(os.environ.pop, 'DETECTION_REUSE_MINUTES')
+        now = datetime.now(timezone.utc)
+        mock_cf_client.describe_stacks = MagicMock()
+        mock_stacks = [{
+            'StackName': 'stack_name',
+            'StackId': 'stack_id',
+            'CreationTime': now - timedelta(days=1),
+            'DriftInformation': {
+                'StackDriftStatus': 'DRIFTED',
+                'LastCheckTimestamp': now - timedelta(minutes=5)
+            }
+        }]
+
+        stacks, detection_failed_stacks = detect_drift(mock_cf_client, json.dumps(mock_stacks, default=str))
+
+        mock_cf_client.describe_stacks.assert_not_called()
+        mock_cf_client.detect_stack_drift.assert_not_called()
+        self.assertEqual(stacks[0]['no_of_drifted_resources'], 1)
+        self.assertEqual(detection_failed_stacks, [])
+
+    def test_detect_drift_reuses_detection_that_was_in_progress(self):
+        """
+        Test that stack is described again after its detection was in progress, to reuse its result
+        """
+        os.environ['DETECTION_REUSE_MINUTES'] = '30'
+        self.addCleanup(os.environ.pop, 'DETECTION_REUSE_MINUTES')
+        now = datetime.now(timezone.utc)
+        mock_cf_client.detect_stack_drift = Mock(side_effect=ClientError({'Error': {
+            'Code': 'ValidationError',
+            'Message': 'Drift detection is already in progress for stack [stack_name]'
+        }}, 'DetectStackDrift'))
+        mock_cf_client.describe_stacks = MagicMock(return_value={'Stacks': [{
+            'StackName': 'stack_name',
+            'CreationTime': now - timedelta(days=1),
+            'DriftInformation': {'StackDriftStatus': 'IN_SYNC', 'LastCheckTimestamp': now}
+        }]})
+
+        stacks, detection_failed_stacks = detect_drift(
+            mock_cf_client, [{'StackName': 'stack_name', 'StackId': 'stack_id'}])
+
+        mock_cf_client.describe_stacks.assert_called_once_with(StackName='stack_id')
+        self.assertEqual(mock_cf_client.detect_stack_drift.call_count, 1)
+        self.assertEqual([s['StackId'] for s in stacks], ['stack_id'])
+        self.assertEqual(detection_failed_stacks, [])
+
+    def test_detect_drift_waits_for_detection_in_progress(self):
+        """
+        Test that stack already being detected is started again after a delay, not failed
+        """
+        mock_cf_client.detect_stack_drift = Mock(side_effect=[
+            ClientError({'Error': {
+                'Code': 'ValidationError',
+                'Message': 'Drift detection is already in progress for stack [stack_name]'
+            }}, 'DetectStackDrift'),
+            {'StackDriftDetectionId': 42},
+        ])
+
+        stacks, detection_failed_stacks = detect_drift(
+            mock_cf_client, [{'StackName': 'stack_name', 'StackId': 'stack_id'}])
+
+        self.assertEqual(mock_cf_client.detect_stack_drift.call_count, 2)
+        self.assertEqual([s['StackId'] for s in stacks], ['stack_id'])
+        self.assertEqual(detection_failed_stacks, [])
+        self.assertGreater(self.clock.now, 0)
+
+    def test_detect_drift_keeps_waiting_for_long_detection_in_progress(self):
+        """
+        Test that in progress rejections don't use up the starts of a stack
+        """
+        in_progress = ClientError({'Error': {
+            'Code': 'ValidationError',
+            'Message': 'Drift detection is already in progress for stack [stack_name]'
+        }}, 'DetectStackDrift')
+        rejections = DRIFT_DETECTION_MAX_RETRIES + 3
+        mock_cf_client.detect_stack_drift = Mock(side_effect=[in_progress] * rejections + [
+            {'StackDriftDetectionId': 42}
+        ])
+
+        stacks, detection_failed_stacks = detect_drift(
+            mock_cf_client, [{'StackName': 'stack_name', 'StackId': 'stack_id'}])
+
+        self.assertEqual(mock_cf_client.detect_stack_drift.call_count, rejections + 1)
+        self.assertEqual([s['StackId'] for s in stacks], ['stack_id'])
+        self.assertEqual(detection_failed_stacks, [])
+
+    def test_detect_drift_checkpoints_detection_in_progress_at_deadline(self):
+        """
+        Test that stack still rejected at the deadline is continued, not failed
+        """
+        mock_cf_client.detect_stack_drift = Mock(side_effect=ClientError({'Error': {
+            'Code': 'ValidationError',
+            'Message': 'Drift detection is already in progress for stack [stack_name]'
+        }}, 'DetectStackDrift'))
+
+        with self.assertRaises(DetectionDeadlineExceeded) as context:
+            detect_drift(mock_cf_client, [{'StackName': 'stack_name', 'StackId': 'stack_id'}], deadline=600)
+
+        self.assertGreater(mock_cf_client.detect_stack_drift.call_count, DRIFT_DETECTION_MAX_RETRIES)
+        self.assertEqual(context.exception.checkpoint['failed'], [])
+        self.assertEqual(context.exception.checkpoint['starts'], {})
+
 
 if __name__ == '__main__':
     unittest.main()
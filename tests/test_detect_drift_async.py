@@ -0,0 +1,223 @@
+import unittest
+import os
+import sys
+import json
+
+sys.path.insert(0, './drift_detector')
+
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta, timezone
+from drift_detector.drift_detector import detect_drift
+from drift_detector.drift_detector import DRIFT_DETECTION_MAX_RETRIES
+from drift_detector.drift_detector import DetectionDeadlineExceeded
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+from unittest.mock import patch
+
+
+class MockCFClient: pass
+
+
+mock_cf_client = MockCFClient()
+
+
+class TestDetectDriftAsync(unittest.TestCase):
+    def setUp(self):
+        os.environ['DETECTION_ENGINE'] = 'async'
+        os.environ['POLL_INITIAL_DELAY'] = '0'
+        self.events = []
+        self.polls_left = {'stack_id_0': 3}
+
+        def mock_detect_stack_drift(**kwargs):
+            self.events.append(('start', kwargs['StackName']))
+            return {'StackDriftDetectionId': kwargs['StackName'].replace('stack_', 'stack_id_')}
+
+        def mock_describe_stack_drift_detection_status(**kwargs):
+            stack_id = kwargs['StackDriftDetectionId']
+            if self.polls_left.get(stack_id, 0) > 0:
+                self.polls_left[stack_id] -= 1
+                return {'StackId': stack_id, 'DetectionStatus': 'DETECTION_IN_PROGRESS'}
+            self.events.append(('complete', stack_id))
+            return {'StackId': stack_id, 'DetectionStatus': 'DETECTION_COMPLETE'}
+
+        mock_cf_client.detect_stack_drift = Mock(side_effect=mock_detect_stack_drift)
+        mock_cf_client.describe_stack_drift_detection_status = Mock(
+            side_effect=mock_describe_stack_drift_detection_status)
+        mock_cf_client.describe_stack_resource_drifts = MagicMock(return_value={
+            'StackResourceDrifts': [
+                {
+                    'StackResourceDriftStatus': 'MODIFIED',
+                    'PhysicalResourceId': 'physical_resource_id',
+                    'LogicalResourceId': 'logical_resource_id',
+                    'ResourceType': 'resource_type'
+                }
+            ]
+        })
+
+    def tearDown(self):
+        os.environ['DETECTION_ENGINE'] = 'sync'
+        del os.environ['POLL_INITIAL_DELAY']
+
+    def test_detect_drift_async_overlaps_detections(self):
+        """
+        Test that all detections run at the same time and results keep the input order
+        """
+        mock_stacks = [{'StackName': f'stack_{i}', 'StackId': f'stack_id_{i}'} for i in range(3)]
+
+        stacks, detection_failed_stacks = detect_drift(mock_cf_client, json.dumps(mock_stacks))
+
+        self.assertEqual([stack['StackId'] for stack in stacks], ['stack_id_0', 'stack_id_1', 'stack_id_2'])
+        self.assertEqual(stacks[0]['no_of_drifted_resources'], 1)
+        self.assertEqual(detection_failed_stacks, [])
+        self.assertEqual(self.events.index(('complete', 'stack_id_0')), len(self.events) - 1)
+
+    def test_detect_drift_async_fetches_results_as_detections_complete(self):
+        """
+        Test that results of a finished stack are fetched while other stacks are still detecting
+        """
+        fetch = mock_cf_client.describe_stack_resource_drifts
+
+        def mock_describe_stack_resource_drifts(**kwargs):
+            self.events.append(('fetch', kwargs['StackName']))
+            return fetch.return_value
+
+        mock_cf_client.describe_stack_resource_drifts = Mock(side_effect=mock_describe_stack_resource_drifts)
+        mock_stacks = [{'StackName': f'stack_{i}', 'StackId': f'stack_id_{i}'} for i in range(2)]
+
+        stacks, _ = detect_drift(mock_cf_client, mock_stacks)
+
+        self.assertLess(self.events.index(('fetch', 'stack_1')), self.events.index(('complete', 'stack_id_0')))
+        self.assertEqual(mock_cf_client.describe_stack_resource_drifts.call_count, 2)
+        self.assertEqual([stack['no_of_drifted_resources'] for stack in stacks], [1, 1])
+
+    def test_detect_drift_async_retries_throttled_calls(self):
+        """
+        Test that throttled calls are retried
+        """
+        mock_cf_client.detect_stack_drift = Mock(side_effect=[
+            ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'DetectStackDrift'),
+            {'StackDriftDetectionId': 'stack_id_1'},
+        ])
+
+        with patch('drift_detector.drift_detector.THROTTLING_BASE_DELAY', 0):
+            stacks, detection_failed_stacks = detect_drift(
+                mock_cf_client, [{'StackName': 'stack_1', 'StackId': 'stack_id_1'}])
+
+        self.assertEqual([stack['StackId'] for stack in stacks], ['stack_id_1'])
+        self.assertEqual(mock_cf_client.detect_stack_drift.call_count, 2)
+
+    def test_detect_drift_async_reports_failed_detections(self):
+        """
+        Test that stacks with failing detections are reported as failed
+        """
+        mock_cf_client.describe_stack_drift_detection_status = MagicMock(return_value={
+            'StackId': 'stack_id',
+            'DetectionStatus': 'DETECTION_FAILED',
+            'DetectionStatusReason': 'Fail reason'
+        })
+        mock_stacks = [{'StackName': 'stack_name', 'StackId': 'stack_id'}]
+
+        stacks, detection_failed_stacks = detect_drift(mock_cf_client, mock_stacks)
+
+        self.assertEqual(stacks, [])
+        self.assertEqual(detection_failed_stacks, mock_stacks)
+        self.assertEqual(mock_cf_client.detect_stack_drift.call_count, DRIFT_DETECTION_MAX_RETRIES)
+
+    def test_detect_drift_async_checkpoints_at_deadline(self):
+        """
+        Test that running detections are saved in a checkpoint when the deadline is near
+        """
+        self.polls_left = {'stack_id_0': 1000}
+        mock_stacks = [{'StackName': f'stack_{i}', 'StackId': f'stack_id_{i}'} for i in range(2)]
+
+        with patch('time.monotonic', return_value=100):
+            with self.assertRaises(DetectionDeadlineExceeded) as context:
+                detect_drift(mock_cf_client, mock_stacks, deadline=100)
+
+        self.assertEqual(context.exception.checkpoint['in_flight'], {
+            'stack_id_0': 'stack_id_0',
+            'stack_id_1': 'stack_id_1'
+        })
+        self.assertEqual(context.exception.checkpoint['complete'], [])
+
+    def test_detect_drift_async_stops_retrying_throttled_calls_at_deadline(self):
+        """
+        Test that persistent throttling hands the stacks to a follow-up invocation
+        """
+        mock_cf_client.detect_stack_drift = Mock(side_effect=ClientError(
+            {'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'DetectStackDrift'))
+        mock_stacks = [{'StackName': 'stack_0', 'StackId': 'stack_id_0'}]
+
+        with patch('time.monotonic', return_value=100):
+            with self.assertRaises(DetectionDeadlineExceeded) as context:
+                detect_drift(mock_cf_client, mock_stacks, deadline=100)
+
+        self.assertEqual(mock_cf_client.detect_stack_drift.call_count, 1)
+        self.assertEqual(context.exception.checkpoint['in_flight'], {})
+        self.assertEqual(context.exception.checkpoint['failed'], [])
+
+    def test_detect_drift_async_resumes_from_checkpoint(self):
+        """
+        Test that running detections from a checkpoint are polled instead of started again
+        """
+        mock_stacks = [{'StackName': f'stack_{i}', 'StackId': f'stack_id_{i}'} for i in range(2)]
+        checkpoint = {
+            'stacks': mock_stacks,
+            'complete': [],
+            'failed': [],
+            'in_flight': {'stack_id_0': 'stack_id_0'},
+            'starts': {'stack_id_0': 1}
+        }
+
+        stacks, detection_failed_stacks = detect_drift(mock_cf_client, {'checkpoint': checkpoint})
+
+        mock_cf_client.detect_stack_drift.assert_called_once_with(StackName='stack_1')
+        self.assertEqual([stack['StackId'] for stack in stacks], ['stack_id_0', 'stack_id_1'])
+        self.assertEqual(detection_failed_stacks, [])
+
+    def test_detect_drift_async_reuses_recent_detection(self):
+        """
+        Test that stack with a recent detection is not detected again
+        """
+        os.environ['DETECTION_REUSE_MINUTES'] = '30'
+        self.addCleanup(os.environ.pop, 'DETECTION_REUSE_MINUTES')
+        now = datetime.now(timezone.utc)
+        mock_cf_client.describe_stacks = MagicMock()
+        mock_stacks = [{
+            'StackName': 'stack_1',
+            'StackId': 'stack_id_1',
+            'CreationTime': now - timedelta(days=1),
+            'DriftInformation': {
+                'StackDriftStatus': 'IN_SYNC',
+                'LastCheckTimestamp': now - timedelta(minutes=5)
+            }
+        }]
+
+        stacks, _ = detect_drift(mock_cf_client, json.dumps(mock_stacks, default=str))
+
+        mock_cf_client.describe_stacks.assert_not_called()
+        mock_cf_client.detect_stack_drift.assert_not_called()
+        self.assertEqual([stack['StackId'] for stack in stacks], ['stack_id_1'])
+
+    def test_detect_drift_async_keeps_waiting_for_long_detection_in_progress(self):
+        """
+        Test that in progress rejections don't use up the starts of a stack
+        """
+        in_progress = ClientError({'Error': {
+            'Code': 'ValidationError',
+            'Message': 'Drift detection is already in progress for stack [stack_0]'
+        }}, 'DetectStackDrift')
+        rejections = DRIFT_DETECTION_MAX_RETRIES + 3
+        mock_cf_client.detect_stack_drift = Mock(side_effect=[in_progress] * rejections + [
+            {'StackDriftDetectionId': 'stack_id_0'}
+        ])
+
+        stacks, detection_failed_stacks = detect_drift(mock_cf_client, [{'StackName': 'stack_0', 'StackId': 'stack_id_0'}])
+
+        self.assertEqual(mock_cf_client.detect_stack_drift.call_count, rejections + 1)
+        self.assertEqual([stack['StackId'] for stack in stacks], ['stack_id_0'])
+        self.assertEqual(detection_failed_stacks, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.detection_state import COMPLETE, FAILED, IN_PROGRESS, PENDING, RETRIED, DetectionState
+
+
+def make_stacks(count):
+    return [{'StackName': f'stack_name_{i}', 'StackId': f'stack_id_{i}'} for i in range(count)]
+
+
+class TestDetectionState(unittest.TestCase):
+    def test_partition_keeps_input_order(self):
+        """
+        Test that every stack lands in the bucket of its status, in input order
+        """
+        state = DetectionState(make_stacks(5))
+        state.start('stack_id_3', 'detection_id_3')
+        state.start('stack_id_1', 'detection_id_1')
+        state.complete('stack_id_3', 'detection_id_3')
+        state.complete('stack_id_1', 'detection_id_1')
+        state.fail('stack_id_0')
+        state.start('stack_id_4', 'detection_id_4')
+
+        partition = state.partition()
+
+        self.assertEqual([s['StackId'] for s in partition[COMPLETE]], ['stack_id_1', 'stack_id_3'])
+        self.assertEqual([s['StackId'] for s in partition[FAILED]], ['stack_id_0'])
+        self.assertEqual([s['StackId'] for s in partition[IN_PROGRESS]], ['stack_id_4'])
+        self.assertEqual([s['StackId'] for s in partition[PENDING]], ['stack_id_2'])
+        self.assertFalse(state.is_finished())
+
+    def test_retry_or_fail_counts_starts(self):
+        """
+        Test that a failed detection is retried until the stack runs out of starts
+        """
+        state = DetectionState(make_stacks(1))
+
+        state.start('stack_id_0', 'detection_id_0')
+        self.assertTrue(state.retry_or_fail('stack_id_0', 2, 'detection_id_0'))
+        self.assertEqual(state.status['stack_id_0'], RETRIED)
+        self.assertEqual(state.stacks_to_start(), make_stacks(1))
+
+        state.start('stack_id_0', 'detection_id_1')
+        self.assertFalse(state.retry_or_fail('stack_id_0', 2, 'detection_id_1'))
+        self.assertEqual(state.status['stack_id_0'], FAILED)
+        self.assertEqual(state.detections, {})
+        self.assertTrue(state.is_finished())
+
+    def test_checkpoint_round_trip(self):
+        """
+        Test that a checkpoint restores the status of every stack
+        """
+        state = DetectionState(make_stacks(4))
+        state.start('stack_id_0', 'detection_id_0')
+        state.complete('stack_id_0', 'detection_id_0')
+        state.start('stack_id_1', 'detection_id_1')
+        state.retry_or_fail('stack_id_1', 5, 'detection_id_1')
+        state.start('stack_id_2', 'detection_id_2')
+
+        checkpoint = state.to_checkpoint()
+        restored = DetectionState.from_checkpoint(checkpoint)
+
+        self.assertEqual(checkpoint['complete'], ['stack_id_0'])
+        self.assertEqual(checkpoint['in_flight'], {'detection_id_2': 'stack_id_2'})
+        self.assertEqual(restored.status, state.status)
+        self.assertEqual(restored.starts, state.starts)
+        self.assertEqual(restored.detections, state.detections)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.discover_stacks import discover_region_stacks
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+
+class TestDiscoverRegionStacks(unittest.TestCase):
+    @patch('drift_detector.discover_stacks.get_client')
+    def test_discover_region_stacks_tags_stacks_with_region(self, mock_get_client):
+        """
+        Test that stacks discovered in a region are queued with that region
+        """
+        mock_paginator = MagicMock()
+        mock_paginator.paginate = MagicMock(return_value=[
+            {
+                'Stacks': [
+                    {
+                        'StackName': 'hello-world-stack',
+                        'StackId': 'stack_id',
+                        'StackStatus': 'CREATE_COMPLETE',
+                    }
+                ]
+            }
+        ])
+        mock_get_client.return_value.get_paginator = MagicMock(return_value=mock_paginator)
+        mock_sqs_client = MagicMock()
+        mock_sqs_client.send_message_batch = MagicMock(return_value={'Successful': [], 'Failed': []})
+
+        discover_region_stacks('eu-west-1', False, mock_sqs_client, 'www.sqs-test.com', 10)
+
+        mock_get_client.assert_called_once_with('cloudformation', 'eu-west-1', None)
+        message_body = mock_sqs_client.send_message_batch.call_args[1]['Entries'][0]['MessageBody']
+        self.assertEqual(json.loads(message_body), [
+            {
+                'StackName': 'hello-world-stack',
+                'StackId': 'stack_id',
+                'Region': 'eu-west-1'
+            }
+        ])
+
+    @patch('drift_detector.discover_stacks.get_client')
+    def test_discover_region_stacks_tags_stacks_with_account(self, mock_get_client):
+        """
+        Test that stacks discovered through an assumed role are queued with its account
+        """
+        role_arn = 'arn:aws:iam::111111111111:role/drift-detector'
+        mock_paginator = MagicMock()
+        mock_paginator.paginate = MagicMock(return_value=[
+            {
+                'Stacks': [
+                    {
+                        'StackName': 'hello-world-stack',
+                        'StackId': 'stack_id',
+                        'StackStatus': 'CREATE_COMPLETE',
+                    }
+                ]
+            }
+        ])
+        mock_get_client.return_value.get_paginator = MagicMock(return_value=mock_paginator)
+        mock_sqs_client = MagicMock()
+        mock_sqs_client.send_message_batch = MagicMock(return_value={'Successful': [], 'Failed': []})
+
+        discover_region_stacks('eu-west-1', False, mock_sqs_client, 'www.sqs-test.com', 10, role_arn)
+
+        mock_get_client.assert_called_once_with('cloudformation', 'eu-west-1', role_arn)
+        message_body = mock_sqs_client.send_message_batch.call_args[1]['Entries'][0]['MessageBody']
+        self.assertEqual(json.loads(message_body), [
+            {
+                'StackName': 'hello-world-stack',
+                'StackId': 'stack_id',
+                'Region': 'eu-west-1',
+                'AccountId': '111111111111',
+                'RoleArn': role_arn
+            }
+        ])
+
+    @patch('drift_detector.discover_stacks.get_client')
+    def test_discover_region_stacks_balances_batches_by_cost(self, mock_get_client):
+        """
+        Test that weighted planning puts the expensive stacks into separate batches
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with open(os.path.join(directory.name, 'stack_costs.json'), 'w') as f:
+            json.dump({
+                'stack_id_0': {'StackId': 'stack_id_0', 'DetectionSeconds': '300'},
+                'stack_id_1': {'StackId': 'stack_id_1', 'DetectionSeconds': '200'},
+                'stack_id_2': {'StackId': 'stack_id_2', 'DetectionSeconds': '10'},
+                'stack_id_3': {'StackId': 'stack_id_3', 'DetectionSeconds': '20'},
+            }, f)
+        os.environ['BATCH_PLANNER'] = 'weighted'
+        os.environ['STACK_COST_FILE'] = os.path.join(directory.name, 'stack_costs.json')
+        self.addCleanup(os.environ.pop, 'BATCH_PLANNER')
+        self.addCleanup(os.environ.pop, 'STACK_COST_FILE')
+
+        mock_paginator = MagicMock()
+        mock_paginator.paginate = MagicMock(return_value=[{'Stacks': [
+            {'StackName': f'stack_name_{i}', 'StackId': f'stack_id_{i}', 'StackStatus': 'CREATE_COMPLETE'}
+            for i in range(4)
+        ]}])
+        mock_get_client.return_value.get_paginator = MagicMock(return_value=mock_paginator)
+        mock_sqs_client = MagicMock()
+        mock_sqs_client.send_message_batch = MagicMock(return_value={'Successful': [], 'Failed': []})
+
+        discover_region_stacks(None, False, mock_sqs_client, 'www.sqs-test.com', 2)
+
+        entries = mock_sqs_client.send_message_batch.call_args[1]['Entries']
+        self.assertEqual([[stack['StackId'] for stack in json.loads(entry['MessageBody'])] for entry in entries], [
+            ['stack_id_0', 'stack_id_2'],
+            ['stack_id_1', 'stack_id_3']
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
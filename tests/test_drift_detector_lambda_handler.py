@@ -0,0 +1,133 @@
+import unittest
+import os
+import sys
+import json
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.drift_detector import lambda_handler, DetectionDeadlineExceeded
+from drift_detector.sharding import get_message_group_id
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+MOCK_STACKS = [
+    {
+        'StackName': 'stack_name',
+        'StackId': 'stack_id',
+        'Region': 'eu-west-1'
+    }
+]
+
+
+class TestDriftDetectorLambdaHandler(unittest.TestCase):
+    def setUp(self):
+        os.environ['SLACK_NOTIFICATION_FUNCTION'] = 'slack-notification-function'
+        os.environ['DRIFT_DETECTION_QUEUE'] = 'www.sqs-test.com'
+        self.context = MagicMock()
+        self.context.get_remaining_time_in_millis = MagicMock(return_value=900000)
+
+    @patch('drift_detector.drift_detector.invoke_slack_notification_lambda')
+    @patch('drift_detector.drift_detector.detect_drift')
+    @patch('drift_detector.drift_detector.get_client')
+    def test_lambda_handler_notifies_slack(self, mock_get_client, mock_detect_drift, mock_invoke):
+        """
+        Test that detection results are sent to slack notification lambda
+        """
+        mock_detect_drift.return_value = (MOCK_STACKS, [])
+
+        lambda_handler({'Records': [{'body': json.dumps(MOCK_STACKS)}]}, self.context)
+
+        mock_get_client.assert_any_call('cloudformation', 'eu-west-1', None)
+        mock_invoke.assert_called_once()
+
+    @patch('drift_detector.drift_detector.invoke_slack_notification_lambda')
+    @patch('drift_detector.drift_detector.detect_drift')
+    @patch('drift_detector.drift_detector.get_client')
+    def test_lambda_handler_enqueues_continuation_at_deadline(self, mock_get_client, mock_detect_drift, mock_invoke):
+        """
+        Test that checkpoint is sent to the queue when the deadline is reached
+        """
+        checkpoint = {
+            'stacks': MOCK_STACKS,
+            'complete': [],
+            'failed': [],
+            'in_flight': {'detection_id': 'stack_id'},
+            'starts': {'stack_id': 1}
+        }
+        mock_detect_drift.side_effect = DetectionDeadlineExceeded(checkpoint)
+
+        result = lambda_handler({'Records': [{'body': json.dumps(MOCK_STACKS)}]}, self.context)
+
+        self.assertEqual(result['statusCode'], 200)
+        mock_invoke.assert_not_called()
+        send_message = mock_get_client.return_value.send_message
+        send_message.assert_called_once()
+        self.assertEqual(json.loads(send_message.call_args[1]['MessageBody']), {'checkpoint': checkpoint})
+
+    @patch('drift_detector.drift_detector.invoke_slack_notification_lambda')
+    @patch('drift_detector.drift_detector.detect_drift')
+    @patch('drift_detector.drift_detector.get_client')
+    def test_lambda_handler_accepts_continuation_message(self, mock_get_client, mock_detect_drift, mock_invoke):
+        """
+        Test that continuation message is passed to detection with the client of its region
+        """
+        payload = {'checkpoint': {
+            'stacks': MOCK_STACKS,
+            'complete': [],
+            'failed': [],
+            'in_flight': {'detection_id': 'stack_id'},
+            'starts': {'stack_id': 1}
+        }}
+        mock_detect_drift.return_value = (MOCK_STACKS, [])
+
+        lambda_handler({'Records': [{'body': json.dumps(payload)}]}, self.context)
+
+        mock_get_client.assert_any_call('cloudformation', 'eu-west-1', None)
+        self.assertEqual(mock_detect_drift.call_args[0][1], payload)
+
+
+    @patch('drift_detector.drift_detector.invoke_slack_notification_lambda')
+    @patch('drift_detector.drift_detector.get_drift_store')
+    @patch('drift_detector.drift_detector.get_client')
+    def test_lambda_handler_detects_stacks_without_resources_to_recheck(self, mock_get_client, mock_get_drift_store,
+                                                                       mock_invoke):
+        """
+        Test that re-check of a stack without drifted resources is sent to the queue as a full detection
+        """
+        mock_get_drift_store.return_value.get_records = MagicMock(return_value={})
+        payload = {'recheck': [dict(MOCK_STACKS[0], LogicalResourceIds=[])]}
+
+        lambda_handler({'Records': [{'body': json.dumps(payload)}]}, self.context)
+
+        mock_invoke.assert_not_called()
+        send_message = mock_get_client.return_value.send_message
+        send_message.assert_called_once()
+        self.assertEqual(json.loads(send_message.call_args[1]['MessageBody']), MOCK_STACKS)
+
+
+    @patch('drift_detector.drift_detector.invoke_slack_notification_lambda')
+    @patch('drift_detector.drift_detector.get_drift_store')
+    @patch('drift_detector.drift_detector.get_client')
+    def test_lambda_handler_sends_stacks_without_resources_to_recheck_to_their_shards(
+            self, mock_get_client, mock_get_drift_store, mock_invoke):
+        """
+        Test that stacks sent back for a full detection keep the message group of their shard
+        """
+        mock_get_drift_store.return_value.get_records = MagicMock(return_value={})
+        stacks = [dict(MOCK_STACKS[0], StackId=f'stack_id_{i}') for i in range(8)]
+
+        with patch.dict(os.environ, {'DETECTOR_SHARDS': '4'}):
+            lambda_handler({'Records': [{'body': json.dumps({'recheck': stacks})}]}, self.context)
+
+            send_message = mock_get_client.return_value.send_message
+            self.assertGreater(send_message.call_count, 1)
+            for call in send_message.call_args_list:
+                self.assertEqual(
+                    {get_message_group_id(stack) for stack in json.loads(call[1]['MessageBody'])},
+                    {call[1]['MessageGroupId']}
+                )
+            self.assertEqual(sum(len(json.loads(call[1]['MessageBody'])) for call in send_message.call_args_list), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.drift_store import DynamoDBDriftStore, FileDriftStore, get_drift_fingerprint
+from drift_detector.drift_store import build_drift_record, build_stack_cost_record, get_fingerprint
+from drift_detector.drift_store import load_drifted_resources, merge_drifted_resources, UNPROCESSED_MAX_ATTEMPTS
+from tests.fake_clock import FakeClock
+from unittest.mock import MagicMock
+
+MOCK_STACK = {
+    'StackId': 'stack_id',
+    'StackName': 'stack_name',
+    'drift': [
+        {
+            'PhysicalResourceId': 'physical_resource_id_1',
+            'ResourceType': 'AWS::S3::Bucket',
+            'StackResourceDriftStatus': 'IN_SYNC'
+        },
+        {
+            'PhysicalResourceId': 'physical_resource_id_2',
+            'LogicalResourceId': 'Method',
+            'ResourceType': 'AWS::ApiGateway::Method',
+            'StackResourceDriftStatus': 'MODIFIED'
+        },
+    ]
+}
+
+
+class TestDriftStore(unittest.TestCase):
+    def test_fingerprint_ignores_in_sync_resources(self):
+        """
+        Test that stack without drifted resources has an empty fingerprint
+        """
+        in_sync_stack = dict(MOCK_STACK, drift=MOCK_STACK['drift'][:1])
+
+        self.assertEqual(get_drift_fingerprint(in_sync_stack), '')
+        self.assertNotEqual(get_drift_fingerprint(MOCK_STACK), '')
+
+    def test_fingerprint_does_not_depend_on_order(self):
+        """
+        Test that fingerprint is the same for the same drift set
+        """
+        reversed_stack = dict(MOCK_STACK, drift=list(reversed(MOCK_STACK['drift'])))
+
+        self.assertEqual(get_drift_fingerprint(reversed_stack), get_drift_fingerprint(MOCK_STACK))
+
+    def test_drift_record_lists_drifted_resources(self):
+        """
+        Test that drift record keeps the logical IDs of drifted resources for re-checks
+        """
+        record = build_drift_record(MOCK_STACK, get_drift_fingerprint(MOCK_STACK))
+
+        self.assertEqual(load_drifted_resources(record), {
+            'Method': 'AWS::ApiGateway::Method|physical_resource_id_2|MODIFIED'
+        })
+        self.assertEqual(get_fingerprint(load_drifted_resources(record).values()), record['Fingerprint'])
+
+    def test_merge_keeps_resources_that_were_not_rechecked(self):
+        """
+        Test that re-check results replace only the re-checked resources of the previous record
+        """
+        previous_record = {'DriftedResources': '{"Bucket":"AWS::S3::Bucket|bucket|DELETED","Method":"old"}'}
+        rechecked_stack = dict(MOCK_STACK, RecheckedResources=['Method', 'Queue'])
+
+        self.assertEqual(merge_drifted_resources(rechecked_stack, previous_record), {
+            'Bucket': 'AWS::S3::Bucket|bucket|DELETED',
+            'Method': 'AWS::ApiGateway::Method|physical_resource_id_2|MODIFIED'
+        })
+
+    def test_file_store_round_trip(self):
+        """
+        Test that records saved to file store can be read back
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            drift_store = FileDriftStore(os.path.join(directory, 'drift_state.json'))
+
+            self.assertEqual(drift_store.get_records(['stack_id']), {})
+
+            drift_store.put_records([{'StackId': 'stack_id', 'StackName': 'stack_name', 'Fingerprint': 'abc'}])
+
+            self.assertEqual(drift_store.get_records(['stack_id', 'other_stack_id']), {
+                'stack_id': {'StackId': 'stack_id', 'StackName': 'stack_name', 'Fingerprint': 'abc'}
+            })
+
+    def test_dynamodb_store_retries_unprocessed_keys(self):
+        """
+        Test that DynamoDB store reads every record, including unprocessed keys
+        """
+        mock_dynamodb_client = MagicMock()
+        mock_dynamodb_client.batch_get_item = MagicMock(side_effect=[
+            {
+                'Responses': {'drift-state': [{'StackId': {'S': 'stack_id_1'}, 'Fingerprint': {'S': 'abc'}}]},
+                'UnprocessedKeys': {'drift-state': {'Keys': [{'StackId': {'S': 'stack_id_2'}}]}}
+            },
+            {
+                'Responses': {'drift-state': [{'StackId': {'S': 'stack_id_2'}, 'Fingerprint': {'S': ''}}]},
+                'UnprocessedKeys': {}
+            }
+        ])
+        drift_store = DynamoDBDriftStore('drift-state', mock_dynamodb_client)
+
+        self.assertEqual(drift_store.get_records(['stack_id_1', 'stack_id_2']), {
+            'stack_id_1': {'StackId': 'stack_id_1', 'Fingerprint': 'abc'},
+            'stack_id_2': {'StackId': 'stack_id_2', 'Fingerprint': ''},
+        })
+
+    def test_dynamodb_store_backs_off_and_gives_up_on_unprocessed_items(self):
+        """
+        Test that unprocessed items are sent again after a delay, a limited number of times
+        """
+        clock = FakeClock()
+        clock.install(self)
+        mock_dynamodb_client = MagicMock()
+        mock_dynamodb_client.batch_write_item = MagicMock(return_value={'UnprocessedItems': {'drift-state': [{}]}})
+        drift_store = DynamoDBDriftStore('drift-state', mock_dynamodb_client)
+
+        with self.assertRaises(Exception):
+            drift_store.put_records([{'StackId': 'stack_id', 'Fingerprint': ''}])
+
+        self.assertEqual(mock_dynamodb_client.batch_write_item.call_count, UNPROCESSED_MAX_ATTEMPTS)
+        self.assertEqual(len(clock.sleeps), UNPROCESSED_MAX_ATTEMPTS - 1)
+
+    def test_dynamodb_store_writes_in_batches(self):
+        """
+        Test that DynamoDB store writes records in batches of 25
+        """
+        mock_dynamodb_client = MagicMock()
+        mock_dynamodb_client.batch_write_item = MagicMock(return_value={'UnprocessedItems': {}})
+        drift_store = DynamoDBDriftStore('drift-state', mock_dynamodb_client)
+
+        drift_store.put_records([{'StackId': f'stack_id_{i}', 'Fingerprint': ''} for i in range(30)])
+
+        self.assertEqual(
+            [len(call[1]['RequestItems']['drift-state']) for call in mock_dynamodb_client.batch_write_item.call_args_list],
+            [25, 5]
+        )
+
+    def test_stack_cost_record(self):
+        """
+        Test that resource count is recorded only when all resources were fetched
+        """
+        stack = {'StackId': 'stack_id', 'StackName': 'stack_name', 'detection_seconds': 12.5, 'no_of_resources': 7}
+
+        record = build_stack_cost_record(stack)
+        filtered_record = build_stack_cost_record(stack, count_resources=False)
+
+        self.assertEqual((record['DetectionSeconds'], record['ResourceCount']), ('12.5', '7'))
+        self.assertNotIn('ResourceCount', filtered_record)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,9 @@ import sys
 
 sys.path.insert(0, './drift_detector')
 
+from datetime import datetime, timedelta, timezone
 from drift_detector.discover_stacks import find_stacks
+from drift_detector.discover_stacks import iter_stacks
 from unittest.mock import MagicMock
 
 
@@ -77,6 +79,65 @@ class TestFindStacks(unittest.TestCase):
 
         self.assertEqual(find_stacks(mock_cf_client), [])
 
+    def test_find_stacks_incremental_skips_fresh_stacks(self):
+        """
+        Test that incremental scan only returns stacks with stale drift check
+        """
+        now = datetime.now(timezone.utc)
+        fresh_stack = {
+            'StackName': 'fresh-stack',
+            'StackStatus': 'UPDATE_COMPLETE',
+            'CreationTime': now - timedelta(days=5),
+            'DriftInformation': {
+                'StackDriftStatus': 'IN_SYNC',
+                'LastCheckTimestamp': now - timedelta(hours=1)
+            }
+        }
+        stale_stack = {
+            'StackName': 'stale-stack',
+            'StackStatus': 'UPDATE_COMPLETE',
+            'CreationTime': now - timedelta(days=5),
+            'DriftInformation': {
+                'StackDriftStatus': 'IN_SYNC',
+                'LastCheckTimestamp': now - timedelta(days=2)
+            }
+        }
+        mock_paginator.paginate = MagicMock(return_value=[{'Stacks': [fresh_stack, stale_stack]}])
+
+        self.assertEqual(find_stacks(mock_cf_client, incremental=True), [stale_stack])
+        self.assertEqual(find_stacks(mock_cf_client), [fresh_stack, stale_stack])
+
+    def test_iter_stacks_yields_stacks_page_by_page(self):
+        """
+        Test that stacks are yielded before the next page is requested
+        """
+        fetched_pages = []
+
+        def paginate():
+            for page_no in range(3):
+                fetched_pages.append(page_no)
+                yield {'Stacks': [{'StackName': f'stack-{page_no}', 'StackStatus': 'CREATE_COMPLETE'}]}
+
+        mock_paginator.paginate = MagicMock(return_value=paginate())
+
+        stacks = iter_stacks(mock_cf_client)
+
+        self.assertEqual(next(stacks)['StackName'], 'stack-0')
+        self.assertEqual(fetched_pages, [0])
+
+    def test_find_stacks_keeps_nested_stacks(self):
+        """
+        Test that nested stacks are checked on their own, as drift detection does not cascade into them
+        """
+        os.environ['STACK_REGEX'] = 'app.*'
+        mock_paginator.paginate = MagicMock(return_value=[{'Stacks': [
+            {'StackName': 'app', 'StackId': 'app_id', 'StackStatus': 'CREATE_COMPLETE'},
+            {'StackName': 'app-db', 'StackId': 'app_db_id', 'StackStatus': 'CREATE_COMPLETE',
+             'ParentId': 'app_id', 'RootId': 'app_id'},
+        ]}])
+
+        self.assertEqual([stack['StackName'] for stack in find_stacks(mock_cf_client)], ['app', 'app-db'])
+
 
 if __name__ == '__main__':
     unittest.main()
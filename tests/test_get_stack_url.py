@@ -16,6 +16,15 @@ class TestGetStackUrl(unittest.TestCase):
             'https://console.aws.amazon.com/cloudformation/home#/stacks/drifts?stackId=42'
         )
 
+    def test_getting_valid_regional_stack_url(self):
+        """
+        Test that stack url points to the stack region
+        """
+        self.assertEqual(
+            get_stack_url('42', 'eu-west-1'),
+            'https://eu-west-1.console.aws.amazon.com/cloudformation/home?region=eu-west-1#/stacks/drifts?stackId=42'
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
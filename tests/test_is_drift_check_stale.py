@@ -0,0 +1,74 @@
+import unittest
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+from datetime import datetime, timedelta, timezone
+from drift_detector.discover_stacks import is_drift_check_stale
+
+NOW = datetime(2020, 1, 10, 12, 0, tzinfo=timezone.utc)
+MAX_AGE = timedelta(hours=24)
+
+
+class TestIsDriftCheckStale(unittest.TestCase):
+    def test_never_checked_stack_is_stale(self):
+        """
+        Test that stack without drift check is stale
+        """
+        stack = {
+            'StackName': 'stack_name',
+            'CreationTime': NOW - timedelta(days=3),
+            'DriftInformation': {'StackDriftStatus': 'NOT_CHECKED'}
+        }
+
+        self.assertTrue(is_drift_check_stale(stack, MAX_AGE, NOW))
+
+    def test_stack_updated_after_last_check_is_stale(self):
+        """
+        Test that stack updated since last drift check is stale
+        """
+        stack = {
+            'StackName': 'stack_name',
+            'LastUpdatedTime': NOW - timedelta(hours=1),
+            'DriftInformation': {
+                'StackDriftStatus': 'IN_SYNC',
+                'LastCheckTimestamp': NOW - timedelta(hours=2)
+            }
+        }
+
+        self.assertTrue(is_drift_check_stale(stack, MAX_AGE, NOW))
+
+    def test_stack_with_old_check_is_stale(self):
+        """
+        Test that stack with drift check older than max age is stale
+        """
+        stack = {
+            'StackName': 'stack_name',
+            'CreationTime': NOW - timedelta(days=10),
+            'DriftInformation': {
+                'StackDriftStatus': 'IN_SYNC',
+                'LastCheckTimestamp': NOW - timedelta(hours=25)
+            }
+        }
+
+        self.assertTrue(is_drift_check_stale(stack, MAX_AGE, NOW))
+
+    def test_stack_with_fresh_check_is_not_stale(self):
+        """
+        Test that unchanged stack with recent drift check is not stale
+        """
+        stack = {
+            'StackName': 'stack_name',
+            'CreationTime': NOW - timedelta(days=10),
+            'LastUpdatedTime': NOW - timedelta(days=2),
+            'DriftInformation': {
+                'StackDriftStatus': 'DRIFTED',
+                'LastCheckTimestamp': NOW - timedelta(hours=1)
+            }
+        }
+
+        self.assertFalse(is_drift_check_stale(stack, MAX_AGE, NOW))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, './drift_detector')
+
+import boto3
+from botocore.stub import Stubber
+from concurrent.futures import ThreadPoolExecutor
+from drift_detector.metrics import CurrentMetrics, Metrics, EMF_MAX_METRICS, UNIT_MILLISECONDS
+from drift_detector import metrics as metrics_module
+from drift_detector.metrics import instrument_client
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics_file = tempfile.NamedTemporaryFile(suffix='.log', delete=False).name
+        os.environ['METRICS_FILE'] = self.metrics_file
+
+    def tearDown(self):
+        del os.environ['METRICS_FILE']
+        os.remove(self.metrics_file)
+
+    def read_documents(self):
+        with open(self.metrics_file) as f:
+            return [json.loads(line) for line in f]
+
+    def test_flush_writes_emf_document(self):
+        """
+        Test that counters and timers are written as a single EMF document
+        """
+        metrics = Metrics()
+        metrics.start('DriftDetector')
+        metrics.add('StacksProcessed', 2)
+        metrics.add('StacksProcessed', 3)
+        with metrics.timer('DetectionTime'):
+            pass
+
+        metrics.flush()
+
+        documents = self.read_documents()
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(documents[0]['Function'], 'DriftDetector')
+        self.assertEqual(documents[0]['StacksProcessed'], 5)
+        self.assertGreaterEqual(documents[0]['DetectionTime'], 0)
+        emf = documents[0]['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(emf['Namespace'], 'DriftDetector')
+        self.assertEqual(emf['Dimensions'], [['Function']])
+        self.assertIn({'Name': 'DetectionTime', 'Unit': UNIT_MILLISECONDS}, emf['Metrics'])
+
+    def test_flush_resets_values(self):
+        """
+        Test that values are not reported twice
+        """
+        metrics = Metrics()
+        metrics.start('DriftDetector')
+        metrics.add('StacksProcessed')
+        metrics.flush()
+        metrics.flush()
+
+        self.assertEqual(len(self.read_documents()), 1)
+
+    def test_flush_splits_large_documents(self):
+        """
+        Test that no document has more metrics than CloudWatch accepts
+        """
+        metrics = Metrics()
+        metrics.start('DriftDetector')
+        for i in range(EMF_MAX_METRICS + 1):
+            metrics.add(f'Metric{i}')
+
+        metrics.flush()
+
+        documents = self.read_documents()
+        self.assertEqual([len(d['_aws']['CloudWatchMetrics'][0]['Metrics']) for d in documents],
+                         [EMF_MAX_METRICS, 1])
+
+    def test_instrument_client_counts_api_calls(self):
+        """
+        Test that calls made with an instrumented client are counted per operation
+        """
+        client = instrument_client(boto3.client('cloudformation', region_name='eu-west-1',
+                                                aws_access_key_id='key', aws_secret_access_key='secret'))
+        metrics_module.metrics.start('DriftDetector')
+
+        with Stubber(client) as stubber:
+            stubber.add_response('detect_stack_drift', {'StackDriftDetectionId': 'detection_id'})
+            stubber.add_response('detect_stack_drift', {'StackDriftDetectionId': 'detection_id'})
+            client.detect_stack_drift(StackName='stack_name')
+            client.detect_stack_drift(StackName='stack_name')
+
+        self.assertEqual(metrics_module.metrics.values['DetectStackDriftCalls'], 2)
+
+    def test_concurrent_handlers_keep_their_own_metrics(self):
+        """
+        Test that handlers running at the same time in one process don't reset each other's metrics
+        """
+        metrics = CurrentMetrics()
+        started = threading.Barrier(2)
+
+        def handler(function):
+            metrics.start(function)
+            started.wait()
+            with ThreadPoolExecutor(max_workers=2, initializer=metrics.bind, initargs=(metrics.current(),)) as executor:
+                list(executor.map(lambda _: metrics.add('StacksProcessed'), range(3)))
+            metrics.flush()
+
+        threads = [
+            threading.Thread(target=handler, args=(function,)) for function in ('DriftDetector', 'SlackNotification')
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        documents = self.read_documents()
+        self.assertEqual(sorted(document['Function'] for document in documents), ['DriftDetector', 'SlackNotification'])
+        self.assertEqual([document['StacksProcessed'] for document in documents], [3, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.polling import PollingPolicy, PollSchedule, get_deadline, DEADLINE_SAFETY_MARGIN
+from tests.fake_clock import FakeClock
+from unittest.mock import MagicMock
+
+
+class TestPolling(unittest.TestCase):
+    def test_delay_grows_exponentially_up_to_max(self):
+        """
+        Test that delay doubles with every attempt and is capped
+        """
+        polling_policy = PollingPolicy(initial_delay=1, max_delay=10, multiplier=2, jitter=0)
+
+        self.assertEqual([polling_policy.delay(attempt) for attempt in range(6)], [1, 2, 4, 8, 10, 10])
+
+    def test_delay_is_jittered_down(self):
+        """
+        Test that jitter never makes the delay longer than the backoff
+        """
+        polling_policy = PollingPolicy(initial_delay=4, max_delay=10, multiplier=2, jitter=0.5)
+
+        for _ in range(100):
+            self.assertTrue(2 <= polling_policy.delay(0) <= 4)
+
+    def test_schedule_returns_only_due_detections(self):
+        """
+        Test that each detection is polled on its own schedule
+        """
+        poll_schedule = PollSchedule(PollingPolicy(initial_delay=1, max_delay=30, jitter=0))
+        poll_schedule.add('slow', 0)
+        poll_schedule.add('fast', 0)
+        poll_schedule.polled('slow', 1)
+        poll_schedule.polled('slow', 3)
+
+        self.assertEqual(poll_schedule.due(1), ['fast'])
+        self.assertEqual(poll_schedule.wait_time(1), 0)
+        poll_schedule.remove('fast')
+        self.assertEqual(poll_schedule.wait_time(3), 4)
+        self.assertEqual(poll_schedule.due(7), ['slow'])
+
+    def test_get_deadline_from_lambda_context(self):
+        """
+        Test that deadline leaves a safety margin before the Lambda timeout
+        """
+        clock = FakeClock()
+        clock.install(self)
+        clock.now = 100
+        context = MagicMock()
+        context.get_remaining_time_in_millis = MagicMock(return_value=600000)
+
+        self.assertEqual(get_deadline(context), 100 + 600 - DEADLINE_SAFETY_MARGIN)
+        self.assertIsNone(get_deadline(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.drift_store import FileDriftStore
+from drift_detector.slack_notification import post_to_slack
+from drift_detector.slack_sender import DeliveryResult
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+DRIFTED_STACK = {
+    'StackId': 'drifted_stack_id',
+    'StackName': 'drifted_stack_name',
+    'drift': [
+        {
+            'PhysicalResourceId': 'physical_resource_id',
+            'ResourceType': 'AWS::ApiGateway::Method',
+            'StackResourceDriftStatus': 'MODIFIED'
+        },
+    ],
+    'no_of_drifted_resources': 1,
+    'no_of_resources': 1
+}
+
+
+class TestPostToSlack(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        os.environ['SLACK_WEBHOOK'] = 'https://hooks.slack.test/webhook'
+        os.environ['DRIFT_STATE_FILE'] = os.path.join(self.directory.name, 'drift_state.json')
+
+    def tearDown(self):
+        del os.environ['DRIFT_STATE_FILE']
+        self.directory.cleanup()
+
+    @patch('drift_detector.slack_notification.get_sender')
+    def test_post_to_slack_saves_delivered_stacks(self, mock_get_sender):
+        """
+        Test that drift state is saved once the message was delivered
+        """
+        mock_get_sender.return_value.send_all = MagicMock(return_value=[DeliveryResult(True, 200, 1, None)])
+
+        post_to_slack({'stacks': [DRIFTED_STACK], 'detection_failed_stacks': []})
+
+        drift_store = FileDriftStore(os.environ['DRIFT_STATE_FILE'])
+        self.assertIn('drifted_stack_id', drift_store.get_records(['drifted_stack_id']))
+
+    @patch('drift_detector.slack_notification.get_sender')
+    def test_post_to_slack_does_not_save_undelivered_stacks(self, mock_get_sender):
+        """
+        Test that undelivered stacks are not saved, so they are reported again
+        """
+        mock_get_sender.return_value.send_all = MagicMock(return_value=[DeliveryResult(False, 500, 5, 'error')])
+
+        with self.assertRaises(Exception):
+            post_to_slack({'stacks': [DRIFTED_STACK], 'detection_failed_stacks': []})
+
+        drift_store = FileDriftStore(os.environ['DRIFT_STATE_FILE'])
+        self.assertEqual(drift_store.get_records(['drifted_stack_id']), {})
+
+    @patch('drift_detector.slack_notification.get_sender')
+    def test_post_to_slack_does_not_retry_client_errors(self, mock_get_sender):
+        """
+        Test that a permanent failure is not raised, as a retry would fail again
+        """
+        mock_get_sender.return_value.send_all = MagicMock(return_value=[DeliveryResult(False, 404, 1, 'no_team')])
+
+        post_to_slack({'stacks': [DRIFTED_STACK], 'detection_failed_stacks': []})
+
+    @patch('drift_detector.slack_notification.get_sender')
+    def test_post_to_slack_without_drift_store_does_not_retry(self, mock_get_sender):
+        """
+        Test that a partial delivery is not retried when nothing records the delivered messages
+        """
+        mock_get_sender.return_value.send_all = MagicMock(return_value=[DeliveryResult(False, 500, 5, 'error')])
+
+        with patch.dict(os.environ):
+            del os.environ['DRIFT_STATE_FILE']
+            post_to_slack({'stacks': [DRIFTED_STACK], 'detection_failed_stacks': []})
+
+
+    @patch('drift_detector.slack_notification.get_sender')
+    def test_post_to_slack_reports_drift_left_after_recheck(self, mock_get_sender):
+        """
+        Test that re-check of some resources reports the drift of the resources that were not re-checked
+        """
+        send_all = mock_get_sender.return_value.send_all = MagicMock(return_value=[DeliveryResult(True, 200, 1, None)])
+        FileDriftStore(os.environ['DRIFT_STATE_FILE']).put_records([{
+            'StackId': 'drifted_stack_id',
+            'Fingerprint': 'abc',
+            'DriftedResources': json.dumps({
+                'Bucket': 'AWS::S3::Bucket|bucket|MODIFIED',
+                'Method': 'AWS::ApiGateway::Method|method|MODIFIED'
+            })
+        }])
+        rechecked_stack = dict(DRIFTED_STACK, RecheckedResources=['Method'], drift=[
+            dict(DRIFTED_STACK['drift'][0], StackResourceDriftStatus='IN_SYNC')
+        ], no_of_drifted_resources=0)
+
+        post_to_slack({'stacks': [rechecked_stack], 'detection_failed_stacks': []})
+
+        message_text = json.dumps(send_all.call_args[0][0])
+        self.assertNotIn('No drift detected', message_text)
+        self.assertIn('Re-checked 1 resources', message_text)
+        self.assertIn('1 still drifted', message_text)
+
+
+if __name__ == '__main__':
+    unittest.main()
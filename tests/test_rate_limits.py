@@ -0,0 +1,180 @@
+import unittest
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+from botocore.exceptions import ClientError
+from drift_detector.rate_limits import ClientRateLimiter, DynamoDBTokenBucket, parse_operation_rates
+from drift_detector.rate_limits import DEFAULT_OPERATION_RATES, SHARED_BUCKET_LEASE_SIZE
+from tests.fake_clock import FakeClock
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+THROTTLED_RESPONSE = (None, {'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}})
+
+
+class TestParseOperationRates(unittest.TestCase):
+    def test_overrides_default_rates(self):
+        """
+        Test that configured rates override the defaults only for the given operations
+        """
+        operation_rates = parse_operation_rates('DetectStackDrift=2, DescribeStacks = 5')
+
+        self.assertEqual(operation_rates['DetectStackDrift'], 2)
+        self.assertEqual(operation_rates['DescribeStacks'], 5)
+        self.assertEqual(operation_rates['DescribeStackDriftDetectionStatus'],
+                         DEFAULT_OPERATION_RATES['DescribeStackDriftDetectionStatus'])
+
+    def test_empty_rates_are_defaults(self):
+        """
+        Test that no configuration means the default rates
+        """
+        self.assertEqual(parse_operation_rates(''), DEFAULT_OPERATION_RATES)
+
+    def test_rejects_rates_that_are_not_positive(self):
+        """
+        Test that a zero or negative rate is a configuration error
+        """
+        with self.assertRaises(ValueError):
+            parse_operation_rates('DetectStackDrift=0')
+
+
+class TestClientRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.clock.install(self)
+
+    def test_requests_are_limited_per_operation(self):
+        """
+        Test that requests over the rate of an operation wait, other operations don't
+        """
+        rate_limiter = ClientRateLimiter({'DetectStackDrift': 2, 'DescribeStacks': 2})
+
+        for _ in range(3):
+            rate_limiter.on_before_send(event_name='before-send.cloudformation.DetectStackDrift')
+        rate_limiter.on_before_send(event_name='before-send.cloudformation.DescribeStacks')
+
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_fractional_rates_are_limited(self):
+        """
+        Test that an operation with less than one request per second is slowed down, not blocked
+        """
+        rate_limiter = ClientRateLimiter(parse_operation_rates('DetectStackDrift=0.5'))
+
+        for _ in range(3):
+            rate_limiter.on_before_send(event_name='before-send.cloudformation.DetectStackDrift')
+
+        self.assertEqual(self.clock.sleeps, [2.0, 2.0])
+
+    @patch('drift_detector.rate_limits.backoff_delay', return_value=3)
+    def test_throttled_response_pauses_operation(self, _):
+        """
+        Test that a throttled response makes the next request of the operation wait
+        """
+        rate_limiter = ClientRateLimiter({'DetectStackDrift': 2})
+
+        rate_limiter.on_needs_retry(
+            event_name='needs-retry.cloudformation.DetectStackDrift', response=THROTTLED_RESPONSE, attempts=1)
+        rate_limiter.on_before_send(event_name='before-send.cloudformation.DetectStackDrift')
+
+        self.assertEqual(sum(self.clock.sleeps), 3.5)
+
+    def test_other_errors_do_not_pause(self):
+        """
+        Test that only throttling slows the operation down
+        """
+        rate_limiter = ClientRateLimiter({'DetectStackDrift': 2})
+
+        rate_limiter.on_needs_retry(
+            event_name='needs-retry.cloudformation.DetectStackDrift',
+            response=(None, {'Error': {'Code': 'ValidationError'}}), attempts=1)
+        rate_limiter.on_needs_retry(
+            event_name='needs-retry.cloudformation.DetectStackDrift', response=None, attempts=1)
+        rate_limiter.on_before_send(event_name='before-send.cloudformation.DetectStackDrift')
+
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_shared_bucket_is_acquired(self):
+        """
+        Test that the shared budget is taken for every request
+        """
+        shared_bucket = MagicMock()
+        rate_limiter = ClientRateLimiter({'DetectStackDrift': 2}, shared_bucket)
+
+        rate_limiter.on_before_send(event_name='before-send.cloudformation.DetectStackDrift')
+
+        shared_bucket.acquire.assert_called_once_with('DetectStackDrift', 2)
+
+
+class TestDynamoDBTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.clock.install(self)
+        self.dynamodb_client = MagicMock()
+
+    def test_leases_tokens_from_new_bucket(self):
+        """
+        Test that a lease creates the bucket and later calls use the leased tokens
+        """
+        self.dynamodb_client.get_item = MagicMock(return_value={})
+        token_bucket = DynamoDBTokenBucket('table', self.dynamodb_client, 'account:region')
+
+        for _ in range(SHARED_BUCKET_LEASE_SIZE):
+            token_bucket.acquire('DescribeStacks', 10)
+
+        self.dynamodb_client.put_item.assert_called_once()
+        put_item_kwargs = self.dynamodb_client.put_item.call_args.kwargs
+        self.assertEqual(put_item_kwargs['Item']['BucketKey'], {'S': 'account:region:DescribeStacks'})
+        self.assertEqual(put_item_kwargs['Item']['Tokens'], {'N': repr(10.0 - SHARED_BUCKET_LEASE_SIZE)})
+        self.assertEqual(put_item_kwargs['ConditionExpression'], 'attribute_not_exists(BucketKey)')
+
+    @patch('time.time', return_value=100.0)
+    def test_waits_for_tokens_to_refill(self, _):
+        """
+        Test that an empty shared bucket is read again once enough tokens refill
+        """
+        item = {'Item': {'Tokens': {'N': '0'}, 'UpdatedAt': {'N': '100.0'}}}
+        refilled_item = {'Item': {'Tokens': {'N': '2'}, 'UpdatedAt': {'N': '100.0'}}}
+        self.dynamodb_client.get_item = MagicMock(side_effect=[item, refilled_item])
+        token_bucket = DynamoDBTokenBucket('table', self.dynamodb_client, 'account:region')
+
+        token_bucket.acquire('DetectStackDrift', 2)
+
+        self.assertEqual(self.clock.sleeps, [1.0])
+        put_item_kwargs = self.dynamodb_client.put_item.call_args.kwargs
+        self.assertEqual(put_item_kwargs['ExpressionAttributeValues'], {':updated_at': {'N': '100.0'}})
+
+    @patch('time.time', return_value=100.0)
+    def test_leases_fractional_rate(self, _):
+        """
+        Test that a shared bucket below one request per second refills to a whole lease
+        """
+        item = {'Item': {'Tokens': {'N': '0'}, 'UpdatedAt': {'N': '100.0'}}}
+        refilled_item = {'Item': {'Tokens': {'N': '1'}, 'UpdatedAt': {'N': '100.0'}}}
+        self.dynamodb_client.get_item = MagicMock(side_effect=[item, refilled_item])
+        token_bucket = DynamoDBTokenBucket('table', self.dynamodb_client, 'account:region')
+
+        token_bucket.acquire('DetectStackDrift', 0.5)
+
+        self.assertEqual(self.clock.sleeps, [2.0])
+        self.assertEqual(self.dynamodb_client.put_item.call_args.kwargs['Item']['Tokens'], {'N': '0.0'})
+
+    def test_retries_on_concurrent_update(self):
+        """
+        Test that losing a race with another Lambda reads the bucket again
+        """
+        self.dynamodb_client.get_item = MagicMock(return_value={})
+        self.dynamodb_client.put_item = MagicMock(side_effect=[
+            ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem'),
+            {}
+        ])
+        token_bucket = DynamoDBTokenBucket('table', self.dynamodb_client, 'account:region')
+
+        token_bucket.acquire('DetectStackDrift', 2)
+
+        self.assertEqual(self.dynamodb_client.get_item.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, './drift_detector')
+
+from botocore.exceptions import ClientError
+from drift_detector.drift_detector import recheck_drift
+from drift_detector.drift_store import FileDriftStore
+from unittest.mock import MagicMock
+
+
+class MockCFClient: pass
+
+
+def resource_drift(logical_resource_id, status):
+    return {'StackResourceDrift': {
+        'LogicalResourceId': logical_resource_id,
+        'PhysicalResourceId': f'{logical_resource_id.lower()}_physical_id',
+        'ResourceType': 'AWS::S3::Bucket',
+        'StackResourceDriftStatus': status
+    }}
+
+
+class TestRecheckDrift(unittest.TestCase):
+    def setUp(self):
+        self.cf_client = MockCFClient()
+        self.drifts = {'Bucket': resource_drift('Bucket', 'IN_SYNC'), 'Queue': resource_drift('Queue', 'MODIFIED')}
+        self.cf_client.detect_stack_resource_drift = MagicMock(
+            side_effect=lambda StackName, LogicalResourceId: self.drifts[LogicalResourceId])
+
+    def test_recheck_listed_resources(self):
+        """
+        Test that only the listed resources are checked and reported
+        """
+        stacks, detection_failed_stacks, _ = recheck_drift(self.cf_client, [
+            {'StackName': 'stack_name', 'StackId': 'stack_id', 'LogicalResourceIds': ['Bucket', 'Queue']}
+        ])
+
+        self.assertEqual(self.cf_client.detect_stack_resource_drift.call_count, 2)
+        self.assertEqual(detection_failed_stacks, [])
+        self.assertEqual(stacks[0]['no_of_drifted_resources'], 1)
+        self.assertEqual(stacks[0]['drift'], [
+            {
+                'PhysicalResourceId': 'bucket_physical_id',
+                'StackResourceDriftStatus': 'IN_SYNC',
+                'ResourceType': 'AWS::S3::Bucket'
+            },
+            {
+                'PhysicalResourceId': 'queue_physical_id',
+                'StackResourceDriftStatus': 'MODIFIED',
+                'ResourceType': 'AWS::S3::Bucket',
+                'LogicalResourceId': 'Queue'
+            }
+        ])
+
+    def test_recheck_previously_drifted_resources(self):
+        """
+        Test that resources drifted in the last report are re-checked by default
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            drift_store = FileDriftStore(os.path.join(directory, 'drift_state.json'))
+            drift_store.put_records([{'StackId': 'stack_id', 'Fingerprint': 'abc',
+                                       'DriftedResources': '{"Queue":"AWS::SQS::Queue|queue_physical_id|MODIFIED"}'}])
+
+            stacks, _, _ = recheck_drift(self.cf_client, [{'StackName': 'stack_name', 'StackId': 'stack_id'}], drift_store)
+
+        self.cf_client.detect_stack_resource_drift.assert_called_once_with(
+            StackName='stack_name', LogicalResourceId='Queue')
+        self.assertEqual(stacks[0]['no_of_drifted_resources'], 1)
+        self.assertEqual(stacks[0]['RecheckedResources'], ['Queue'])
+
+    def test_recheck_returns_stacks_without_drifted_resources_unchecked(self):
+        """
+        Test that stack without a record is not reported in sync, as nothing was checked
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            drift_store = FileDriftStore(os.path.join(directory, 'drift_state.json'))
+
+            stacks, detection_failed_stacks, unchecked_stacks = recheck_drift(
+                self.cf_client, [{'StackName': 'stack_name', 'StackId': 'stack_id'}], drift_store)
+
+        self.cf_client.detect_stack_resource_drift.assert_not_called()
+        self.assertEqual(stacks, [])
+        self.assertEqual(detection_failed_stacks, [])
+        self.assertEqual([stack['StackId'] for stack in unchecked_stacks], ['stack_id'])
+
+    def test_recheck_skips_removed_resources_and_reports_failures(self):
+        """
+        Test that removed resources are dropped and failed checks fail their stack
+        """
+        def detect_stack_resource_drift(StackName, LogicalResourceId):
+            if StackName == 'failed_stack_name':
+                raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Denied'}}, 'DetectStackResourceDrift')
+            raise ClientError({'Error': {'Code': 'ValidationError',
+                                         'Message': f'Resource {LogicalResourceId} does not exist for stack'}},
+                              'DetectStackResourceDrift')
+
+        self.cf_client.detect_stack_resource_drift = MagicMock(side_effect=detect_stack_resource_drift)
+
+        stacks, detection_failed_stacks, _ = recheck_drift(self.cf_client, [
+            {'StackName': 'stack_name', 'StackId': 'stack_id', 'LogicalResourceIds': ['Queue']},
+            {'StackName': 'failed_stack_name', 'StackId': 'failed_stack_id', 'LogicalResourceIds': ['Queue']}
+        ])
+
+        self.assertEqual([stack['StackId'] for stack in stacks], ['stack_id'])
+        self.assertEqual(stacks[0]['drift'], [])
+        self.assertEqual([stack['StackId'] for stack in detection_failed_stacks], ['failed_stack_id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, './drift_detector')
+
+import boto3
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from unittest.mock import MagicMock
+from drift_detector.result_store import FileResultStore, S3ResultStore
+from drift_detector.result_store import build_notification_payload, load_notification_event
+
+STACKS = [{
+    'StackName': 'stack_name',
+    'StackId': 'stack_id',
+    'drift': [{'PhysicalResourceId': 'queue', 'StackResourceDriftStatus': 'MODIFIED'}] * 50
+}]
+DETECTION_FAILED_STACKS = [{'StackName': 'failed_stack_name', 'StackId': 'failed_stack_id'}]
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.result_store = FileResultStore(self.directory.name)
+        os.environ['RESULT_INLINE_MAX_BYTES'] = '1000'
+
+    def tearDown(self):
+        del os.environ['RESULT_INLINE_MAX_BYTES']
+        self.directory.cleanup()
+
+    def test_small_payload_stays_inline(self):
+        """
+        Test that small results are sent in the invoke payload
+        """
+        payload = json.loads(build_notification_payload(STACKS[:0], DETECTION_FAILED_STACKS, self.result_store))
+
+        self.assertEqual(payload, {'stacks': [], 'detection_failed_stacks': DETECTION_FAILED_STACKS})
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_large_payload_is_offloaded(self):
+        """
+        Test that large results are stored and read back through a pointer
+        """
+        payload = build_notification_payload(STACKS, DETECTION_FAILED_STACKS, self.result_store)
+
+        self.assertLess(len(payload), 100)
+        self.assertEqual(load_notification_event(json.loads(payload), self.result_store), {
+            'stacks': STACKS,
+            'detection_failed_stacks': DETECTION_FAILED_STACKS
+        })
+
+    def test_s3_result_is_compressed(self):
+        """
+        Test that results are stored in S3 as gzipped JSON lines
+        """
+        s3_client = MagicMock()
+
+        S3ResultStore('bucket', s3_client).put_result('results/key.jsonl.gz', STACKS, DETECTION_FAILED_STACKS)
+
+        kwargs = s3_client.put_object.call_args[1]
+        self.assertEqual((kwargs['Bucket'], kwargs['Key']), ('bucket', 'results/key.jsonl.gz'))
+        lines = gzip.decompress(kwargs['Body']).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'stack': STACKS[0]},
+            {'detection_failed_stack': DETECTION_FAILED_STACKS[0]}
+        ])
+
+    def test_s3_result_is_streamed(self):
+        """
+        Test that a gzipped S3 object is read back stack by stack
+        """
+        s3_client = boto3.client('s3', region_name='eu-west-1',
+                                 aws_access_key_id='key', aws_secret_access_key='secret')
+        data = io.BytesIO()
+        with gzip.open(data, 'wt') as f:
+            f.write(json.dumps({'stack': STACKS[0]}) + '\n')
+            f.write(json.dumps({'detection_failed_stack': DETECTION_FAILED_STACKS[0]}) + '\n')
+        data = data.getvalue()
+
+        with Stubber(s3_client) as stubber:
+            stubber.add_response('get_object', {'Body': StreamingBody(io.BytesIO(data), len(data))},
+                                 {'Bucket': 'bucket', 'Key': 'results/key.jsonl.gz'})
+            result = S3ResultStore('bucket', s3_client).get_result('results/key.jsonl.gz')
+
+        self.assertEqual(result, (STACKS, DETECTION_FAILED_STACKS))
+
+
+if __name__ == '__main__':
+    unittest.main()
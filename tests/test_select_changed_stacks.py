@@ -0,0 +1,124 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.drift_store import FileDriftStore
+from drift_detector.slack_notification import select_changed_stacks
+
+IN_SYNC_STACK = {
+    'StackId': 'in_sync_stack_id',
+    'StackName': 'in_sync_stack_name',
+    'drift': [
+        {
+            'PhysicalResourceId': 'physical_resource_id_1',
+            'ResourceType': 'AWS::S3::Bucket',
+            'StackResourceDriftStatus': 'IN_SYNC'
+        },
+    ]
+}
+
+DRIFTED_STACK = {
+    'StackId': 'drifted_stack_id',
+    'StackName': 'drifted_stack_name',
+    'drift': [
+        {
+            'PhysicalResourceId': 'physical_resource_id_2',
+            'LogicalResourceId': 'Method',
+            'ResourceType': 'AWS::ApiGateway::Method',
+            'StackResourceDriftStatus': 'MODIFIED'
+        },
+        {
+            'PhysicalResourceId': 'physical_resource_id_3',
+            'LogicalResourceId': 'Queue',
+            'ResourceType': 'AWS::SQS::Queue',
+            'StackResourceDriftStatus': 'DELETED'
+        },
+    ]
+}
+
+FAILED_STACK = {
+    'StackId': 'failed_stack_id',
+    'StackName': 'failed_stack_name'
+}
+
+
+class TestSelectChangedStacks(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.drift_store = FileDriftStore(os.path.join(self.directory.name, 'drift_state.json'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def select_and_save(self, stacks, detection_failed_stacks):
+        stacks, detection_failed_stacks, records = select_changed_stacks(
+            stacks, detection_failed_stacks, self.drift_store)
+        self.drift_store.put_records(records)
+
+        return stacks, detection_failed_stacks
+
+    def test_first_run_reports_drifted_and_failed_stacks_only(self):
+        """
+        Test that new stacks are reported only when drifted or failed
+        """
+        stacks, detection_failed_stacks = self.select_and_save([IN_SYNC_STACK, DRIFTED_STACK], [FAILED_STACK])
+
+        self.assertEqual(stacks, [DRIFTED_STACK])
+        self.assertEqual(detection_failed_stacks, [FAILED_STACK])
+
+    def test_unchanged_stacks_are_not_reported_again(self):
+        """
+        Test that stacks with the same drift set are not reported again
+        """
+        self.select_and_save([IN_SYNC_STACK, DRIFTED_STACK], [FAILED_STACK])
+
+        stacks, detection_failed_stacks = self.select_and_save([IN_SYNC_STACK, DRIFTED_STACK], [FAILED_STACK])
+
+        self.assertEqual(stacks, [])
+        self.assertEqual(detection_failed_stacks, [])
+
+    def test_resolved_drift_is_reported(self):
+        """
+        Test that stack which got back in sync is reported
+        """
+        self.select_and_save([DRIFTED_STACK], [])
+        resolved_stack = dict(DRIFTED_STACK, drift=[
+            dict(drift, StackResourceDriftStatus='IN_SYNC') for drift in DRIFTED_STACK['drift']
+        ])
+
+        stacks, _ = self.select_and_save([resolved_stack], [])
+
+        self.assertEqual(stacks, [resolved_stack])
+
+    def test_unchanged_stacks_are_recorded(self):
+        """
+        Test that stacks which are not reported still get a record
+        """
+        self.select_and_save([IN_SYNC_STACK], [])
+
+        self.assertEqual(self.drift_store.get_records(['in_sync_stack_id'])['in_sync_stack_id']['DriftedResources'], '{}')
+
+    def test_recheck_is_merged_into_previous_record(self):
+        """
+        Test that re-checked resources don't hide the drift of resources that were not re-checked
+        """
+        self.select_and_save([DRIFTED_STACK], [])
+        rechecked_stack = dict(DRIFTED_STACK, RecheckedResources=['Method'], drift=[
+            dict(DRIFTED_STACK['drift'][0], StackResourceDriftStatus='IN_SYNC')
+        ])
+        unchanged_recheck = dict(DRIFTED_STACK, RecheckedResources=['Queue'], drift=DRIFTED_STACK['drift'][1:])
+
+        self.assertEqual(self.select_and_save([unchanged_recheck], [])[0], [])
+        self.assertEqual(self.select_and_save([rechecked_stack], [])[0], [rechecked_stack])
+        self.assertEqual(
+            list(json.loads(self.drift_store.get_records(['drifted_stack_id'])['drifted_stack_id']['DriftedResources'])),
+            ['Queue']
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,10 @@ import sys
 
 sys.path.insert(0, './drift_detector')
 
+import json
+
 from drift_detector.discover_stacks import send_stacks_to_sqs
+from drift_detector.utils import chunks
 from unittest.mock import MagicMock
 
 
@@ -21,7 +24,7 @@ mock_sqs_client = MockSQSClient()
 mock_cf_client = MockCFClient()
 mock_paginator = MockPaginator()
 
-stacks_in_batches = [
+stacks = [
   {
     'StackName': 'aws-sam-cli-managed-default',
     'StackStatus': 'CREATE_COMPLETE',
@@ -82,7 +85,7 @@ class TestSendStacks(unittest.TestCase):
           }
         ])
         mock_cf_client.get_paginator = MagicMock(return_value=mock_paginator)
-        mock_sqs_client.send_message = MagicMock()
+        mock_sqs_client.send_message_batch = MagicMock(return_value={'Successful': [], 'Failed': []})
 
     def test_send_stacks(self):
         """
@@ -90,9 +93,90 @@ class TestSendStacks(unittest.TestCase):
         """
         sqs_url = 'www.sqs-test.com'
 
-        send_stacks_to_sqs(stacks_in_batches, mock_sqs_client, sqs_url)
+        send_stacks_to_sqs(chunks(stacks, 2), mock_sqs_client, sqs_url)
+
+        self.assertTrue(mock_sqs_client.send_message_batch.called)
+
+    def test_send_stacks_in_one_batch_request(self):
+        """
+        Test that up to ten messages are sent with a single request
+        """
+        sqs_url = 'www.sqs-test.com'
+
+        send_stacks_to_sqs(chunks(stacks, 1), mock_sqs_client, sqs_url)
+
+        mock_sqs_client.send_message_batch.assert_called_once()
+        entries = mock_sqs_client.send_message_batch.call_args[1]['Entries']
+        self.assertEqual(len(entries), 6)
+        self.assertEqual(len(set(entry['Id'] for entry in entries)), 6)
+
+    def test_send_stacks_splits_requests_into_ten_entries(self):
+        """
+        Test that batches with more than ten messages are split into multiple requests
+        """
+        sqs_url = 'www.sqs-test.com'
+        many_stacks = [{'StackName': f'stack_{i}', 'StackId': f'stack_id_{i}'} for i in range(25)]
+
+        send_stacks_to_sqs(chunks(many_stacks, 1), mock_sqs_client, sqs_url)
+
+        self.assertEqual(
+            [len(call[1]['Entries']) for call in mock_sqs_client.send_message_batch.call_args_list],
+            [10, 10, 5]
+        )
+
+    def test_send_stacks_with_compact_payload(self):
+        """
+        Test that only fields needed by the detector are sent without pretty printing
+        """
+        sqs_url = 'www.sqs-test.com'
+        stack = {
+            'StackName': 'stack_name',
+            'StackId': 'stack_id',
+            'StackStatus': 'CREATE_COMPLETE',
+            'Outputs': [{'OutputKey': 'key', 'OutputValue': 'value'}],
+            'Tags': [{'Key': 'key', 'Value': 'value'}]
+        }
+
+        send_stacks_to_sqs([[stack]], mock_sqs_client, sqs_url)
+
+        message_body = mock_sqs_client.send_message_batch.call_args[1]['Entries'][0]['MessageBody']
+        self.assertEqual(message_body, '[{"StackName":"stack_name","StackId":"stack_id"}]')
+
+    def test_send_stacks_splits_oversized_batch(self):
+        """
+        Test that batch exceeding the SQS message size limit is split
+        """
+        sqs_url = 'www.sqs-test.com'
+        big_stacks = [{'StackName': f'stack_{i}', 'StackId': 'x' * 100 * 1024} for i in range(4)]
+
+        send_stacks_to_sqs([big_stacks], mock_sqs_client, sqs_url)
+
+        message_bodies = [
+            entry['MessageBody']
+            for call in mock_sqs_client.send_message_batch.call_args_list
+            for entry in call[1]['Entries']
+        ]
+        self.assertEqual(len(message_bodies), 2)
+        self.assertEqual(mock_sqs_client.send_message_batch.call_count, 2)
+        self.assertEqual(
+            [stack['StackName'] for body in message_bodies for stack in json.loads(body)],
+            [stack['StackName'] for stack in big_stacks]
+        )
+        for call in mock_sqs_client.send_message_batch.call_args_list:
+            self.assertLessEqual(sum(len(entry['MessageBody']) for entry in call[1]['Entries']), 256 * 1024)
+
+    def test_send_stacks_raises_on_failed_entries(self):
+        """
+        Test that failed batch entries are not silently dropped
+        """
+        sqs_url = 'www.sqs-test.com'
+        mock_sqs_client.send_message_batch = MagicMock(return_value={
+            'Successful': [],
+            'Failed': [{'Id': '0', 'SenderFault': False, 'Code': 'InternalError'}]
+        })
 
-        self.assertTrue(mock_sqs_client.send_message.called)
+        with self.assertRaises(Exception):
+            send_stacks_to_sqs(chunks(stacks, 2), mock_sqs_client, sqs_url)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,89 @@
+import unittest
+import json
+import os
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.sharding import batched_by_shard, get_message_group_id, MESSAGE_GROUP_ID
+from drift_detector.drift_detector import send_continuation_message
+from unittest.mock import MagicMock
+
+
+def make_stacks(count, region='eu-west-1'):
+    return [{'StackName': f'stack_name_{i}', 'StackId': f'stack_id_{i}', 'Region': region} for i in range(count)]
+
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        os.environ['DETECTOR_SHARDS'] = '4'
+        self.addCleanup(os.environ.pop, 'DETECTOR_SHARDS')
+
+    def test_single_shard_uses_default_group(self):
+        """
+        Test that one shard keeps every message in the default group
+        """
+        os.environ['DETECTOR_SHARDS'] = '1'
+
+        self.assertEqual({get_message_group_id(stack) for stack in make_stacks(10)}, {MESSAGE_GROUP_ID})
+
+    def test_missing_shard_key_falls_back_to_stack_id(self):
+        """
+        Test that stacks without the selected field are still spread over every group
+        """
+        os.environ['SHARD_BY'] = 'account'
+        self.addCleanup(os.environ.pop, 'SHARD_BY')
+
+        message_group_ids = {get_message_group_id(stack) for stack in make_stacks(100)}
+
+        self.assertEqual(message_group_ids, {f'{MESSAGE_GROUP_ID}_{shard}' for shard in range(4)})
+
+    def test_stacks_are_spread_over_stable_groups(self):
+        """
+        Test that stacks map to a fixed group out of the configured number
+        """
+        stacks = make_stacks(100)
+
+        message_group_ids = [get_message_group_id(stack) for stack in stacks]
+
+        self.assertEqual(message_group_ids, [get_message_group_id(stack) for stack in stacks])
+        self.assertEqual(set(message_group_ids), {f'{MESSAGE_GROUP_ID}_{shard}' for shard in range(4)})
+
+    def test_shard_by_region(self):
+        """
+        Test that all stacks of a region share a group when sharding by region
+        """
+        os.environ['SHARD_BY'] = 'region'
+        self.addCleanup(os.environ.pop, 'SHARD_BY')
+
+        self.assertEqual(len({get_message_group_id(stack) for stack in make_stacks(20)}), 1)
+
+    def test_batches_never_mix_shards(self):
+        """
+        Test that every batch holds stacks of one shard and no batch is too big
+        """
+        stacks = make_stacks(50)
+
+        batches = list(batched_by_shard(stacks, 5))
+
+        for batch in batches:
+            self.assertEqual(len({get_message_group_id(stack) for stack in batch}), 1)
+            self.assertLessEqual(len(batch), 5)
+        self.assertEqual(sorted(s['StackId'] for batch in batches for s in batch), sorted(s['StackId'] for s in stacks))
+
+    def test_continuation_stays_in_its_shard(self):
+        """
+        Test that a continuation is queued in the group of the batch it continues
+        """
+        stacks = make_stacks(3)
+        mock_sqs_client = MagicMock()
+
+        send_continuation_message(mock_sqs_client, 'www.sqs-test.com', {'stacks': stacks})
+
+        send_message_kwargs = mock_sqs_client.send_message.call_args.kwargs
+        self.assertEqual(send_message_kwargs['MessageGroupId'], get_message_group_id(stacks[0]))
+        self.assertEqual(json.loads(send_message_kwargs['MessageBody']), {'checkpoint': {'stacks': stacks}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.slack_notification import build_digest_messages, build_slack_message
+from drift_detector.slack_notification import MAX_RESOURCE_BLOCKS_PER_STACK, SLACK_MAX_BLOCKS
+
+
+def build_mock_stack(stack_no, no_of_drifted_resources):
+    return {
+        'StackId': f'mock_stack_id_{stack_no}',
+        'StackName': f'mock_stack_name_{stack_no}',
+        'drift': [{
+            'PhysicalResourceId': f'mock_physical_resource_id_{i}',
+            'ResourceType': 'AWS::S3::Bucket',
+            'StackResourceDriftStatus': 'MODIFIED'
+        } for i in range(no_of_drifted_resources)],
+        'no_of_drifted_resources': no_of_drifted_resources,
+        'no_of_resources': no_of_drifted_resources
+    }
+
+
+class TestSlackDigest(unittest.TestCase):
+    def tearDown(self):
+        # Reset 'SHOW_IN_SYNC' back to default, after each test.
+        os.environ['SHOW_IN_SYNC'] = 'false'
+
+    def test_digest_packs_many_stacks_into_one_message(self):
+        """
+        Test that stacks are packed together into a single message
+        """
+        stacks = [build_mock_stack(i, 0) for i in range(30)]
+        detection_failed_stacks = [{'StackId': 'failed_stack_id', 'StackName': 'failed_stack_name'}]
+
+        messages = build_digest_messages(stacks, detection_failed_stacks)
+
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(len(messages[0]['blocks']), 31)
+        self.assertIn('Detection failed', messages[0]['blocks'][0]['text']['text'])
+
+    def test_digest_splits_at_block_limit_without_splitting_stacks(self):
+        """
+        Test that messages never exceed block limit and stacks are not split
+        """
+        stacks = [build_mock_stack(i, 10) for i in range(10)]
+
+        messages = build_digest_messages(stacks, [])
+
+        self.assertEqual(len(messages), 4)
+        for message in messages:
+            self.assertLessEqual(len(message['blocks']), SLACK_MAX_BLOCKS)
+            self.assertEqual(len(message['blocks']) % 13, 0)
+
+    def test_digest_is_deterministic(self):
+        """
+        Test that the same input is always split into the same messages
+        """
+        stacks = [build_mock_stack(i, i) for i in range(40)]
+
+        self.assertEqual(
+            json.dumps(build_digest_messages(stacks, [])),
+            json.dumps(build_digest_messages(stacks, []))
+        )
+
+    def test_long_resource_list_is_summarized(self):
+        """
+        Test that stack with many drifted resources is summarized
+        """
+        stack = build_mock_stack(0, 100)
+
+        blocks = build_slack_message(stack)['blocks']
+
+        self.assertLessEqual(len(blocks), SLACK_MAX_BLOCKS)
+        self.assertEqual(len(blocks), MAX_RESOURCE_BLOCKS_PER_STACK + 4)
+        self.assertEqual(
+            blocks[-2]['elements'][0]['text'],
+            f'_...and {100 - MAX_RESOURCE_BLOCKS_PER_STACK} more resources_'
+        )
+
+
+    def test_digest_reports_nested_stacks_under_their_root(self):
+        """
+        Test that nested stacks follow their root and are labeled with its name
+        """
+        root_stack_id = 'arn:aws:cloudformation:eu-west-1:123456789012:stack/app/uuid'
+        root_stack = dict(build_mock_stack(0, 1), StackId=root_stack_id, StackName='app')
+        nested_stack = dict(build_mock_stack(1, 1), StackName='app-db', ParentId=root_stack_id, RootId=root_stack_id)
+        other_stack = build_mock_stack(2, 1)
+
+        messages = build_digest_messages([nested_stack, other_stack, root_stack], [])
+
+        headers = [block['text']['text'] for block in messages[0]['blocks']
+                   if block.get('text', {}).get('text', '').startswith(':warning:')]
+        self.assertEqual([header.split('|')[1].split('>')[0] for header in headers],
+                         ['app', 'app / app-db', 'mock_stack_name_2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -146,6 +146,40 @@ class TestSlackMessageBuild(unittest.TestCase):
             ]
         })
 
+    def test_no_drift_message_generation_with_account(self):
+        """
+        Test that slack message includes account of stacks scanned through an assumed role
+        """
+        no_drift_mock_stack = MOCK_STACK.copy()
+        no_drift_mock_stack['no_of_drifted_resources'] = 0
+        no_drift_mock_stack['AccountId'] = '111111111111'
+
+        mock_message = build_slack_message(no_drift_mock_stack)
+
+        self.assertEqual(
+            mock_message['blocks'][0]['text']['text'],
+            ":heavy_check_mark: No drift detected at *<https://console.aws.amazon.com/cloudformation/home#/stacks/drifts?stackId=mock_stack_id|mock_stack_name (111111111111)>*"
+        )
+
+
+    def test_recheck_message_generation(self):
+        """
+        Test that re-checked stack with no drift left in the re-checked resources is not reported as in sync
+        """
+        rechecked_stack = dict(MOCK_STACK, drift=MOCK_STACK['drift'][:1], no_of_drifted_resources=0, no_of_resources=1,
+                               RecheckedResources=['Bucket'], no_of_stack_drifted_resources=2)
+
+        mock_message = build_slack_message(rechecked_stack)
+
+        self.assertEqual(mock_message, {'blocks': [{
+            'type': 'section',
+            'text': {
+                'type': 'mrkdwn',
+                'text': ':arrows_counterclockwise: Re-checked 1 resources at *<https://console.aws.amazon.com/'
+                        'cloudformation/home#/stacks/drifts?stackId=mock_stack_id|mock_stack_name>*, 2 still drifted'
+            }
+        }]})
+
 
 if __name__ == '__main__':
     unittest.main()
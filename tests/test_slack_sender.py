@@ -0,0 +1,108 @@
+import unittest
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+import requests
+from drift_detector.slack_sender import SlackWebhookSender, MAX_ATTEMPTS
+from tests.fake_clock import FakeClock
+from unittest.mock import MagicMock
+
+
+def mock_response(status_code, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.ok = status_code < 400
+    response.headers = headers or {}
+    response.text = 'ok' if response.ok else 'error'
+    return response
+
+
+class TestSlackWebhookSender(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.clock.install(self)
+
+        self.mock_session = MagicMock()
+        self.mock_session.headers = {}
+        self.sender = SlackWebhookSender('https://hooks.slack.test/webhook', self.mock_session)
+
+    def test_send_delivers_message_with_timeouts(self):
+        """
+        Test that message is posted through the pooled session with timeouts
+        """
+        self.mock_session.post = MagicMock(return_value=mock_response(200))
+
+        result = self.sender.send({'blocks': []})
+
+        self.assertTrue(result.delivered)
+        self.assertEqual(result.attempts, 1)
+        self.assertIsNotNone(self.mock_session.post.call_args[1]['timeout'])
+
+    def test_send_waits_for_retry_after_on_429(self):
+        """
+        Test that rate limited message is sent again after Retry-After
+        """
+        self.mock_session.post = MagicMock(side_effect=[
+            mock_response(429, {'Retry-After': '30'}),
+            mock_response(200)
+        ])
+
+        result = self.sender.send({'blocks': []})
+
+        self.assertTrue(result.delivered)
+        self.assertEqual(result.attempts, 2)
+        self.assertGreaterEqual(self.clock.now, 30)
+
+    def test_send_retries_server_errors_and_timeouts(self):
+        """
+        Test that transient failures are retried
+        """
+        self.mock_session.post = MagicMock(side_effect=[
+            mock_response(500),
+            requests.Timeout('read timeout'),
+            mock_response(200)
+        ])
+
+        result = self.sender.send({'blocks': []})
+
+        self.assertTrue(result.delivered)
+        self.assertEqual(result.attempts, 3)
+
+    def test_send_does_not_retry_client_errors(self):
+        """
+        Test that invalid messages are not retried
+        """
+        self.mock_session.post = MagicMock(return_value=mock_response(400))
+
+        result = self.sender.send({'blocks': []})
+
+        self.assertFalse(result.delivered)
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(self.mock_session.post.call_count, 1)
+
+    def test_send_gives_up_after_max_attempts(self):
+        """
+        Test that message is reported as not delivered after max attempts
+        """
+        self.mock_session.post = MagicMock(return_value=mock_response(503))
+
+        result = self.sender.send({'blocks': []})
+
+        self.assertFalse(result.delivered)
+        self.assertEqual(self.mock_session.post.call_count, MAX_ATTEMPTS)
+
+    def test_send_all_respects_rate_limit(self):
+        """
+        Test that messages above the burst are spread to one per second
+        """
+        self.mock_session.post = MagicMock(return_value=mock_response(200))
+
+        results = self.sender.send_all([{'blocks': []}] * 6)
+
+        self.assertTrue(all(result.delivered for result in results))
+        self.assertAlmostEqual(self.clock.now, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
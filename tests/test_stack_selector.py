@@ -0,0 +1,77 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, './drift_detector')
+
+from drift_detector.stack_selector import StackSelector, get_stack_selector
+
+
+def make_stack(name, status='CREATE_COMPLETE', tags=None):
+    return {
+        'StackName': name,
+        'StackStatus': status,
+        'Tags': [{'Key': key, 'Value': value} for key, value in (tags or {}).items()]
+    }
+
+
+class TestStackSelector(unittest.TestCase):
+    def tearDown(self):
+        for name in ('STACK_INCLUDE', 'STACK_EXCLUDE', 'STACK_STATUSES'):
+            os.environ.pop(name, None)
+
+    def test_include_by_name_and_tag(self):
+        """
+        Test that stacks matching any include rule are selected
+        """
+        selector = StackSelector(include='prod-*,tag:team=payments')
+
+        self.assertTrue(selector.matches(make_stack('prod-api')))
+        self.assertTrue(selector.matches(make_stack('dev-api', tags={'team': 'payments'})))
+        self.assertFalse(selector.matches(make_stack('dev-api', tags={'team': 'search'})))
+
+    def test_exclude_wins_over_include(self):
+        """
+        Test that stacks matching an exclude rule are never selected
+        """
+        selector = StackSelector(include='prod-*', exclude='*-sandbox,tag:drift-check=off')
+
+        self.assertFalse(selector.matches(make_stack('prod-sandbox')))
+        self.assertFalse(selector.matches(make_stack('prod-api', tags={'drift-check': 'off'})))
+        self.assertTrue(selector.matches(make_stack('prod-api', tags={'drift-check': 'on'})))
+
+    def test_tag_key_without_value(self):
+        """
+        Test that a tag rule without a value matches any value
+        """
+        selector = StackSelector(exclude='tag:temporary')
+
+        self.assertFalse(selector.matches(make_stack('stack', tags={'temporary': 'yes'})))
+        self.assertTrue(selector.matches(make_stack('stack')))
+
+    def test_statuses_and_regex(self):
+        """
+        Test that the status list and STACK_REGEX still apply
+        """
+        selector = StackSelector(stack_regex='app', statuses=('IMPORT_COMPLETE',))
+
+        self.assertTrue(selector.matches(make_stack('app', 'IMPORT_COMPLETE')))
+        self.assertFalse(selector.matches(make_stack('app', 'CREATE_COMPLETE')))
+        self.assertFalse(selector.matches(make_stack('other', 'IMPORT_COMPLETE')))
+
+    def test_selector_is_cached_per_configuration(self):
+        """
+        Test that the selector is compiled again only when its configuration changes
+        """
+        os.environ['STACK_EXCLUDE'] = 'tag:temporary'
+        selector = get_stack_selector()
+
+        self.assertIs(get_stack_selector(), selector)
+
+        os.environ['STACK_STATUSES'] = 'CREATE_COMPLETE'
+        self.assertIsNot(get_stack_selector(), selector)
+        self.assertEqual(get_stack_selector().statuses, {'CREATE_COMPLETE'})
+
+
+if __name__ == '__main__':
+    unittest.main()